@@ -2,23 +2,395 @@
 """
 公交车线路规划系统 - Web API服务
 可以通过HTTP接口调用路径规划功能
+
+设置 API_ASYNC=true 启用异步模式：路线规划、等时圈等搜索请求提交到进程池执行，
+请求线程只在截止时间内等待结果，站点、线路目录等轻量接口不会排在规划任务之后
 """
+import os
 import sys
 sys.path.append('/home/user/weiruan-bus')
 
-from flask import Flask, request, jsonify
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from time import monotonic, perf_counter
+import base64
+import gzip
+import hashlib
+import json
+import multiprocessing
+from flask import Flask, Response, request, jsonify
 from src.data.shenzhen_nanshan import load_nanshan_data
-from src.planner import PathFinder
+from src.data.gtfs import load_gtfs
+from src.data.snapshot import save_snapshot, load_snapshot, load_transfer_patterns
+from src.planner import PathFinder, PlanCache, PlannerMetrics, SearchBudget
 
 app = Flask(__name__)
 
+# 同步模式下出行矩阵计算使用的进程数（异步模式下矩阵作为一个规划任务在规划进程中计算）
+MATRIX_WORKERS = int(os.getenv('API_MATRIX_WORKERS', 1))
+
+# 异步模式：规划进程数和单个请求的截止时间（秒）
+ASYNC_MODE = os.getenv('API_ASYNC', 'False').lower() == 'true'
+PLANNER_WORKERS = int(os.getenv('API_PLANNER_WORKERS', os.cpu_count() or 1))
+REQUEST_TIMEOUT = float(os.getenv('API_REQUEST_TIMEOUT', 10))
+
+# 单次路线搜索（bfs/dijkstra/bidirectional）的预算：最多出队标签数和队列最大长度，0表示不限
+SEARCH_MAX_SETTLED = int(os.getenv('API_SEARCH_MAX_SETTLED', 0)) or None
+SEARCH_MAX_QUEUE = int(os.getenv('API_SEARCH_MAX_QUEUE', 0)) or None
+# 搜索预算的截止时间提前的比例：请求时间预算中预留这一部分用于构建方案、序列化和从规划进程传回结果，
+# 预算耗尽时找到的方案才能在请求截止前返回
+SEARCH_DEADLINE_MARGIN = float(os.getenv('API_SEARCH_DEADLINE_MARGIN', 0.2))
+
 # 加载数据
 print("正在加载公交数据...")
-graph = load_nanshan_data()
-pathfinder = PathFinder(graph)
+# 步行换乘应在生成快照时计算（python -m src.data.snapshot ... --footpaths），启动时随快照加载；
+# 未使用快照时可设置 API_FOOTPATH_DISTANCE 为最大步行距离（米）在启动时生成，默认0表示不生成
+FOOTPATH_DISTANCE = float(os.getenv('API_FOOTPATH_DISTANCE', 0))
+
+# 规划指标：各阶段耗时、标签入队/出队次数、方案大小，由 /metrics 输出
+metrics = PlannerMetrics()
+
+# 设置 API_SNAPSHOT_PATH 且快照已存在时直接mmap加载（快照中已包含步行边和离线预计算的换乘模式）；
+# 否则设置 API_GTFS_PATH 时从GTFS feed导入，再否则使用内置的南山区数据，并按需写出快照
+snapshot_path = os.getenv('API_SNAPSHOT_PATH')
+loaded_snapshot = bool(snapshot_path and os.path.exists(snapshot_path))
+if loaded_snapshot:
+    graph = load_snapshot(snapshot_path)
+else:
+    gtfs_path = os.getenv('API_GTFS_PATH')
+    graph = load_gtfs(gtfs_path) if gtfs_path else load_nanshan_data()
+    if FOOTPATH_DISTANCE > 0:
+        print(f"生成步行换乘：{graph.generate_footpaths(FOOTPATH_DISTANCE)}条")
+
+pathfinder = PathFinder(graph, PlanCache(
+    max_size=int(os.getenv('API_PLAN_CACHE_SIZE', 4096)),
+    bucket_minutes=int(os.getenv('API_PLAN_CACHE_BUCKET', 5))
+), metrics)
+
+# 换乘模式（algorithm=patterns）应离线预计算并写入快照（python -m src.data.snapshot ... --transfer-patterns），
+# 启动时直接加载；API_TRANSFER_PATTERNS=true 时在启动过程中预计算（每个起点都要做全天的RAPTOR，只适合小网络）
+if loaded_snapshot:
+    pathfinder.transfer_patterns = load_transfer_patterns(graph)
+    if pathfinder.transfer_patterns is not None:
+        print(f"已加载换乘模式：{len(pathfinder.transfer_patterns)}个模式节点")
+elif os.getenv('API_TRANSFER_PATTERNS', 'False').lower() == 'true':
+    print("正在预计算换乘模式...")
+    patterns = pathfinder.precompute_transfer_patterns()
+    print(f"换乘模式预计算完成：{len(patterns)}个模式节点")
+
+if snapshot_path and not loaded_snapshot:
+    save_snapshot(graph, snapshot_path, pathfinder.transfer_patterns)
+    print(f"快照已保存：{snapshot_path}")
 print(f"数据加载完成：{graph}")
 
 
+def request_timeout(timeout_ms: int = None) -> float:
+    """请求实际生效的时间预算（秒）：timeout_ms不超过REQUEST_TIMEOUT，未指定时为REQUEST_TIMEOUT"""
+    return REQUEST_TIMEOUT if timeout_ms is None else min(timeout_ms / 1000, REQUEST_TIMEOUT)
+
+
+def request_deadline(arrival: float, timeout_ms: int = None) -> float:
+    """
+    计算请求的绝对截止时间（time.monotonic()时钟，规划进程中同样有效）
+
+    Args:
+        arrival: 请求到达时刻（time.monotonic()）
+        timeout_ms: 请求指定的时间预算（毫秒），不超过REQUEST_TIMEOUT
+
+    Returns:
+        截止时刻
+    """
+    return arrival + request_timeout(timeout_ms)
+
+
+def search_deadline(arrival: float, timeout_ms: int = None) -> float:
+    """搜索预算的截止时刻：比请求截止时间提前SEARCH_DEADLINE_MARGIN比例的时间预算"""
+    return arrival + request_timeout(timeout_ms) * (1 - SEARCH_DEADLINE_MARGIN)
+
+
+def timeout_error(timeout: float) -> dict:
+    """请求超时的响应字典（timeout为实际生效的时间预算，秒）"""
+    return {
+        'success': False,
+        'error': f'请求处理超时（超过{timeout:g}秒）'
+    }
+
+
+def run_planner(task, *args, deadline: float = None, timeout: float = None,
+                mimetype: str = 'application/json'):
+    """
+    执行规划任务
+
+    异步模式下提交到规划进程池，最多等到截止时间，超时返回504；
+    否则在当前线程直接执行
+
+    Args:
+        task: 模块级函数，返回 (响应体, 状态码)，出错时响应体为JSON
+        *args: 任务参数（需可pickle）
+        deadline: 请求的绝对截止时间（见request_deadline），None表示从现在起REQUEST_TIMEOUT秒
+        timeout: 截止时间对应的时间预算（秒），用于超时提示，None表示REQUEST_TIMEOUT
+        mimetype: 成功（200）时响应体的类型
+
+    Returns:
+        Flask响应
+    """
+    if planner_pool is None:
+        body, status = task(*args)
+        return Response(body, status, mimetype=mimetype if status == 200 else 'application/json')
+
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT
+    if deadline is None:
+        deadline = monotonic() + timeout
+    future = planner_pool.submit(run_in_worker, task, *args)
+    try:
+        # 排队等待进程的时间也计入截止时间
+        (body, status), worker_metrics = future.result(timeout=max(0.0, deadline - monotonic()))
+    except FutureTimeoutError:
+        # 尚未开始执行的任务直接取消；已在执行的任务结果被丢弃
+        future.cancel()
+        return jsonify(timeout_error(timeout)), 504
+    metrics.merge(worker_metrics)
+    return Response(body, status, mimetype=mimetype if status == 200 else 'application/json')
+
+
+def run_in_worker(task, *args):
+    """在规划进程中执行任务，连同本进程记录的指标增量一起返回，由主进程合并"""
+    return task(*args), metrics.collect()
+
+
+def json_body(payload: dict) -> bytes:
+    """序列化为与jsonify相同的JSON响应体"""
+    return app.json.response(payload).get_data()
+
+
+class CachedResponse:
+    """预先序列化的JSON响应：原始和gzip压缩的响应体各一份，ETag取内容摘要"""
+
+    __slots__ = ('body', 'gzipped', 'etag')
+
+    def __init__(self, payload: dict):
+        # 与jsonify的输出一致
+        self.body = json_body(payload)
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        self.etag = hashlib.md5(self.body).hexdigest()
+
+    def response(self) -> Response:
+        """按请求的Accept-Encoding选择响应体，If-None-Match命中时返回304"""
+        use_gzip = 'gzip' in request.accept_encodings
+        response = Response(self.gzipped if use_gzip else self.body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        # 客户端可以缓存，但每次需用ETag向服务端确认（网络更新后内容会变化）
+        response.headers['Cache-Control'] = 'no-cache'
+        # 弱ETag：原始和压缩两种编码共用同一个ETag
+        response.set_etag(self.etag, weak=True)
+        return response.make_conditional(request)
+
+
+# 目录类接口按网络版本预计算的数据（序列化的响应、分页用的ID顺序等）：(网络版本号, {缓存键: 数据})
+_catalogue = (-1, {})
+
+# 目录分页：各目录可投影的字段
+CATALOGUE_FIELDS = {
+    'stations': ('id', 'name', 'district', 'routes'),
+    'routes': ('id', 'name', 'price', 'station_count', 'first_bus', 'last_bus', 'interval'),
+}
+
+
+def catalogue_cached(key: str, build):
+    """
+    获取按网络版本缓存的目录数据
+
+    只在网络更新后（版本号变化）的第一次请求时重新构建
+
+    Args:
+        key: 缓存键
+        build: 构建数据的函数
+
+    Returns:
+        缓存的数据
+    """
+    global _catalogue
+    version, cache = _catalogue
+    if version != graph.version:
+        version, cache = _catalogue = (graph.version, {})
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = build()
+    return value
+
+
+def catalogue_response(key: str, build) -> Response:
+    """
+    返回目录类接口的预计算响应（响应体只在网络更新后重新构建、序列化和压缩）
+
+    Args:
+        key: 缓存键
+        build: 构建响应字典的函数
+
+    Returns:
+        Flask响应
+    """
+    return catalogue_cached(key, lambda: CachedResponse(build())).response()
+
+
+def is_paged_request() -> bool:
+    """请求是否使用了分页、字段投影或NDJSON输出（否则返回完整的预计算响应）"""
+    return any(name in request.args for name in ('limit', 'cursor', 'fields', 'format'))
+
+
+def encode_cursor(item_id: str) -> str:
+    """游标：本页最后一项的ID（URL安全的base64编码）"""
+    return base64.urlsafe_b64encode(item_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> str:
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f'游标无效: {cursor}')
+
+
+def parse_page_limit(value):
+    """解析分页大小参数，未提供时返回None表示不分页，非正整数时抛出ValueError"""
+    if not value:
+        return None
+    if not value.isdigit() or int(value) < 1:
+        raise ValueError('参数 limit 应为正整数')
+    return int(value)
+
+
+def parse_fields(kind: str, value):
+    """解析字段投影参数（逗号分隔），未知字段时抛出ValueError"""
+    fields = [name for name in (value or '').split(',') if name]
+    unknown = [name for name in fields if name not in CATALOGUE_FIELDS[kind]]
+    if unknown:
+        raise ValueError(f"未知字段: {','.join(unknown)}（可选 {','.join(CATALOGUE_FIELDS[kind])}）")
+    return fields
+
+
+def catalogue_page(kind: str, objects: dict, serialize) -> Response:
+    """
+    按游标分页、字段投影输出目录，format=ndjson 时逐行流式输出
+
+    游标为上一页最后一项的ID，按ID在目录顺序中的位置继续，网络更新后仍然有效
+    （该项被删除时返回400）；只有本页的条目会被序列化
+
+    Args:
+        kind: 目录名称（stations/routes）
+        objects: ID -> 对象
+        serialize: 对象 -> 条目字典
+
+    Returns:
+        Flask响应：JSON为 {success, count, total, next_cursor, <kind>}，
+        NDJSON每行一个条目，下一页游标在响应头 X-Next-Cursor 中
+    """
+    ids = catalogue_cached(f'{kind}:ids', lambda: tuple(objects))
+    positions = catalogue_cached(f'{kind}:positions', lambda: {item_id: i for i, item_id in enumerate(ids)})
+
+    try:
+        limit = parse_page_limit(request.args.get('limit'))
+        fields = parse_fields(kind, request.args.get('fields'))
+        start = 0
+        cursor = request.args.get('cursor')
+        if cursor:
+            last_id = decode_cursor(cursor)
+            if last_id not in positions:
+                raise ValueError(f'游标无效或已过期: {cursor}')
+            start = positions[last_id] + 1
+        output = request.args.get('format', 'json').lower()
+        if output not in ('json', 'ndjson'):
+            raise ValueError('参数 format 必须是 json 或 ndjson')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    end = len(ids) if limit is None else min(len(ids), start + limit)
+    next_cursor = encode_cursor(ids[end - 1]) if end < len(ids) else None
+
+    def items():
+        for i in range(start, end):
+            # 流式输出期间网络可能更新，跳过已删除的条目
+            obj = objects.get(ids[i])
+            if obj is None:
+                continue
+            item = serialize(obj)
+            yield {name: item[name] for name in fields} if fields else item
+
+    if output == 'ndjson':
+        response = Response((json.dumps(item, ensure_ascii=False) + '\n' for item in items()),
+                            mimetype='application/x-ndjson')
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    page = list(items())
+    return jsonify({
+        'success': True,
+        'count': len(page),
+        'total': len(ids),
+        'next_cursor': next_cursor,
+        kind: page
+    })
+
+
+def parse_depart_at(value):
+    """解析出发时间参数（HH:MM），未提供时返回None表示当前时间"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def parse_service_date(value):
+    """解析服务日期参数（YYYY-MM-DD），未提供时返回None表示当天"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_timeout_ms(value):
+    """解析搜索时间预算参数（正整数毫秒），未提供时返回None表示不限"""
+    if not value:
+        return None
+    timeout_ms = int(value)
+    if timeout_ms <= 0:
+        raise ValueError(value)
+    return timeout_ms
+
+
+def serialize_segment(seg):
+    """将行程段转换为字典（步行段的route为None）"""
+    route = seg['route']
+    return {
+        'mode': 'bus' if route is not None else 'walk',
+        'route_id': route.route_id if route is not None else None,
+        'route_name': route.route_name if route is not None else '步行',
+        'from_station': seg['from_station'].name,
+        'to_station': seg['to_station'].name,
+        'travel_time': seg['travel_time'],
+        'waiting_time': seg['waiting_time'],
+        'station_count': seg['station_count'],
+        'price': route.price if route is not None else 0.0
+    }
+
+
+def serialize_plan(plan):
+    """将换乘方案转换为可JSON序列化的字典"""
+    return {
+        'transfer_count': plan.transfer_count,
+        'total_time': plan.total_time,
+        'total_price': plan.total_price,
+        'total_stations': plan.total_stations,
+        'walking_time': plan.walking_time,
+        'segments': [serialize_segment(seg) for seg in plan.segments]
+    }
+
+
 @app.route('/')
 def index():
     """首页"""
@@ -28,64 +400,138 @@ def index():
     <ul>
         <li><a href="/api/stations">/api/stations</a> - 查询所有站点</li>
         <li><a href="/api/routes">/api/routes</a> - 查询所有线路</li>
-        <li>/api/plan?from=站点ID&to=站点ID&algorithm=bfs - 规划路线</li>
-        <li>/api/search?name=站点名称 - 搜索站点</li>
+        <li>/api/stations?limit=50&cursor=游标&fields=id,name&format=ndjson - 分页查询站点（/api/routes同样支持；next_cursor为下一页游标，fields为返回字段，format=ndjson逐行输出，下一页游标在响应头X-Next-Cursor中）</li>
+        <li>/api/plan?from=站点ID&to=站点ID&algorithm=bfs&depart=08:00 - 规划路线（algorithm可选bfs/dijkstra/bidirectional/raptor/csa/pareto/patterns，depart为出发时间，默认当前时间；date为服务日期，默认当天；timeout_ms为bfs/dijkstra/bidirectional的搜索时间预算（毫秒），超出时返回目前找到的最好方案并标记budget_exhausted）</li>
+        <li>/api/search?name=站点名称&type=station - 搜索站点或线路（type可选station/route/all）</li>
+        <li>/api/autocomplete?prefix=前缀&type=all&limit=10 - 名称前缀补全（支持拼音全拼和首字母）</li>
+        <li>/api/nearby?lat=纬度&lon=经度&radius=500&limit=10 - 查询坐标附近的站点（按距离排序）</li>
+        <li>/api/isochrone?from=站点ID&minutes=30&depart=08:00&date=2024-06-01 - 查询时间预算内可到达的站点</li>
+        <li><a href="/metrics">/metrics</a> - 路线规划指标（Prometheus格式：各阶段耗时直方图、标签入队/出队次数、方案大小）</li>
+        <li>/api/matrix?origins=ID1,ID2&destinations=ID3,ID4&depart=08:00&date=2024-06-01 - 多对多出行矩阵（NDJSON逐行输出）</li>
     </ul>
     <h2>示例：</h2>
     <ul>
         <li><a href="/api/plan?from=SZ_NS_013&to=SZ_NS_012&algorithm=bfs">世界之窗到蛇口（BFS）</a></li>
         <li><a href="/api/plan?from=SZ_NS_008&to=SZ_NS_006&algorithm=dijkstra">南山医院到后海（Dijkstra）</a></li>
+        <li><a href="/api/plan?from=SZ_NS_008&to=SZ_NS_006&algorithm=dijkstra&depart=07:45">南山医院到后海（Dijkstra，07:45出发）</a></li>
+        <li><a href="/api/plan?from=SZ_NS_021&to=SZ_NS_018&algorithm=raptor">车公庙到海上世界（RAPTOR）</a></li>
+        <li><a href="/api/plan?from=SZ_NS_001&to=SZ_NS_018&algorithm=pareto">科技园到海上世界（全部Pareto方案）</a></li>
+        <li><a href="/api/stations?limit=10&fields=id,name">前10个站点（只返回ID和名称）</a></li>
         <li><a href="/api/search?name=科技">搜索"科技"</a></li>
+        <li><a href="/api/autocomplete?prefix=海">补全"海"</a></li>
+        <li><a href="/api/nearby?lat=22.5428&lon=113.9493&radius=1000">科技园附近1公里的站点</a></li>
+        <li><a href="/api/isochrone?from=SZ_NS_001&minutes=30">科技园30分钟可达范围</a></li>
     </ul>
     """
 
 
 @app.route('/api/stations')
 def get_stations():
-    """获取所有站点"""
-    stations = []
-    for station in graph.stations.values():
-        stations.append({
-            'id': station.station_id,
-            'name': station.name,
-            'district': station.district,
-            'routes': [graph.get_route(rid).route_name for rid in station.routes]
-        })
+    """获取所有站点（支持 limit/cursor 分页、fields 字段投影和 format=ndjson 流式输出）"""
+    if is_paged_request():
+        route_names = catalogue_cached('route_names', build_route_names)
+        return catalogue_page('stations', graph.stations, lambda station: serialize_station(station, route_names))
+    return catalogue_response('stations', build_stations)
 
-    return jsonify({
+
+def build_route_names():
+    """线路ID -> 线路名称"""
+    return {route_id: route.route_name for route_id, route in graph.routes.items()}
+
+
+def serialize_station(station, route_names):
+    """站点目录条目"""
+    return {
+        'id': station.station_id,
+        'name': station.name,
+        'district': station.district,
+        'routes': [route_names[rid] for rid in station.routes]
+    }
+
+
+def build_stations():
+    """构建站点列表响应"""
+    route_names = catalogue_cached('route_names', build_route_names)
+    stations = [serialize_station(station, route_names) for station in graph.stations.values()]
+
+    return {
         'success': True,
         'count': len(stations),
         'stations': stations
-    })
+    }
 
 
 @app.route('/api/routes')
 def get_routes():
-    """获取所有线路"""
-    routes = []
-    for route in graph.routes.values():
-        schedule = graph.get_schedule(route.route_id)
-        routes.append({
-            'id': route.route_id,
-            'name': route.route_name,
-            'price': route.price,
-            'station_count': len(route.stations),
-            'first_bus': schedule.first_bus.strftime('%H:%M') if schedule else None,
-            'last_bus': schedule.last_bus.strftime('%H:%M') if schedule else None,
-            'interval': schedule.interval if schedule else None
-        })
-
-    return jsonify({
+    """获取所有线路（支持 limit/cursor 分页、fields 字段投影和 format=ndjson 流式输出）"""
+    if is_paged_request():
+        return catalogue_page('routes', graph.routes, serialize_route)
+    return catalogue_response('routes', build_routes)
+
+
+def serialize_route(route):
+    """线路目录条目"""
+    schedule = graph.get_schedule(route.route_id)
+    return {
+        'id': route.route_id,
+        'name': route.route_name,
+        'price': route.price,
+        'station_count': len(route.stations),
+        'first_bus': schedule.first_bus.strftime('%H:%M') if schedule else None,
+        'last_bus': schedule.last_bus.strftime('%H:%M') if schedule else None,
+        'interval': schedule.interval if schedule else None
+    }
+
+
+def build_routes():
+    """构建线路列表响应"""
+    routes = [serialize_route(route) for route in graph.routes.values()]
+
+    return {
         'success': True,
         'count': len(routes),
         'routes': routes
-    })
+    }
+
+
+def serialize_hit(kind: str, item_id: str, match: str) -> dict:
+    """名称索引命中条目 -> JSON"""
+    if kind == 'station':
+        station = graph.get_station(item_id)
+        return {
+            'type': kind,
+            'id': station.station_id,
+            'name': station.name,
+            'district': station.district,
+            'match': match,
+            'routes': [graph.get_route(rid).route_name for rid in station.routes]
+        }
+    route = graph.get_route(item_id)
+    return {
+        'type': kind,
+        'id': route.route_id,
+        'name': route.route_name,
+        'match': match,
+        'station_count': len(route.stations)
+    }
+
+
+def parse_search_type(value: str):
+    """解析搜索类型参数：station/route/all，非法时返回False"""
+    value = (value or 'station').lower()
+    if value == 'all':
+        return None
+    if value in ('station', 'route'):
+        return value
+    return False
 
 
 @app.route('/api/search')
 def search_station():
-    """搜索站点"""
+    """搜索站点或线路（按完全匹配、前缀匹配、子串匹配排序）"""
     name = request.args.get('name', '')
+    kind = parse_search_type(request.args.get('type'))
+    limit = request.args.get('limit', type=int)
 
     if not name:
         return jsonify({
@@ -93,26 +539,71 @@ def search_station():
             'error': '请提供站点名称参数 name'
         }), 400
 
-    stations = graph.find_station_by_name(name)
+    if kind is False:
+        return jsonify({
+            'success': False,
+            'error': '参数 type 必须是 station、route 或 all'
+        }), 400
+
+    hits = [serialize_hit(*hit) for hit in graph.name_index.search(name, kind, limit)]
+    stations = [hit for hit in hits if hit['type'] == 'station']
+    routes = [hit for hit in hits if hit['type'] == 'route']
+
+    result = {
+        'success': True,
+        'count': len(hits),
+        'stations': stations
+    }
+    if kind != 'station':
+        result['routes'] = routes
+    return jsonify(result)
+
+
+@app.route('/api/autocomplete')
+def autocomplete():
+    """名称前缀补全（支持拼音全拼和首字母）"""
+    prefix = request.args.get('prefix', '')
+    kind = parse_search_type(request.args.get('type', 'all'))
+    limit = request.args.get('limit', 10, type=int)
+
+    if not prefix:
+        return jsonify({
+            'success': False,
+            'error': '请提供前缀参数 prefix'
+        }), 400
+
+    if kind is False:
+        return jsonify({
+            'success': False,
+            'error': '参数 type 必须是 station、route 或 all'
+        }), 400
 
+    suggestions = [serialize_hit(*hit) for hit in graph.name_index.autocomplete(prefix, kind, limit)]
     return jsonify({
         'success': True,
-        'count': len(stations),
-        'stations': [
-            {
-                'id': s.station_id,
-                'name': s.name,
-                'district': s.district,
-                'routes': [graph.get_route(rid).route_name for rid in s.routes]
-            }
-            for s in stations
-        ]
+        'count': len(suggestions),
+        'suggestions': suggestions
     })
 
 
+def metric_algorithm(algorithm: str) -> str:
+    """指标中的算法标签（未知算法与规划时一致按bfs记录，避免标签取值无限增长）"""
+    return algorithm if algorithm in PathFinder.ALGORITHMS else 'bfs'
+
+
 @app.route('/api/plan')
 def plan_route():
-    """规划路线"""
+    """规划路线（按算法和状态码记录请求数，见 /metrics）"""
+    response = app.make_response(handle_plan())
+    metrics.count_request(metric_algorithm(request.args.get('algorithm', 'bfs').lower()),
+                          response.status_code)
+    return response
+
+
+def handle_plan():
+    """校验参数并规划路线"""
+    arrival = monotonic()
+    start = perf_counter()
     from_id = request.args.get('from')
     to_id = request.args.get('to')
     algorithm = request.args.get('algorithm', 'bfs').lower()
@@ -139,14 +630,65 @@ def plan_route():
             'error': f'终点站不存在: {to_id}'
         }), 404
 
-    # 规划路径
-    if algorithm == 'dijkstra':
-        plan = pathfinder.find_path_dijkstra(from_id, to_id)
-    else:
-        plan = pathfinder.find_path_bfs(from_id, to_id)
+    try:
+        depart_at = parse_depart_at(request.args.get('depart'))
+        service_date = parse_service_date(request.args.get('date'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '参数格式错误：depart 应为 HH:MM，date 应为 YYYY-MM-DD'
+        }), 400
 
-    if plan and plan.segments:
+    try:
+        timeout_ms = parse_timeout_ms(request.args.get('timeout_ms'))
+    except ValueError:
         return jsonify({
+            'success': False,
+            'error': '参数格式错误：timeout_ms 应为正整数（毫秒）'
+        }), 400
+    # 截止时间从请求到达时起算（包括在进程池中排队的时间）；超过截止时间的结果会被丢弃。
+    # 搜索在更早的时刻停止，为构建、序列化和传回预算耗尽时的方案留出时间
+    deadline = request_deadline(arrival, timeout_ms)
+
+    # 未指定出发时间或日期时只取一次当前时间，整个查询使用同一出发时刻和服务日期
+    now = datetime.now()
+    if depart_at is None:
+        depart_at = now.time().replace(second=0, microsecond=0)
+    if service_date is None:
+        service_date = now.date()
+    metrics.observe_stage('parse', metric_algorithm(algorithm), perf_counter() - start)
+
+    return run_planner(compute_plan, from_id, to_id, algorithm, depart_at, service_date,
+                       search_deadline(arrival, timeout_ms), deadline=deadline, timeout=request_timeout(timeout_ms))
+
+
+def compute_plan(from_id, to_id, algorithm, depart_at, service_date, deadline=None):
+    """规划路线并序列化（站点已校验存在，deadline为搜索预算的绝对截止时间），返回 (JSON响应体, 状态码)"""
+    budget = None
+    if deadline is not None or SEARCH_MAX_SETTLED is not None or SEARCH_MAX_QUEUE is not None:
+        budget = SearchBudget(max_settled=SEARCH_MAX_SETTLED, max_queue=SEARCH_MAX_QUEUE, deadline=deadline)
+    result = pathfinder.plan(from_id, to_id, algorithm, depart_at=depart_at, service_date=service_date,
+                             budget=budget)
+    with metrics.stage('serialize', metric_algorithm(algorithm)):
+        body, status = serialize_plan_response(from_id, to_id, algorithm, depart_at, service_date, result,
+                                               budget)
+        return json_body(body), status
+
+
+def serialize_plan_response(from_id, to_id, algorithm, depart_at, service_date, result, budget=None):
+    """规划结果 -> (响应字典, 状态码)；搜索预算耗尽时附带budget_exhausted，未找到方案返回504"""
+    from_station = graph.get_station(from_id)
+    to_station = graph.get_station(to_id)
+
+    if algorithm == 'pareto':
+        plans = result
+        if not plans:
+            return {
+                'success': False,
+                'error': '未找到可行路线'
+            }, 404
+
+        return {
             'success': True,
             'from': {
                 'id': from_id,
@@ -157,30 +699,207 @@ def plan_route():
                 'name': to_station.name
             },
             'algorithm': algorithm,
-            'transfer_count': plan.transfer_count,
-            'total_time': plan.total_time,
-            'total_price': plan.total_price,
-            'total_stations': plan.total_stations,
-            'segments': [
-                {
-                    'route_id': seg['route'].route_id,
-                    'route_name': seg['route'].route_name,
-                    'from_station': seg['from_station'].name,
-                    'to_station': seg['to_station'].name,
-                    'travel_time': seg['travel_time'],
-                    'waiting_time': seg['waiting_time'],
-                    'station_count': seg['station_count'],
-                    'price': seg['route'].price
-                }
-                for seg in plan.segments
-            ]
-        })
+            'depart_at': depart_at.strftime('%H:%M'),
+            'service_date': service_date.isoformat(),
+            'count': len(plans),
+            'options': [serialize_plan(p) for p in plans]
+        }, 200
+
+    plan = result
+    exhausted = budget is not None and budget.exhausted is not None
+    if plan and plan.segments:
+        return {
+            'success': True,
+            'from': {
+                'id': from_id,
+                'name': from_station.name
+            },
+            'to': {
+                'id': to_id,
+                'name': to_station.name
+            },
+            'algorithm': algorithm,
+            'depart_at': depart_at.strftime('%H:%M'),
+            'service_date': service_date.isoformat(),
+            **serialize_plan(plan),
+            'budget_exhausted': exhausted
+        }, 200
+    elif exhausted:
+        return {
+            'success': False,
+            'error': f'搜索超出预算（{budget.exhausted}），未找到可行路线',
+            'budget_exhausted': True
+        }, 504
     else:
-        return jsonify({
+        return {
             'success': False,
             'error': '未找到可行路线'
+        }, 404
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus格式的规划指标"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/nearby')
+def nearby_stations():
+    """查询坐标附近的站点"""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius = float(request.args.get('radius', 500))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit else None
+    except KeyError:
+        return jsonify({
+            'success': False,
+            'error': '请提供坐标参数 lat 和 lon'
+        }), 400
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '参数格式错误：lat、lon、radius 应为数字，limit 应为整数'
+        }), 400
+
+    found = graph.nearby(lat, lon, radius, limit)
+
+    return jsonify({
+        'success': True,
+        'count': len(found),
+        'stations': [
+            {
+                'id': station.station_id,
+                'name': station.name,
+                'district': station.district,
+                'distance': round(distance, 1),
+                'routes': [graph.get_route(rid).route_name for rid in station.routes]
+            }
+            for station, distance in found
+        ]
+    })
+
+
+@app.route('/api/isochrone')
+def isochrone():
+    """查询时间预算内可到达的站点"""
+    from_id = request.args.get('from')
+
+    if not from_id:
+        return jsonify({
+            'success': False,
+            'error': '请提供起点参数 from'
+        }), 400
+
+    try:
+        minutes = int(request.args.get('minutes', 30))
+        depart_at = parse_depart_at(request.args.get('depart'))
+        service_date = parse_service_date(request.args.get('date'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '参数格式错误：minutes 应为整数，depart 应为 HH:MM，date 应为 YYYY-MM-DD'
+        }), 400
+
+    from_station = graph.get_station(from_id)
+    if not from_station:
+        return jsonify({
+            'success': False,
+            'error': f'起点站不存在: {from_id}'
         }), 404
 
+    return run_planner(compute_isochrone, from_id, minutes, depart_at, service_date)
+
+
+def compute_isochrone(from_id, minutes, depart_at, service_date):
+    """计算等时圈并序列化（起点已校验存在），返回 (JSON响应体, 状态码)"""
+    from_station = graph.get_station(from_id)
+    reachable = pathfinder.reachable_within(from_id, minutes, depart_at, service_date=service_date)
+    stations = sorted(reachable.items(), key=lambda item: item[1]['travel_time'])
+
+    return json_body({
+        'success': True,
+        'from': {
+            'id': from_id,
+            'name': from_station.name
+        },
+        'minutes': minutes,
+        'count': len(stations),
+        'stations': [
+            {
+                'id': station_id,
+                'name': graph.get_station(station_id).name,
+                'arrival_time': info['arrival_time'].strftime('%H:%M'),
+                'travel_time': info['travel_time'],
+                'transfer_count': info['transfer_count']
+            }
+            for station_id, info in stations
+        ]
+    }), 200
+
+
+@app.route('/api/matrix', methods=['GET', 'POST'])
+def travel_matrix():
+    """
+    多对多出行矩阵（NDJSON）
+
+    第一行为表头（起终点列表），之后每个起点一行，包含与终点列表对应的
+    total_time / transfer_count / total_price 数组，不可达为-1
+    """
+    arrival = monotonic()
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        origins = body.get('origins') or []
+        destinations = body.get('destinations') or []
+        depart = body.get('depart')
+        service_date = body.get('date')
+    else:
+        origins = [sid for sid in request.args.get('origins', '').split(',') if sid]
+        destinations = [sid for sid in request.args.get('destinations', '').split(',') if sid]
+        depart = request.args.get('depart')
+        service_date = request.args.get('date')
+
+    if not origins or not destinations:
+        return jsonify({
+            'success': False,
+            'error': '请提供起点和终点列表参数 origins 和 destinations'
+        }), 400
+
+    try:
+        depart_at = parse_depart_at(depart)
+        service_date = parse_service_date(service_date)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': '参数格式错误：depart 应为 HH:MM，date 应为 YYYY-MM-DD'
+        }), 400
+
+    # 与路线规划一样提交到规划进程池并受请求截止时间限制；规划进程中不能再创建进程池，只在同步模式下并行
+    deadline = request_deadline(arrival)
+    workers = MATRIX_WORKERS if planner_pool is None else 1
+    return run_planner(compute_matrix, origins, destinations, depart_at, service_date, workers, deadline,
+                       REQUEST_TIMEOUT, deadline=deadline, timeout=REQUEST_TIMEOUT, mimetype='application/x-ndjson')
+
+
+def compute_matrix(origins, destinations, depart_at, service_date, workers, deadline, timeout=None):
+    """
+    逐行计算出行矩阵并序列化为NDJSON，超过截止时间时放弃并返回504（timeout为截止时间对应的时间预算，秒），
+    返回 (响应体, 状态码)
+    """
+    lines = [json.dumps({'origins': origins, 'destinations': destinations}, ensure_ascii=False)]
+    for origin, times, transfers, fares in pathfinder.iter_matrix(origins, destinations, depart_at,
+                                                                  workers=workers, service_date=service_date):
+        if monotonic() >= deadline:
+            return json_body(timeout_error(REQUEST_TIMEOUT if timeout is None else timeout)), 504
+        lines.append(json.dumps({
+            'origin': origin,
+            'total_time': times.tolist(),
+            'transfer_count': transfers.tolist(),
+            'total_price': fares.tolist()
+        }, ensure_ascii=False))
+    return ('\n'.join(lines) + '\n').encode('utf-8'), 200
+
 
 @app.route('/api/route/<route_id>')
 def get_route_detail(route_id):
@@ -193,7 +912,12 @@ def get_route_detail(route_id):
             'error': f'线路不存在: {route_id}'
         }), 404
 
-    schedule = graph.get_schedule(route_id)
+    return catalogue_response(f'route:{route_id}', lambda: build_route_detail(route))
+
+
+def build_route_detail(route):
+    """构建线路详情响应"""
+    schedule = graph.get_schedule(route.route_id)
 
     stations = []
     for rs in route.stations:
@@ -206,7 +930,7 @@ def get_route_detail(route_id):
                 'arrival_time_offset': rs.arrival_time_offset
             })
 
-    return jsonify({
+    return {
         'success': True,
         'route': {
             'id': route.route_id,
@@ -221,12 +945,20 @@ def get_route_detail(route_id):
             'interval': schedule.interval if schedule else None,
             'stations': stations
         }
-    })
+    }
 
 
-if __name__ == '__main__':
-    import os
+# 规划进程池：以fork方式在模块加载完成后启动，各进程直接继承已加载的网络、换乘模式和
+# 规划任务函数，不需要重新加载或传输；启动时提交一个空任务，让所有进程在开始处理请求前就创建好
+planner_pool = None
+if ASYNC_MODE and PLANNER_WORKERS > 0 and 'fork' in multiprocessing.get_all_start_methods():
+    planner_pool = ProcessPoolExecutor(max_workers=PLANNER_WORKERS,
+                                       mp_context=multiprocessing.get_context('fork'))
+    planner_pool.submit(int).result()
+    print(f"异步模式：{PLANNER_WORKERS}个规划进程，请求截止时间{REQUEST_TIMEOUT:g}秒")
+
 
+if __name__ == '__main__':
     # 从环境变量读取配置，或使用默认值
     host = os.getenv('API_HOST', '0.0.0.0')
     port = int(os.getenv('API_PORT', 5000))
@@ -237,4 +969,7 @@ if __name__ == '__main__':
     print(f"文档: http://{host}:{port}/")
     print(f"\n按 Ctrl+C 停止服务\n")
 
-    app.run(host=host, port=port, debug=debug)
+    # 多线程处理请求：异步模式下规划在进程池中执行，请求线程之间互不阻塞；
+    # 调试模式的自动重载会重新启动进程，异步模式下关闭
+    app.run(host=host, port=port, debug=debug, threaded=True,
+            use_reloader=debug and planner_pool is None)
@@ -5,15 +5,34 @@
 import sys
 sys.path.append('/home/user/weiruan-bus')
 
-from src.data import load_nanshan_data
+from src.data import load_nanshan_data, load_gtfs, load_snapshot, is_snapshot
 from src.cli import BusRouteCLI
 
 
 def main():
     """主函数"""
-    # 加载深圳南山区数据
+    # 用法：python main.py [快照文件|GTFS路径] [--footpaths [最大步行距离]]
+    # 加载数据：命令行指定快照文件时直接加载快照，指定GTFS feed路径时从GTFS导入，
+    # 否则使用深圳南山区数据
+    args = sys.argv[1:]
+    footpath_distance = None
+    if '--footpaths' in args:
+        i = args.index('--footpaths')
+        footpath_distance = 300.0
+        if i + 1 < len(args) and args[i + 1].isdigit():
+            footpath_distance = float(args.pop(i + 1))
+        args.pop(i)
+
     print("正在加载数据...")
-    graph = load_nanshan_data()
+    if args and is_snapshot(args[0]):
+        graph = load_snapshot(args[0])
+    elif args:
+        graph = load_gtfs(args[0], verbose=True)
+    else:
+        graph = load_nanshan_data()
+    # 步行换乘默认不生成（快照中已包含生成快照时计算的步行边），需要时用 --footpaths 开启
+    if footpath_distance is not None and not graph.footpaths:
+        print(f"生成步行换乘：{graph.generate_footpaths(footpath_distance)}条")
     print(f"数据加载完成：{graph}")
 
     # 启动CLI
@@ -65,7 +65,7 @@ class BusRouteCLI:
         Args:
             from_name: 起点站名称
             to_name: 终点站名称
-            algorithm: 算法类型 ("bfs" 或 "dijkstra")
+            algorithm: 算法类型 ("bfs"、"dijkstra"、"raptor" 或 "csa")
         """
         print(f"\n正在查找从 '{from_name}' 到 '{to_name}' 的路线...\n")
 
@@ -91,6 +91,10 @@ class BusRouteCLI:
         # 规划路径
         if algorithm == "dijkstra":
             plan = self.pathfinder.find_path_dijkstra(from_station.station_id, to_station.station_id)
+        elif algorithm == "raptor":
+            plan = self.pathfinder.find_path_raptor(from_station.station_id, to_station.station_id)
+        elif algorithm == "csa":
+            plan = self.pathfinder.find_path_csa(from_station.station_id, to_station.station_id)
         else:
             plan = self.pathfinder.find_path_bfs(from_station.station_id, to_station.station_id)
 
@@ -102,12 +106,9 @@ class BusRouteCLI:
 
     def show_route_info(self, route_name: str):
         """显示线路信息"""
-        # 查找线路
-        route = None
-        for r in self.graph.routes.values():
-            if route_name.upper() in r.route_name.upper():
-                route = r
-                break
+        # 查找线路（取排名最高的匹配）
+        routes = self.graph.find_route_by_name(route_name)
+        route = routes[0] if routes else None
 
         if not route:
             print(f"未找到线路：{route_name}")
@@ -1,3 +1,6 @@
 from .shenzhen_nanshan import load_nanshan_data
+from .gtfs import load_gtfs, GTFSLoader
+from .snapshot import save_snapshot, load_snapshot, load_transfer_patterns, is_snapshot
 
-__all__ = ['load_nanshan_data']
+__all__ = ['load_nanshan_data', 'load_gtfs', 'GTFSLoader',
+           'save_snapshot', 'load_snapshot', 'load_transfer_patterns', 'is_snapshot']
@@ -0,0 +1,393 @@
+"""
+GTFS公交数据导入
+
+逐行读取 stops.txt、routes.txt、trips.txt、stop_times.txt 和 frequencies.txt，
+构建 TransitGraph。stop_times.txt 按班次流式处理，内存中只保留当前班次的站点
+以及按"线路 + 站点序列 + 各站时间偏移"合并后的站序（stop pattern），不会把整个文件读入内存。
+同一站点序列上行驶时间不同的班次（如高峰期）分属不同的站序，各自保留实际的到站时刻。
+
+feed包含 calendar.txt / calendar_dates.txt 时导入服务日历，并按班次的 service_id
+为每条线路生成按日历生效的时刻表版本（同时保留合并全部班次的每天时刻表）。
+"""
+import csv
+import io
+import os
+import time as _time
+import zipfile
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.models import Station, BusRoute, Schedule, ServiceCalendar
+from src.planner import TransitGraph
+
+# 一天的分钟数，超过24:00的GTFS时间在Schedule中截断到当天末尾
+DAY_MINUTES = 24 * 60
+
+
+def _parse_gtfs_time(value: str) -> Optional[int]:
+    """解析GTFS时间（HH:MM:SS，小时可以超过24），返回秒数"""
+    value = value.strip()
+    if not value:
+        return None
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _parse_gtfs_date(value: str) -> date:
+    """解析GTFS日期（YYYYMMDD）"""
+    value = value.strip()
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+class _Departures:
+    """一组班次的发车情况"""
+
+    __slots__ = ('trips', 'periods')
+
+    def __init__(self):
+        self.trips: List[int] = []  # 按时刻表发车的各班次在首站的发车时刻（分钟）
+        self.periods = []           # frequencies.txt 给出的发车时段 [(开始, 结束, 间隔)]
+
+    def add_departure(self, start: int, end: int = None, headway: int = None):
+        """登记一个班次（或一段按固定间隔发车的时段）"""
+        if headway is None:
+            self.trips.append(start)
+        else:
+            self.periods.append((start, start if end is None else end, headway))
+
+    def schedule(self, route_id: str, service_id: str = None) -> Schedule:
+        """
+        生成时刻表：全部按frequencies.txt发车时保留各时段的发车间隔，
+        否则保留每个班次的实际发车时刻（按时段发车的部分展开为班次）
+        """
+        if self.periods and not self.trips:
+            periods = [(min(start, DAY_MINUTES - 1), min(end, DAY_MINUTES - 1), headway)
+                       for start, end, headway in self.periods]
+            return Schedule.from_periods(route_id, periods, service_id)
+        departures = list(self.trips)
+        for start, end, headway in self.periods:
+            departures.extend(range(start, end + 1, headway))
+        return Schedule.from_trips(route_id, departures, service_id)
+
+
+class _Pattern:
+    """同一线路、同一站点序列且各站时间偏移相同的全部班次合并后的站序"""
+
+    __slots__ = ('route_id', 'stops', 'offsets', 'departures', 'services')
+
+    def __init__(self, route_id: str, stops: Tuple[str, ...], offsets: List[int]):
+        self.route_id = route_id
+        self.stops = stops
+        self.offsets = offsets              # 各站相对首站的时间偏移（分钟），各班次相同
+        self.departures = _Departures()     # 全部班次（各班次按首站发车时刻加上各站偏移计算到站时刻）
+        self.services: Dict[str, _Departures] = {}  # service_id -> 该服务的班次
+
+    def add_departure(self, service_id: Optional[str], start: int, end: int = None,
+                      headway: int = None):
+        """登记一个班次（或一段按固定间隔发车的时段）"""
+        self.departures.add_departure(start, end, headway)
+        if service_id is not None:
+            departures = self.services.get(service_id)
+            if departures is None:
+                departures = self.services[service_id] = _Departures()
+            departures.add_departure(start, end, headway)
+
+
+class GTFSLoader:
+    """流式GTFS导入器"""
+
+    def __init__(self, path: str, city: str = "", district: str = "",
+                 default_price: float = 2.0):
+        """
+        初始化导入器
+
+        Args:
+            path: GTFS目录或zip文件路径
+            city: 站点与线路的所属城市
+            district: 站点与线路的所属区县
+            default_price: 线路票价（GTFS票价表较复杂，统一使用默认票价）
+        """
+        self.path = path
+        self.city = city
+        self.district = district
+        self.default_price = default_price
+        self._zip: Optional[zipfile.ZipFile] = None
+
+        # 导入统计：文件名 -> 行数
+        self.rows: Dict[str, int] = {}
+        self.elapsed = 0.0
+
+    def _open(self, name: str) -> Optional[io.TextIOBase]:
+        """打开feed中的文件，不存在时返回None"""
+        if self._zip is not None:
+            if name not in self._zip.namelist():
+                return None
+            return io.TextIOWrapper(self._zip.open(name), encoding='utf-8-sig', newline='')
+
+        file_path = os.path.join(self.path, name)
+        if not os.path.exists(file_path):
+            return None
+        return open(file_path, encoding='utf-8-sig', newline='')
+
+    def _rows(self, name: str, required: bool = True) -> Iterator[Dict[str, str]]:
+        """逐行读取feed文件"""
+        handle = self._open(name)
+        if handle is None:
+            if required:
+                raise FileNotFoundError(f"GTFS文件缺失: {name}")
+            return
+
+        count = 0
+        with handle:
+            for row in csv.DictReader(handle):
+                count += 1
+                yield row
+        self.rows[name] = count
+
+    def load(self) -> TransitGraph:
+        """
+        导入GTFS数据
+
+        Returns:
+            TransitGraph对象
+        """
+        started = _time.perf_counter()
+        if zipfile.is_zipfile(self.path):
+            self._zip = zipfile.ZipFile(self.path)
+
+        try:
+            graph = TransitGraph()
+            self._load_stops(graph)
+            self._load_calendars(graph)
+            route_names = self._load_routes()
+            trip_routes, trip_services = self._load_trips()
+            frequencies = self._load_frequencies()
+            patterns = self._load_stop_times(trip_routes, trip_services, frequencies)
+            self._build_routes(graph, patterns, route_names)
+        finally:
+            if self._zip is not None:
+                self._zip.close()
+                self._zip = None
+
+        self.elapsed = _time.perf_counter() - started
+        return graph
+
+    def _load_stops(self, graph: TransitGraph):
+        """stops.txt -> Station"""
+        for row in self._rows('stops.txt'):
+            # 只导入站台/站点，跳过出入口等（location_type非0）
+            if row.get('location_type', '').strip() not in ('', '0'):
+                continue
+            graph.add_station(Station(
+                row['stop_id'],
+                row.get('stop_name', ''),
+                float(row.get('stop_lat') or 0.0),
+                float(row.get('stop_lon') or 0.0),
+                self.city,
+                self.district
+            ))
+
+    def _load_calendars(self, graph: TransitGraph):
+        """calendar.txt + calendar_dates.txt -> ServiceCalendar"""
+        weekday_columns = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+        for row in self._rows('calendar.txt', required=False):
+            weekdays = sum(1 << i for i, column in enumerate(weekday_columns)
+                           if row.get(column, '0').strip() == '1')
+            graph.add_calendar(ServiceCalendar(
+                row['service_id'],
+                _parse_gtfs_date(row['start_date']),
+                _parse_gtfs_date(row['end_date']),
+                weekdays
+            ))
+
+        # 例外日期：1为加开，2为停运；只在calendar_dates.txt中出现的服务从空日历开始
+        for row in self._rows('calendar_dates.txt', required=False):
+            service_date = _parse_gtfs_date(row['date'])
+            calendar = graph.calendars.get(row['service_id'])
+            if calendar is None:
+                calendar = ServiceCalendar(row['service_id'], service_date)
+                graph.add_calendar(calendar)
+            if row['exception_type'].strip() == '1':
+                calendar.add_date(service_date)
+            else:
+                calendar.remove_date(service_date)
+
+    def _load_routes(self) -> Dict[str, str]:
+        """routes.txt -> {route_id: 线路名称}"""
+        names = {}
+        for row in self._rows('routes.txt'):
+            names[row['route_id']] = row.get('route_short_name') or row.get('route_long_name') or row['route_id']
+        return names
+
+    def _load_trips(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """trips.txt -> ({trip_id: route_id}, {trip_id: service_id})"""
+        # 线路ID、服务ID重复出现，驻留同一个字符串对象以节省内存
+        interned = {}
+        trip_routes = {}
+        trip_services = {}
+        for row in self._rows('trips.txt'):
+            route_id = interned.setdefault(row['route_id'], row['route_id'])
+            trip_routes[row['trip_id']] = route_id
+            service_id = row.get('service_id')
+            if service_id:
+                trip_services[row['trip_id']] = interned.setdefault(service_id, service_id)
+        return trip_routes, trip_services
+
+    def _load_frequencies(self) -> Dict[str, List[Tuple[int, int, int]]]:
+        """frequencies.txt -> {trip_id: [(开始分钟, 结束分钟, 间隔分钟)]}"""
+        frequencies = {}
+        for row in self._rows('frequencies.txt', required=False):
+            frequencies.setdefault(row['trip_id'], []).append((
+                _parse_gtfs_time(row['start_time']) // 60,
+                _parse_gtfs_time(row['end_time']) // 60,
+                max(1, int(row['headway_secs']) // 60)
+            ))
+        return frequencies
+
+    def _load_stop_times(self, trip_routes: Dict[str, str], trip_services: Dict[str, str],
+                         frequencies: Dict[str, List[Tuple[int, int, int]]]) -> Dict[Tuple, _Pattern]:
+        """
+        流式处理stop_times.txt，按班次合并为站序
+
+        要求同一班次的行连续出现（GTFS feed通常按trip_id排序）
+        """
+        patterns: Dict[Tuple, _Pattern] = {}
+        finished = set()
+        current_trip = None
+        current_rows: List[Tuple[int, str, Optional[int]]] = []
+
+        def flush():
+            if current_trip is None:
+                return
+            finished.add(current_trip)
+            route_id = trip_routes.get(current_trip)
+            if route_id is None or len(current_rows) < 2:
+                return
+            self._add_trip(patterns, route_id, trip_services.get(current_trip), current_rows,
+                           frequencies.get(current_trip))
+
+        for row in self._rows('stop_times.txt'):
+            trip_id = row['trip_id']
+            if trip_id != current_trip:
+                flush()
+                if trip_id in finished:
+                    raise ValueError(f"stop_times.txt 需要按 trip_id 分组排列，班次 {trip_id} 不连续")
+                current_trip = trip_id
+                current_rows = []
+
+            seconds = _parse_gtfs_time(row.get('departure_time') or row.get('arrival_time') or '')
+            current_rows.append((int(row['stop_sequence']), row['stop_id'], seconds))
+
+        flush()
+        return patterns
+
+    @staticmethod
+    def _add_trip(patterns: Dict[Tuple, _Pattern], route_id: str, service_id: Optional[str],
+                  rows: List[Tuple[int, str, Optional[int]]],
+                  trip_frequencies: Optional[List[Tuple[int, int, int]]]):
+        """将一个班次并入站序"""
+        rows.sort()
+        times = [seconds for _, _, seconds in rows]
+
+        # 非时刻点站没有时间，按前后时刻点线性插值
+        known = [i for i, seconds in enumerate(times) if seconds is not None]
+        if not known:
+            return
+        for i in range(len(times)):
+            if times[i] is None:
+                before = max((k for k in known if k < i), default=known[0])
+                after = min((k for k in known if k > i), default=known[-1])
+                if before == after:
+                    times[i] = times[before]
+                else:
+                    times[i] = times[before] + (times[after] - times[before]) * (i - before) // (after - before)
+
+        stops = tuple(stop_id for _, stop_id, _ in rows)
+        offsets = tuple((seconds - times[0]) // 60 for seconds in times)
+        # 时间偏移也是键的一部分：行驶时间不同的班次不能共用一组偏移
+        key = (route_id, stops, offsets)
+        pattern = patterns.get(key)
+        if pattern is None:
+            pattern = patterns[key] = _Pattern(route_id, stops, list(offsets))
+
+        if trip_frequencies:
+            for start, end, headway in trip_frequencies:
+                pattern.add_departure(service_id, start, end, headway)
+        else:
+            pattern.add_departure(service_id, times[0] // 60)
+
+    def _build_routes(self, graph: TransitGraph, patterns: Dict[Tuple, _Pattern],
+                      route_names: Dict[str, str]):
+        """站序 -> BusRoute + Schedule（有服务日历时另按service_id生成时刻表版本）"""
+        # 同一GTFS线路有多个站序（上下行、区间车）时，依次编号
+        counts: Dict[str, int] = {}
+        for pattern in patterns.values():
+            counts[pattern.route_id] = counts.get(pattern.route_id, 0) + 1
+
+        seen: Dict[str, int] = {}
+        for pattern in patterns.values():
+            gtfs_route_id = pattern.route_id
+            index = seen.get(gtfs_route_id, 0)
+            seen[gtfs_route_id] = index + 1
+            route_id = gtfs_route_id if counts[gtfs_route_id] == 1 else f"{gtfs_route_id}_{index}"
+
+            route = BusRoute(
+                route_id=route_id,
+                route_name=route_names.get(gtfs_route_id, gtfs_route_id),
+                city=self.city,
+                district=self.district,
+                price=self.default_price,
+                is_loop=False
+            )
+            schedule = pattern.departures.schedule(route_id)
+            route.interval = schedule.interval
+            route.add_stations(pattern.stops, pattern.offsets)
+            route.first_bus_time = schedule.first_bus
+            route.last_bus_time = schedule.last_bus
+            graph.add_route(route, schedule)
+
+            if graph.calendars:
+                for service_id, departures in pattern.services.items():
+                    graph.add_schedule(departures.schedule(route_id, service_id))
+
+    @property
+    def total_rows(self) -> int:
+        return sum(self.rows.values())
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total_rows / self.elapsed if self.elapsed else 0.0
+
+    def get_statistics(self) -> Dict:
+        """获取导入统计信息"""
+        return {
+            'rows': dict(self.rows),
+            'total_rows': self.total_rows,
+            'elapsed': self.elapsed,
+            'rows_per_second': self.rows_per_second
+        }
+
+
+def load_gtfs(path: str, city: str = "", district: str = "",
+              default_price: float = 2.0, verbose: bool = False) -> TransitGraph:
+    """
+    从GTFS feed加载公交数据
+
+    Args:
+        path: GTFS目录或zip文件路径
+        city: 所属城市
+        district: 所属区县
+        default_price: 线路票价
+        verbose: 是否打印导入行数和速度（也可以通过 GTFSLoader.get_statistics() 获取）
+
+    Returns:
+        TransitGraph对象
+    """
+    loader = GTFSLoader(path, city, district, default_price)
+    graph = loader.load()
+    if verbose:
+        print(f"GTFS导入完成：{loader.total_rows}行，用时{loader.elapsed:.2f}秒，"
+              f"{loader.rows_per_second:.0f}行/秒")
+    return graph
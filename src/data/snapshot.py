@@ -0,0 +1,536 @@
+"""
+公交网络二进制快照
+
+将编译后的公交网络（站点、线路、站序、时间偏移、时刻表、步行边、行驶时间曲线、CSA连接数组、名称字符串表、名称索引条目，以及可选的离线预计算换乘模式）写入带版本号的
+二进制文件，服务日历和按日历生效的时刻表版本记录在meta区段中。加载时通过mmap打开，整数/浮点数组直接以memoryview映射给CompiledNetwork，
+由操作系统按需分页读入，不需要重新解析数据源；站点、线路等对象在首次访问时才从快照表中构建。
+
+文件布局：
+    魔数(4字节) | 格式版本(uint32) | 区段数(uint32) | 区段目录 | 各区段数据（8字节对齐）
+    区段目录项：名称(32字节) | 类型码(1字节) | 保留(7字节) | 偏移(uint64) | 长度(uint64)
+"""
+import copy
+import json
+import mmap
+import struct
+from array import array
+from collections.abc import MutableMapping
+from datetime import date
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.models import Station, BusRoute, Schedule, ServiceCalendar, minutes_to_time, time_to_minutes
+from src.planner import TransitGraph, CompiledNetwork, NameIndex
+from src.planner.name_index import STATION, ROUTE
+from src.planner.network import NONE
+from src.planner.transfer_patterns import TransferPatternIndex
+
+MAGIC = b'WRBS'
+FORMAT_VERSION = 8
+
+_HEADER = struct.Struct('<4sII')
+_ENTRY = struct.Struct('<32sc7xQQ')
+
+# 直接映射为CompiledNetwork字段的区段
+_NETWORK_SECTIONS = (
+    'route_stop_start', 'route_stops', 'route_offsets',
+    'station_route_start', 'station_route_routes', 'station_route_positions',
+    'route_first', 'route_last', 'route_interval', 'route_prices',
+    'footpath_start', 'footpath_targets', 'footpath_times',
+    'departure_start', 'departures',
+    'segment_profiles', 'profile_start', 'profile_times', 'profile_durations',
+    'trip_time_start', 'trip_times',
+    'connection_departures', 'connection_arrivals', 'connection_from_stations', 'connection_to_stations',
+    'connection_trips', 'trip_routes', 'route_first_trip', 'route_trip_count',
+)
+
+
+class _StringTable:
+    """字符串表：相同字符串只存一份"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.data = bytearray()
+        self.offsets = array('q', [0])
+
+    def add(self, value: str) -> int:
+        ref = self.index.get(value)
+        if ref is None:
+            ref = len(self.offsets) - 1
+            self.index[value] = ref
+            self.data.extend(value.encode('utf-8'))
+            self.offsets.append(len(self.data))
+        return ref
+
+
+# 懒加载表中尚未构建的值
+_PENDING = object()
+
+
+class _LazyTable(MutableMapping):
+    """
+    按需构建值的映射（快照加载的站点、线路等表）
+
+    键及其顺序在加载时确定，值在首次访问时按快照中的行号构建并保存；
+    之后的增删改与普通字典相同。指定default时，访问不存在的键会插入新值（同defaultdict）
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, int]], build: Callable[[int], object],
+                 default: Callable[[], object] = None):
+        """
+        Args:
+            rows: [(键, 快照中的行号)]，按加载后的迭代顺序排列
+            build: 行号 -> 值
+            default: 不存在的键的默认值工厂（可选）
+        """
+        self._rows: Dict[str, int] = dict(rows)
+        self._data: Dict[str, object] = dict.fromkeys(self._rows, _PENDING)
+        self._build = build
+        self._default = default
+
+    @property
+    def materialized(self) -> int:
+        """已构建的值的个数"""
+        return sum(1 for value in self._data.values() if value is not _PENDING)
+
+    def __getitem__(self, key):
+        value = self._data.get(key, _PENDING)
+        if value is _PENDING:
+            if key in self._data:
+                value = self._data[key] = self._build(self._rows[key])
+            elif self._default is not None:
+                value = self._data[key] = self._default()
+            else:
+                raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        # 与dict.get一致：不存在的键不插入默认值
+        return self[key] if key in self._data else default
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def save_snapshot(graph: TransitGraph, path: str, transfer_patterns: TransferPatternIndex = None):
+    """
+    保存公交网络快照
+
+    Args:
+        graph: 公交网络图
+        path: 快照文件路径
+        transfer_patterns: 按当前网络预计算的换乘模式（可选），写入pattern_*区段
+    """
+    net = graph.compile()
+    if transfer_patterns is not None and (transfer_patterns.network is not net or net.revision
+                                          or transfer_patterns.revision != net.revision):
+        # 模式表按编译网络中的站点、线路编号存储，就地更新过的网络写出时会重新编号
+        raise ValueError("换乘模式不是按当前网络预计算的，请重新编译网络后再预计算")
+    if net.revision:
+        # 就地更新过的网络含已移除线路的空位和不再引用的行驶时间曲线，重新编译得到紧凑的数组
+        net = CompiledNetwork.from_graph(graph)
+    strings = _StringTable()
+
+    # 站点表：编译网络中前len(graph.stations)个站点是登记过的站点
+    station_refs = array('i')
+    name_refs = array('i')
+    city_refs = array('i')
+    district_refs = array('i')
+    latitudes = array('d')
+    longitudes = array('d')
+    for station_id in net.station_ids:
+        station_refs.append(strings.add(station_id))
+        station = graph.get_station(station_id)
+        if station is None:
+            continue
+        name_refs.append(strings.add(station.name))
+        city_refs.append(strings.add(station.city))
+        district_refs.append(strings.add(station.district))
+        latitudes.append(station.latitude)
+        longitudes.append(station.longitude)
+
+    # 线路表
+    route_refs = array('i')
+    route_name_refs = array('i')
+    route_city_refs = array('i')
+    route_district_refs = array('i')
+    route_loops = array('i')
+    route_intervals = array('i')
+    route_sequences = array('i')
+    for route_id in net.route_ids:
+        route = graph.get_route(route_id)
+        route_refs.append(strings.add(route_id))
+        route_name_refs.append(strings.add(route.route_name))
+        route_city_refs.append(strings.add(route.city))
+        route_district_refs.append(strings.add(route.district))
+        route_loops.append(1 if route.is_loop else 0)
+        route_intervals.append(route.interval)
+        route_sequences.extend(route.sequences)
+        if route.is_loop and len(route.station_ids) > 1:
+            route_sequences.append(NONE)  # 环线回到首站的位置
+
+    # 名称索引条目：加载时直接重建索引，不需要构建站点、线路对象或重新生成拼音键
+    name_kinds = array('b')
+    name_id_refs = array('i')
+    name_refs_index = array('i')
+    name_weights = array('i')
+    name_key_start = array('i', [0])
+    name_key_refs = array('i')
+    name_key_sources = array('b')
+    for kind, item_id, name, weight, keys in graph.name_index.entries():
+        name_kinds.append(1 if kind == ROUTE else 0)
+        name_id_refs.append(strings.add(item_id))
+        name_refs_index.append(strings.add(name))
+        name_weights.append(weight)
+        for key, source in keys:
+            name_key_refs.append(strings.add(key))
+            name_key_sources.append(source)
+        name_key_start.append(len(name_key_refs))
+
+    sections = {name: getattr(net, name) for name in _NETWORK_SECTIONS}
+    meta = {}
+    if transfer_patterns is not None:
+        for name, values in transfer_patterns.to_arrays().items():
+            sections['pattern_' + name] = values
+        meta['transfer_patterns'] = {
+            'sample_interval': transfer_patterns.sample_interval,
+            'max_transfers': transfer_patterns.max_transfers,
+            'origins': transfer_patterns.origins,
+        }
+    sections.update({
+        'meta': json.dumps({
+            **meta,
+            'registered_stations': len(graph.stations),
+            # 分时段发车的每天时刻表：route_id -> [[开始, 结束, 间隔]]
+            'schedule_periods': {route_id: schedule.periods for route_id, schedule in graph.schedules.items()
+                                 if schedule.periods and not schedule.trips},
+            # 按实际班次发车的每天时刻表（班次即departures区段中该线路的发车时刻）
+            'schedule_trips': [route_id for route_id, schedule in graph.schedules.items() if schedule.trips],
+            # 服务日历：[service_id, 开始日期, 运营日位集（十六进制）]
+            'calendars': [[c.service_id, c.start_date.isoformat(), format(c.days, 'x')]
+                          for c in graph.calendars.values()],
+            # 按日历生效的时刻表：route_id -> [[service_id, 首班, 末班, 间隔, 分时段, 班次]]
+            'schedule_variants': {
+                route_id: [[v.service_id, time_to_minutes(v.first_bus), time_to_minutes(v.last_bus),
+                            v.interval, v.periods, v.trips] for v in variants]
+                for route_id, variants in graph.schedule_variants.items()
+            },
+        }).encode('utf-8'),
+        'strings': bytes(strings.data),
+        'string_offsets': strings.offsets,
+        'station_refs': station_refs,
+        'name_refs': name_refs,
+        'city_refs': city_refs,
+        'district_refs': district_refs,
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+        'route_refs': route_refs,
+        'route_name_refs': route_name_refs,
+        'route_city_refs': route_city_refs,
+        'route_district_refs': route_district_refs,
+        'route_loops': route_loops,
+        'route_intervals': route_intervals,
+        'route_sequences': route_sequences,
+        'name_kinds': name_kinds,
+        'name_id_refs': name_id_refs,
+        'name_refs_index': name_refs_index,
+        'name_weights': name_weights,
+        'name_key_start': name_key_start,
+        'name_key_refs': name_key_refs,
+        'name_key_sources': name_key_sources,
+    })
+
+    # 计算各区段偏移（8字节对齐）
+    names = list(sections)
+    offset = _HEADER.size + _ENTRY.size * len(names)
+    entries = []
+    payloads = []
+    for name in names:
+        value = sections[name]
+        if isinstance(value, (bytes, bytearray)):
+            typecode, payload = 'B', bytes(value)
+        else:
+            typecode, payload = value.typecode, array(value.typecode, value).tobytes()
+        offset += -offset % 8
+        entries.append(_ENTRY.pack(name.encode('ascii'), typecode.encode('ascii'), offset, len(payload)))
+        payloads.append((offset, payload))
+        offset += len(payload)
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(names)))
+        for entry in entries:
+            f.write(entry)
+        for offset, payload in payloads:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(payload)
+
+
+def is_snapshot(path: str) -> bool:
+    """判断文件是否为公交网络快照"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class Snapshot:
+    """mmap打开的快照文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        magic, version, count = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是公交网络快照文件: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式版本: {version}（当前版本 {FORMAT_VERSION}）")
+
+        self.sections: Dict[str, memoryview] = {}
+        for i in range(count):
+            name, typecode, offset, length = _ENTRY.unpack_from(view, _HEADER.size + i * _ENTRY.size)
+            section = view[offset:offset + length]
+            typecode = typecode.decode('ascii')
+            if typecode != 'B':
+                section = section.cast(typecode)
+            self.sections[name.rstrip(b'\0').decode('ascii')] = section
+
+        self.meta = json.loads(bytes(self.sections['meta']).decode('utf-8'))
+        self._strings = self.sections['strings']
+        self._string_offsets = self.sections['string_offsets']
+
+    def string(self, ref: int) -> str:
+        """按引用读取字符串表中的字符串"""
+        return bytes(self._strings[self._string_offsets[ref]:self._string_offsets[ref + 1]]).decode('utf-8')
+
+    def network(self) -> CompiledNetwork:
+        """以mmap数组为底层存储构建编译网络"""
+        s = self.sections
+        network = CompiledNetwork(
+            [self.string(ref) for ref in s['station_refs']],
+            [self.string(ref) for ref in s['route_refs']],
+            *(s[name] for name in _NETWORK_SECTIONS)
+        )
+        # 网络持有快照引用，保证mmap在使用期间不被关闭
+        network.snapshot = self
+        return network
+
+
+def load_snapshot(path: str) -> TransitGraph:
+    """
+    从快照加载公交网络
+
+    规划算法直接使用mmap映射的编译网络；站点、线路、时刻表、邻接表和步行边在首次访问时
+    才从快照表中构建（见 _LazyTable），名称索引按快照中的条目表重建
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        TransitGraph对象
+    """
+    snapshot = Snapshot(path)
+    network = snapshot.network()
+    # 构建对象时读取快照中的原始数组：线路增删会就地更新（并复制）网络的数组，这份浅拷贝仍指向mmap
+    table = copy.copy(network)
+    s = snapshot.sections
+    graph = TransitGraph()
+    registered = snapshot.meta['registered_stations']
+    station_ids = table.station_ids
+    route_ids = table.route_ids
+
+    def build_station(i: int) -> Station:
+        station = Station(station_ids[i], snapshot.string(s['name_refs'][i]), s['latitudes'][i],
+                          s['longitudes'][i], snapshot.string(s['city_refs'][i]),
+                          snapshot.string(s['district_refs'][i]))
+        for r, _ in table.routes_at(i):
+            if table.route_length(r) > 1:
+                station.add_route(route_ids[r])
+        return station
+
+    # 行驶时间曲线按编号构建，相同曲线的路段共用同一对象
+    profiles: Dict[int, object] = {}
+    schedule_periods = snapshot.meta.get('schedule_periods', {})
+    trip_routes = set(snapshot.meta.get('schedule_trips', ()))
+
+    def build_schedule(r: int) -> Schedule:
+        route_id = route_ids[r]
+        if route_id in trip_routes:
+            return Schedule.from_trips(route_id, list(table.departures[table.departure_start[r]:
+                                                                        table.departure_end[r]]))
+        if route_id in schedule_periods:
+            return Schedule.from_periods(route_id, [tuple(period) for period in schedule_periods[route_id]])
+        return Schedule(route_id, minutes_to_time(table.route_first[r]), minutes_to_time(table.route_last[r]),
+                        table.route_interval[r])
+
+    def build_route(r: int) -> BusRoute:
+        route_id = route_ids[r]
+        is_loop = bool(s['route_loops'][r])
+        route = BusRoute(
+            route_id=route_id,
+            route_name=snapshot.string(s['route_name_refs'][r]),
+            city=snapshot.string(s['route_city_refs'][r]),
+            district=snapshot.string(s['route_district_refs'][r]),
+            price=table.route_prices[r],
+            is_loop=is_loop
+        )
+        route.interval = s['route_intervals'][r]
+
+        # 环线回到首站的位置顺序号为NONE，不属于线路本身的站序
+        start = table.route_stop_start[r]
+        end = table.route_stop_end[r]
+        if is_loop and end - start > 1:
+            end -= 1
+        route.add_stations((station_ids[stop] for stop in table.route_stops[start:end]),
+                           table.route_offsets[start:end], s['route_sequences'][start:end])
+        for pos in range(table.route_length(r) - 1):
+            p = table.segment_profiles[start + pos]
+            if p != NONE:
+                if p not in profiles:
+                    profiles[p] = table.profile(p)
+                route.set_travel_profile(pos, profiles[p])
+
+        # 分时段发车的时刻表不记录首末班车（与 Schedule.from_periods 导入时一致）
+        if table.has_schedule(r) and route_id not in schedule_periods:
+            schedule = graph.schedules.get(route_id)
+            route.first_bus_time = schedule.first_bus
+            route.last_bus_time = schedule.last_bus
+        return route
+
+    def build_edges(i: int) -> list:
+        # 与 TransitGraph.add_route 一致（环线末站回到首站的边也在站序中）
+        edges = []
+        for r, pos in table.routes_at(i):
+            if pos + 1 < table.route_length(r):
+                travel_time = table.offset_at(r, pos + 1) - table.offset_at(r, pos)
+                edges.append((station_ids[table.stop_at(r, pos + 1)], route_ids[r], travel_time))
+        return edges
+
+    def build_station_routes(i: int) -> set:
+        return {route_ids[r] for r, _ in table.routes_at(i) if table.route_length(r) > 1}
+
+    def build_footpaths(i: int) -> list:
+        return [(station_ids[target], minutes) for target, minutes in table.footpaths_at(i)]
+
+    all_stations = [(station_id, i) for i, station_id in enumerate(station_ids)]
+    graph.stations = _LazyTable(all_stations[:registered], build_station)
+    graph.routes = _LazyTable(((route_id, r) for r, route_id in enumerate(route_ids)), build_route)
+    graph.schedules = _LazyTable(((route_id, r) for r, route_id in enumerate(route_ids)
+                                  if table.has_schedule(r)), build_schedule)
+    graph.graph = _LazyTable(all_stations, build_edges, list)
+    graph.station_routes = _LazyTable(all_stations, build_station_routes, set)
+    graph.footpaths = _LazyTable(all_stations[:registered], build_footpaths)
+
+    for service_id, start_date, days in snapshot.meta.get('calendars', []):
+        calendar = ServiceCalendar(service_id, date.fromisoformat(start_date))
+        calendar.days = int(days, 16)
+        graph.add_calendar(calendar)
+
+    for route_id, variants in snapshot.meta.get('schedule_variants', {}).items():
+        for service_id, first, last, interval, periods, trips in variants:
+            graph.add_schedule(Schedule(
+                route_id, minutes_to_time(first), minutes_to_time(last), interval, service_id,
+                [tuple(period) for period in periods] if periods else None, trips
+            ))
+
+    # 直接使用快照中的编译网络和名称索引条目，避免重新编译或构建全部对象
+    graph._compiled = network
+    graph._compiled_version = graph.version
+    graph._name_index = load_name_index(snapshot)
+    graph._name_index_version = graph.version
+    return graph
+
+
+def load_name_index(snapshot: Snapshot) -> NameIndex:
+    """按快照中的名称索引条目表重建名称索引"""
+    s = snapshot.sections
+    string = snapshot.string
+    key_start = s['name_key_start']
+    key_refs = s['name_key_refs']
+    key_sources = s['name_key_sources']
+    index = NameIndex()
+    for entry, kind in enumerate(s['name_kinds']):
+        keys = [(string(key_refs[i]), key_sources[i]) for i in range(key_start[entry], key_start[entry + 1])]
+        index.add(ROUTE if kind else STATION, string(s['name_id_refs'][entry]),
+                  string(s['name_refs_index'][entry]), s['name_weights'][entry], keys)
+    return index.build()
+
+
+def load_transfer_patterns(graph: TransitGraph) -> Optional[TransferPatternIndex]:
+    """
+    读取快照中离线预计算的换乘模式
+
+    Args:
+        graph: load_snapshot 加载的公交网络图
+
+    Returns:
+        换乘模式索引（使用快照中的编译网络），如果网络不是从快照加载的、快照中没有换乘模式
+        或网络已重新编译则返回None
+    """
+    network = graph.compile()
+    snapshot = getattr(network, 'snapshot', None)
+    if snapshot is None or 'transfer_patterns' not in snapshot.meta:
+        return None
+    meta = snapshot.meta['transfer_patterns']
+    arrays = {name[len('pattern_'):]: section for name, section in snapshot.sections.items()
+              if name.startswith('pattern_')}
+    index = TransferPatternIndex.from_arrays(network, arrays, meta['sample_interval'],
+                                             meta['max_transfers'], meta['origins'])
+    # 加载后已就地更新过的网络不再与模式表一致，由调用方按revision判断是否过期
+    index.revision = 0
+    return index
+
+
+if __name__ == '__main__':
+    # 用法：python -m src.data.snapshot 输出文件 [GTFS路径] [--footpaths [最大步行距离]] [--transfer-patterns [采样间隔]]
+    from src.data.shenzhen_nanshan import load_nanshan_data
+    from src.data.gtfs import load_gtfs
+
+    args = sys.argv[1:]
+    footpath_distance = None
+    if '--footpaths' in args:
+        i = args.index('--footpaths')
+        footpath_distance = 300.0
+        if i + 1 < len(args) and args[i + 1].isdigit():
+            footpath_distance = float(args.pop(i + 1))
+        args.pop(i)
+    patterns_interval = None
+    with_patterns = '--transfer-patterns' in args
+    if with_patterns:
+        i = args.index('--transfer-patterns')
+        if i + 1 < len(args) and args[i + 1].isdigit():
+            patterns_interval = int(args.pop(i + 1))
+        args.pop(i)
+
+    if len(args) < 1:
+        print("用法：python -m src.data.snapshot 输出文件 [GTFS路径] [--footpaths [最大步行距离]] "
+              "[--transfer-patterns [采样间隔]]")
+        sys.exit(1)
+
+    source_graph = load_gtfs(args[1], verbose=True) if len(args) > 1 else load_nanshan_data()
+    # 步行边在换乘模式之前生成：换乘模式的预计算包含步行换乘
+    if footpath_distance is not None:
+        print(f"生成步行换乘：{source_graph.generate_footpaths(footpath_distance)}条")
+    patterns = None
+    if with_patterns:
+        print("正在预计算换乘模式...")
+        patterns = TransferPatternIndex(source_graph.compile(), patterns_interval).build()
+        print(f"换乘模式预计算完成：{len(patterns)}个模式节点")
+    save_snapshot(source_graph, args[0], patterns)
+    print(f"快照已保存：{args[0]}（{source_graph}）")
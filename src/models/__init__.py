@@ -1,5 +1,7 @@
 from .station import Station
-from .route import BusRoute, RouteStation
-from .schedule import Schedule
+from .route import BusRoute, RouteStation, RouteStations
+from .schedule import Schedule, HeadwayPeriod, time_to_minutes, minutes_to_time
+from .calendar import ServiceCalendar, EVERY_DAY, WEEKDAYS, WEEKENDS
+from .profile import TravelTimeProfile
 
-__all__ = ['Station', 'BusRoute', 'RouteStation', 'Schedule']
+__all__ = ['Station', 'BusRoute', 'RouteStation', 'RouteStations', 'Schedule', 'HeadwayPeriod', 'time_to_minutes', 'minutes_to_time', 'ServiceCalendar', 'EVERY_DAY', 'WEEKDAYS', 'WEEKENDS', 'TravelTimeProfile']
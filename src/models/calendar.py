@@ -0,0 +1,92 @@
+"""
+服务日历模型
+
+每个服务日历用一个整数位集记录运营日：第i位表示 start_date + i 天是否运营。
+一个季度的日历只占几十个字节，判断某天是否运营只需一次移位。
+"""
+from datetime import date, timedelta
+from typing import Iterator, Optional
+
+# 星期掩码：第i位对应 date.weekday() == i（周一为0）
+EVERY_DAY = 0b1111111
+WEEKDAYS = 0b0011111
+WEEKENDS = 0b1100000
+
+
+class ServiceCalendar:
+    """服务日历类"""
+
+    __slots__ = ('service_id', 'start_date', 'days')
+
+    def __init__(self, service_id: str, start_date: date, end_date: date = None,
+                 weekdays: int = EVERY_DAY):
+        """
+        初始化服务日历
+
+        Args:
+            service_id: 服务ID（时刻表通过它引用日历）
+            start_date: 开始日期
+            end_date: 结束日期（包含），如果为None则日历为空，之后用add_date添加运营日
+            weekdays: 星期掩码，见 EVERY_DAY / WEEKDAYS / WEEKENDS
+        """
+        self.service_id = service_id
+        self.start_date = start_date
+        self.days = 0
+
+        if end_date is not None and end_date >= start_date:
+            first_weekday = start_date.weekday()
+            bits = ''.join('1' if weekdays >> ((first_weekday + i) % 7) & 1 else '0'
+                           for i in range((end_date - start_date).days + 1))
+            self.days = int(bits[::-1], 2)
+
+    @property
+    def end_date(self) -> Optional[date]:
+        """最后一个运营日，日历为空时为None"""
+        if not self.days:
+            return None
+        return self.start_date + timedelta(days=self.days.bit_length() - 1)
+
+    def runs_on(self, service_date: date) -> bool:
+        """
+        判断某天是否运营
+
+        Args:
+            service_date: 日期
+
+        Returns:
+            是否运营
+        """
+        offset = (service_date - self.start_date).days
+        return offset >= 0 and bool(self.days >> offset & 1)
+
+    def add_date(self, service_date: date):
+        """添加运营日（如节假日加开）"""
+        offset = (service_date - self.start_date).days
+        if offset < 0:
+            # 早于开始日期：整体左移，开始日期提前
+            self.days <<= -offset
+            self.start_date = service_date
+            offset = 0
+        self.days |= 1 << offset
+
+    def remove_date(self, service_date: date):
+        """移除运营日（如节假日停运）"""
+        offset = (service_date - self.start_date).days
+        if offset >= 0:
+            self.days &= ~(1 << offset)
+
+    def service_dates(self) -> Iterator[date]:
+        """按日期顺序遍历所有运营日"""
+        days = self.days
+        offset = 0
+        while days:
+            if days & 1:
+                yield self.start_date + timedelta(days=offset)
+            days >>= 1
+            offset += 1
+
+    def __len__(self):
+        return bin(self.days).count('1')
+
+    def __str__(self):
+        return f"ServiceCalendar({self.service_id}, {self.start_date}~{self.end_date}, {len(self)}天)"
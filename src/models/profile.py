@@ -0,0 +1,115 @@
+"""
+行驶时间曲线模型
+
+路段行驶时间随出发时刻变化（如早高峰比平峰慢一倍），用分段线性函数表示：
+若干个 (出发时刻, 行驶时间) 拐点，拐点之间线性插值，第一个拐点之前和最后一个拐点之后取端点值。
+"""
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+
+def interpolate(t0: int, d0: int, t1: int, d1: int, t: int) -> int:
+    """
+    在两个拐点之间线性插值，结果四舍五入到整分钟
+
+    使用 floor(x + 0.5) 取整，保证曲线斜率不小于-1时"出发时刻 + 行驶时间"不随出发时刻减小
+    """
+    span = t1 - t0
+    return d0 + ((d1 - d0) * (t - t0) * 2 + span) // (2 * span)
+
+
+class TravelTimeProfile:
+    """路段行驶时间曲线（分段线性）"""
+
+    __slots__ = ('times', 'durations')
+
+    def __init__(self, breakpoints: Iterable[Tuple[int, int]]):
+        """
+        初始化行驶时间曲线
+
+        Args:
+            breakpoints: [(出发时刻, 行驶时间)]，时刻为当天零点起的分钟数，时间单位为分钟
+
+        Raises:
+            ValueError: 拐点为空、时刻不严格递增、行驶时间小于1分钟，或相邻拐点间曲线斜率小于-1
+                （斜率小于-1意味着晚出发反而早到达，会破坏最早到达搜索的正确性）
+        """
+        points = sorted(breakpoints)
+        if not points:
+            raise ValueError("行驶时间曲线至少需要一个拐点")
+
+        self.times = array('i', (t for t, _ in points))
+        self.durations = array('i', (d for _, d in points))
+
+        for i, (t, d) in enumerate(points):
+            if d < 1:
+                raise ValueError(f"行驶时间至少为1分钟: {points[i]}")
+            if i > 0:
+                t0, d0 = points[i - 1]
+                if t <= t0:
+                    raise ValueError(f"拐点时刻必须严格递增: {t0}, {t}")
+                if d - d0 < -(t - t0):
+                    raise ValueError(f"拐点 {points[i - 1]} → {points[i]} 之间晚出发会早到达")
+
+    @classmethod
+    def peak(cls, base: int, peaks: List[Tuple[int, int, float]], ramp: int = 30) -> 'TravelTimeProfile':
+        """
+        按高峰时段生成曲线
+
+        Args:
+            base: 平峰行驶时间（分钟）
+            peaks: [(高峰开始分钟, 高峰结束分钟, 行驶时间倍数)]，按时间顺序且互不重叠
+            ramp: 进入和离开高峰的过渡时长（分钟）
+
+        Returns:
+            行驶时间曲线
+
+        例如 peak(6, [(450, 570, 2.0)]) 表示7:30-9:30行驶时间为12分钟，
+        7:00-7:30和9:30-10:00线性过渡
+        """
+        points = []
+        for start, end, factor in peaks:
+            peak_duration = max(1, round(base * factor))
+            # 过渡时长至少为行驶时间之差，保证离开高峰时曲线斜率不小于-1
+            ramp_length = max(ramp, peak_duration - base, 1)
+            points.extend([(start - ramp_length, base), (start, peak_duration),
+                           (end, peak_duration), (end + ramp_length, base)])
+        if not points:
+            points = [(0, base)]
+        return cls(points)
+
+    def evaluate(self, minute: int) -> int:
+        """
+        计算在指定时刻出发的行驶时间
+
+        Args:
+            minute: 出发时刻（当天零点起的分钟数）
+
+        Returns:
+            行驶时间（分钟）
+        """
+        times = self.times
+        i = bisect_right(times, minute)
+        if i == 0:
+            return self.durations[0]
+        if i == len(times):
+            return self.durations[-1]
+        return interpolate(times[i - 1], self.durations[i - 1], times[i], self.durations[i], minute)
+
+    @property
+    def key(self) -> Tuple[Tuple[int, int], ...]:
+        """拐点元组（相同曲线的键相同，用于去重共享）"""
+        return tuple(zip(self.times, self.durations))
+
+    def __eq__(self, other):
+        return isinstance(other, TravelTimeProfile) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __str__(self):
+        return f"TravelTimeProfile({len(self)}个拐点, {min(self.durations)}-{max(self.durations)}分钟)"
@@ -1,13 +1,23 @@
 """
 公交线路模型
+
+线路的站序按列存储（站点ID列表 + 顺序号、时间偏移两个整数数组），
+每个站点只占用一个字符串引用和两个整数；route.stations 是按需生成 RouteStation 的只读视图。
+行驶时间随时段变化的路段另外记录行驶时间曲线，其余路段按时间偏移之差计算。
 """
-from typing import List, Optional
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional
 from datetime import time
 
+from .profile import TravelTimeProfile
+
 
 class RouteStation:
     """线路站点关联类（线路上的某一站）"""
 
+    __slots__ = ('station_id', 'sequence', 'arrival_time_offset')
+
     def __init__(self, station_id: str, sequence: int, arrival_time_offset: int = 0):
         """
         初始化线路站点
@@ -22,9 +32,39 @@ class RouteStation:
         self.arrival_time_offset = arrival_time_offset
 
 
+class RouteStations:
+    """线路站序的只读视图，按需生成RouteStation"""
+
+    __slots__ = ('_route',)
+
+    def __init__(self, route: 'BusRoute'):
+        self._route = route
+
+    def __len__(self):
+        return len(self._route.station_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        route = self._route
+        return RouteStation(route.station_ids[index], route.sequences[index], route.offsets[index])
+
+    def __iter__(self):
+        route = self._route
+        for station_id, sequence, offset in zip(route.station_ids, route.sequences, route.offsets):
+            yield RouteStation(station_id, sequence, offset)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
 class BusRoute:
     """公交线路类"""
 
+    __slots__ = ('route_id', 'route_name', 'city', 'district', 'price', 'is_loop',
+                 'station_ids', 'sequences', 'offsets', '_sequence_of', 'profiles',
+                 'first_bus_time', 'last_bus_time', 'interval', 'avg_speed')
+
     def __init__(self, route_id: str, route_name: str, city: str = "",
                  district: str = "", price: float = 2.0, is_loop: bool = False):
         """
@@ -44,12 +84,44 @@ class BusRoute:
         self.district = district
         self.price = price
         self.is_loop = is_loop
-        self.stations: List[RouteStation] = []  # 站点列表（按顺序）
+
+        # 站序（按顺序号排列）
+        self.station_ids: List[str] = []   # 站点ID
+        self.sequences = array('i')        # 站点顺序号
+        self.offsets = array('i')          # 到站时间偏移（分钟）
+        self._sequence_of: Optional[Dict[str, int]] = None  # 站点ID -> 顺序号（按需建立）
+        self.profiles: Optional[Dict[int, TravelTimeProfile]] = None  # 站序位置 -> 到下一站的行驶时间曲线
+
         self.first_bus_time: Optional[time] = None  # 首班车时间
         self.last_bus_time: Optional[time] = None   # 末班车时间
         self.interval: int = 10  # 发车间隔（分钟）
         self.avg_speed: float = 20.0  # 平均速度（km/h）
 
+    @classmethod
+    def from_stops(cls, route_id: str, route_name: str, station_ids: Iterable[str],
+                   offsets: Iterable[int], **kwargs) -> 'BusRoute':
+        """
+        按站序批量构建线路（顺序号依次为0, 1, 2, ...）
+
+        Args:
+            route_id: 线路唯一ID
+            route_name: 线路名称
+            station_ids: 按顺序排列的站点ID
+            offsets: 与station_ids对应的到站时间偏移（分钟）
+            **kwargs: 其他BusRoute参数（city、district、price、is_loop）
+
+        Returns:
+            BusRoute对象
+        """
+        route = cls(route_id, route_name, **kwargs)
+        route.add_stations(station_ids, offsets)
+        return route
+
+    @property
+    def stations(self) -> RouteStations:
+        """站点列表（按顺序，只读视图）"""
+        return RouteStations(self)
+
     def add_station(self, station_id: str, sequence: int = None,
                    arrival_time_offset: int = 0):
         """
@@ -61,44 +133,103 @@ class BusRoute:
             arrival_time_offset: 到达时间偏移
         """
         if sequence is None:
-            sequence = len(self.stations)
+            sequence = len(self.station_ids)
+
+        # 按顺序添加时直接追加；乱序时插入到相同顺序号之后，与稳定排序一致
+        if not self.sequences or sequence >= self.sequences[-1]:
+            self.station_ids.append(station_id)
+            self.sequences.append(sequence)
+            self.offsets.append(arrival_time_offset)
+            if self._sequence_of is not None:
+                self._sequence_of.setdefault(station_id, sequence)
+        else:
+            i = bisect_right(self.sequences, sequence)
+            self.station_ids.insert(i, station_id)
+            self.sequences.insert(i, sequence)
+            self.offsets.insert(i, arrival_time_offset)
+            self._sequence_of = None
+
+    def add_stations(self, station_ids: Iterable[str], offsets: Iterable[int],
+                     sequences: Iterable[int] = None):
+        """
+        批量追加站点
 
-        route_station = RouteStation(station_id, sequence, arrival_time_offset)
-        self.stations.append(route_station)
-        self.stations.sort(key=lambda x: x.sequence)
+        Args:
+            station_ids: 站点ID
+            offsets: 到站时间偏移（分钟）
+            sequences: 顺序号（如果为None，接在已有站点之后依次编号）
+        """
+        station_ids = list(station_ids)
+        if sequences is None:
+            start = self.sequences[-1] + 1 if self.sequences else 0
+            sequences = range(start, start + len(station_ids))
+        for station_id, sequence, offset in zip(station_ids, sequences, offsets):
+            self.add_station(station_id, sequence, offset)
 
     def get_station_ids(self) -> List[str]:
         """获取线路上所有站点ID列表"""
-        return [rs.station_id for rs in self.stations]
+        return list(self.station_ids)
 
-    def get_travel_time(self, from_seq: int, to_seq: int) -> int:
+    def set_travel_profile(self, index: int, profile: Optional[TravelTimeProfile]):
+        """
+        设置路段行驶时间曲线（站点添加完成后设置）
+
+        Args:
+            index: 路段起点在站序中的位置，曲线描述从该站到下一站（环线末站为回到首站）的行驶时间
+            profile: 行驶时间曲线，None表示恢复按时间偏移计算
+        """
+        if profile is None:
+            if self.profiles is not None:
+                self.profiles.pop(index, None)
+                if not self.profiles:
+                    self.profiles = None
+            return
+        if self.profiles is None:
+            self.profiles = {}
+        self.profiles[index] = profile
+
+    def get_travel_profile(self, index: int) -> Optional[TravelTimeProfile]:
+        """获取从站序位置index到下一站的行驶时间曲线"""
+        return self.profiles.get(index) if self.profiles else None
+
+    def get_travel_time(self, from_seq: int, to_seq: int, depart: int = None) -> int:
         """
         计算两站之间的行驶时间
 
         Args:
             from_seq: 起始站点序号
             to_seq: 终点站点序号
+            depart: 从起始站出发的时刻（分钟），指定时按各路段的行驶时间曲线逐段计算
 
         Returns:
             行驶时间（分钟）
         """
-        if from_seq >= len(self.stations) or to_seq >= len(self.stations):
+        if from_seq >= len(self.station_ids) or to_seq >= len(self.station_ids):
             return 0
 
-        from_station = self.stations[from_seq]
-        to_station = self.stations[to_seq]
+        if depart is None or not self.profiles or from_seq >= to_seq:
+            return abs(self.offsets[to_seq] - self.offsets[from_seq])
 
-        return abs(to_station.arrival_time_offset - from_station.arrival_time_offset)
+        current = depart
+        for index in range(from_seq, to_seq):
+            profile = self.profiles.get(index)
+            if profile is None:
+                current += self.offsets[index + 1] - self.offsets[index]
+            else:
+                current += profile.evaluate(current)
+        return current - depart
 
     def get_station_sequence(self, station_id: str) -> Optional[int]:
-        """获取站点在线路中的序号"""
-        for rs in self.stations:
-            if rs.station_id == station_id:
-                return rs.sequence
-        return None
+        """获取站点在线路中的序号（站点多次出现时取第一次）"""
+        if self._sequence_of is None:
+            sequence_of = {}
+            for sid, sequence in zip(self.station_ids, self.sequences):
+                sequence_of.setdefault(sid, sequence)
+            self._sequence_of = sequence_of
+        return self._sequence_of.get(station_id)
 
     def __str__(self):
-        return f"{self.route_name} ({len(self.stations)}站)"
+        return f"{self.route_name} ({len(self.station_ids)}站)"
 
     def __repr__(self):
-        return f"BusRoute(id={self.route_id}, name={self.route_name}, stations={len(self.stations)})"
+        return f"BusRoute(id={self.route_id}, name={self.route_name}, stations={len(self.station_ids)})"
@@ -1,15 +1,33 @@
 """
 时刻表模型
 """
-from datetime import time, datetime, timedelta
-from typing import List, Optional
+from bisect import bisect_left, bisect_right
+from datetime import time, datetime
+from typing import List, Optional, Tuple
+
+# 发车时段：(开始分钟, 结束分钟, 发车间隔分钟)，时段内从开始时刻起按间隔发车
+HeadwayPeriod = Tuple[int, int, int]
+
+
+def time_to_minutes(t: time) -> int:
+    """将时间转换为当天零点起的分钟数"""
+    return t.hour * 60 + t.minute
+
+
+def minutes_to_time(minutes: int) -> time:
+    """将当天零点起的分钟数转换为时间（超过一天按24小时取模）"""
+    minutes = int(minutes) % (24 * 60)
+    return time(minutes // 60, minutes % 60)
 
 
 class Schedule:
     """时刻表类"""
 
+    __slots__ = ('route_id', 'first_bus', 'last_bus', 'interval', 'service_id', 'periods', 'trips')
+
     def __init__(self, route_id: str, first_bus: time, last_bus: time,
-                 interval: int = 10):
+                 interval: int = 10, service_id: str = None,
+                 periods: List[HeadwayPeriod] = None, trips: List[int] = None):
         """
         初始化时刻表
 
@@ -18,11 +36,55 @@ class Schedule:
             first_bus: 首班车时间
             last_bus: 末班车时间
             interval: 发车间隔（分钟）
+            service_id: 服务日历ID（如果为None，每天都使用该时刻表）
+            periods: 分时段发车间隔（按开始时刻排列、互不重叠），如果为None则全天按interval发车
+            trips: 各班次在首站的发车时刻（分钟，递增），指定时按实际班次发车，忽略interval和periods
         """
         self.route_id = route_id
         self.first_bus = first_bus
         self.last_bus = last_bus
         self.interval = interval
+        self.service_id = service_id
+        self.periods = periods
+        self.trips = trips
+
+    @classmethod
+    def from_periods(cls, route_id: str, periods: List[HeadwayPeriod],
+                     service_id: str = None) -> 'Schedule':
+        """
+        按分时段发车间隔构建时刻表（如高峰5分钟一班、平峰10分钟一班）
+
+        Args:
+            route_id: 线路ID
+            periods: [(开始分钟, 结束分钟, 发车间隔分钟)]
+            service_id: 服务日历ID
+
+        Returns:
+            Schedule对象，首末班车取各时段的最早开始和最晚结束，interval取最小间隔
+        """
+        periods = sorted(periods)
+        return cls(route_id, minutes_to_time(periods[0][0]),
+                   minutes_to_time(max(end for _, end, _ in periods)),
+                   min(interval for _, _, interval in periods), service_id, periods)
+
+    @classmethod
+    def from_trips(cls, route_id: str, departures: List[int], service_id: str = None) -> 'Schedule':
+        """
+        按实际班次构建时刻表（如GTFS的stop_times），保留每个班次的发车时刻
+
+        Args:
+            route_id: 线路ID
+            departures: 各班次在首站的发车时刻（分钟），可以超过24:00（次日凌晨的班次）
+            service_id: 服务日历ID
+
+        Returns:
+            Schedule对象，首末班车取最早和最晚的班次（截断到当天），interval取平均发车间隔
+        """
+        trips = sorted(set(departures))
+        interval = max(1, round((trips[-1] - trips[0]) / (len(trips) - 1))) if len(trips) > 1 else 60
+        last_minute = 24 * 60 - 1
+        return cls(route_id, minutes_to_time(min(trips[0], last_minute)),
+                   minutes_to_time(min(trips[-1], last_minute)), interval, service_id, trips=trips)
 
     def get_next_bus(self, current_time: time = None) -> Optional[time]:
         """
@@ -37,29 +99,11 @@ class Schedule:
         if current_time is None:
             current_time = datetime.now().time()
 
-        # 转换为datetime以便计算
-        today = datetime.now().date()
-        current_dt = datetime.combine(today, current_time)
-        first_dt = datetime.combine(today, self.first_bus)
-        last_dt = datetime.combine(today, self.last_bus)
-
-        # 如果当前时间早于首班车
-        if current_dt < first_dt:
-            return self.first_bus
-
-        # 如果当前时间晚于末班车
-        if current_dt > last_dt:
-            return None
-
-        # 计算下一班车
-        elapsed = (current_dt - first_dt).total_seconds() / 60
-        next_interval = ((elapsed // self.interval) + 1) * self.interval
-        next_dt = first_dt + timedelta(minutes=next_interval)
-
-        if next_dt > last_dt:
+        departures = self.get_departures()
+        i = bisect_right(departures, self._minutes(current_time))
+        if i == len(departures):
             return None
-
-        return next_dt.time()
+        return minutes_to_time(departures[i])
 
     def get_waiting_time(self, current_time: time = None) -> Optional[int]:
         """
@@ -71,19 +115,71 @@ class Schedule:
         Returns:
             等待时间（分钟），如果没有下一班车则返回None
         """
+        if current_time is None:
+            current_time = datetime.now().time()
+
         next_bus = self.get_next_bus(current_time)
         if next_bus is None:
             return None
+        return int(time_to_minutes(next_bus) - self._minutes(current_time))
 
-        if current_time is None:
-            current_time = datetime.now().time()
+    @staticmethod
+    def _minutes(t: time) -> float:
+        """时间 -> 当天零点起的分钟数（保留秒）"""
+        return t.hour * 60 + t.minute + (t.second + t.microsecond / 1e6) / 60
 
-        today = datetime.now().date()
-        current_dt = datetime.combine(today, current_time)
-        next_dt = datetime.combine(today, next_bus)
+    def get_departures(self) -> List[int]:
+        """
+        获取全天在首站的发车时刻（按分钟计算）
+
+        Returns:
+            发车时刻列表（当天零点起的分钟数，递增）
+        """
+        if self.trips:
+            return list(self.trips)
+
+        if not self.periods:
+            return list(range(time_to_minutes(self.first_bus), time_to_minutes(self.last_bus) + 1,
+                              self.interval))
+
+        departures = []
+        for start, end, interval in self.periods:
+            for departure in range(start, end + 1, interval):
+                # 相邻时段首尾相接时不重复发车
+                if not departures or departure > departures[-1]:
+                    departures.append(departure)
+        return departures
+
+    def get_next_departure(self, minute: int, offset: int = 0) -> Optional[int]:
+        """
+        获取不早于指定时刻的下一班车发车时刻（按分钟计算）
 
-        waiting = (next_dt - current_dt).total_seconds() / 60
-        return int(waiting)
+        Args:
+            minute: 当天零点起的分钟数
+            offset: 站点相对首站的时间偏移（分钟）
+
+        Returns:
+            该站下一班车的到站时刻（分钟），如果没有则返回None
+        """
+        if self.trips or self.periods:
+            departures = self.trips or self.get_departures()
+            i = bisect_left(departures, minute - offset)
+            return departures[i] + offset if i < len(departures) else None
+
+        first = time_to_minutes(self.first_bus)
+        last = time_to_minutes(self.last_bus)
+        start = minute - offset
+
+        if start <= first:
+            return first + offset
+
+        # 向上取整到下一个发车间隔
+        n = -((first - start) // self.interval)
+        departure = first + n * self.interval
+        if departure > last:
+            return None
+        return departure + offset
 
     def __str__(self):
-        return f"Schedule(route={self.route_id}, {self.first_bus}-{self.last_bus}, interval={self.interval}min)"
+        service = f", service={self.service_id}" if self.service_id is not None else ""
+        return f"Schedule(route={self.route_id}, {self.first_bus}-{self.last_bus}, interval={self.interval}min{service})"
@@ -1,12 +1,14 @@
 """
 公交站点模型
 """
-from typing import Optional, List
+from typing import Dict, Optional, Tuple
 
 
 class Station:
     """公交站点类"""
 
+    __slots__ = ('station_id', 'name', 'latitude', 'longitude', 'city', 'district', '_routes')
+
     def __init__(self, station_id: str, name: str, latitude: float = 0.0,
                  longitude: float = 0.0, city: str = "", district: str = ""):
         """
@@ -26,12 +28,25 @@ class Station:
         self.longitude = longitude
         self.city = city
         self.district = district
-        self.routes: List[str] = []  # 经过此站点的线路ID列表
+        # 经过此站点的线路ID（按添加顺序，字典当作有序集合使用，成员判断为O(1)）
+        self._routes: Dict[str, None] = {}
+
+    @property
+    def routes(self) -> Tuple[str, ...]:
+        """经过此站点的线路ID（只读，增删线路请使用 add_route/remove_route）"""
+        return tuple(self._routes)
+
+    def has_route(self, route_id: str) -> bool:
+        """线路是否经过此站点"""
+        return route_id in self._routes
 
     def add_route(self, route_id: str):
         """添加经过此站点的线路"""
-        if route_id not in self.routes:
-            self.routes.append(route_id)
+        self._routes[route_id] = None
+
+    def remove_route(self, route_id: str):
+        """移除经过此站点的线路"""
+        self._routes.pop(route_id, None)
 
     def __str__(self):
         return f"{self.name} ({self.district})"
@@ -1,4 +1,15 @@
 from .graph import TransitGraph
+from .network import CompiledNetwork
 from .pathfinder import PathFinder, TransferPlan
+from .raptor import RaptorRouter
+from .csa import ConnectionScanner
+from .pareto import McRaptorRouter
+from .transfer_patterns import TransferPatternIndex
+from .matrix import iter_matrix
+from .cache import PlanCache
+from .name_index import NameIndex
+from .spatial import SpatialIndex
+from .metrics import PlannerMetrics
+from .budget import SearchBudget
 
-__all__ = ['TransitGraph', 'PathFinder', 'TransferPlan']
+__all__ = ['TransitGraph', 'CompiledNetwork', 'PathFinder', 'TransferPlan', 'RaptorRouter', 'ConnectionScanner', 'McRaptorRouter', 'TransferPatternIndex', 'iter_matrix', 'PlanCache', 'NameIndex', 'SpatialIndex', 'PlannerMetrics', 'SearchBudget']
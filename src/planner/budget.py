@@ -0,0 +1,64 @@
+"""
+搜索预算模块
+
+限制单次路线查询的搜索规模：墙钟截止时间、最多出队（定型）标签数、队列最大长度。
+超出任一预算时搜索提前结束，返回目前找到的最好方案（可能不是最优，也可能没有），
+并在预算对象上记录耗尽原因，防止个别病态起终点长时间占用工作进程。
+"""
+from time import monotonic
+from typing import Optional
+
+# 每出队多少个标签检查一次截止时间（减少计时调用的开销）
+DEADLINE_CHECK_INTERVAL = 64
+
+
+class SearchBudget:
+    """单次查询的搜索预算"""
+
+    __slots__ = ('deadline', 'max_settled', 'max_queue', 'exhausted')
+
+    def __init__(self, timeout_ms: Optional[float] = None, max_settled: Optional[int] = None,
+                 max_queue: Optional[int] = None, deadline: Optional[float] = None):
+        """
+        初始化搜索预算
+
+        Args:
+            timeout_ms: 墙钟时间预算（毫秒，从创建时起算），None表示不限
+            max_settled: 最多出队的标签数，None表示不限
+            max_queue: 队列（堆）最大长度，None表示不限
+            deadline: 绝对截止时间（time.monotonic()时钟，各进程共用），如请求到达时算出的截止时间；
+                与timeout_ms同时指定时取较早者
+        """
+        if timeout_ms is not None:
+            timeout_deadline = monotonic() + timeout_ms / 1000
+            deadline = timeout_deadline if deadline is None else min(deadline, timeout_deadline)
+        self.deadline = deadline
+        self.max_settled = max_settled
+        self.max_queue = max_queue
+        self.exhausted: Optional[str] = None  # 耗尽原因：'deadline'、'settled'、'queue'
+
+    def check(self, settled: int, queued: int) -> bool:
+        """
+        检查是否超出预算（每出队一个标签前调用），超出时记录原因
+
+        Args:
+            settled: 已出队的标签数
+            queued: 当前队列长度
+
+        Returns:
+            是否应停止搜索
+        """
+        if self.max_settled is not None and settled >= self.max_settled:
+            self.exhausted = 'settled'
+        elif self.max_queue is not None and queued > self.max_queue:
+            self.exhausted = 'queue'
+        elif (self.deadline is not None and settled % DEADLINE_CHECK_INTERVAL == 0
+              and monotonic() >= self.deadline):
+            self.exhausted = 'deadline'
+        else:
+            return False
+        return True
+
+    def __repr__(self):
+        return (f"SearchBudget(deadline={self.deadline}, max_settled={self.max_settled}, "
+                f"max_queue={self.max_queue}, exhausted={self.exhausted})")
@@ -0,0 +1,89 @@
+"""
+换乘方案缓存模块
+
+按 (起点, 终点, 算法, 最大换乘次数, 出发时间分桶, 当天运营的服务) 缓存规划结果，容量有界、LRU淘汰。
+缓存键包含公交网络图的版本号，图结构变化后旧方案自动失效。
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+# 缓存未命中时的返回值（规划结果本身可能为None）
+MISS = object()
+
+
+class PlanCache:
+    """有界LRU方案缓存"""
+
+    def __init__(self, max_size: int = 1024, bucket_minutes: int = 5):
+        """
+        初始化缓存
+
+        Args:
+            max_size: 最多缓存的方案数
+            bucket_minutes: 出发时间分桶宽度（分钟），同一桶内的查询共享结果
+        """
+        self.max_size = max_size
+        self.bucket_minutes = bucket_minutes
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, graph_version: int, from_station_id: str, to_station_id: str,
+                 algorithm: str, max_transfers: int, depart_minute: int,
+                 services: Hashable = None) -> tuple:
+        """生成缓存键（services为当天运营的服务ID集合，运营服务相同的日期共享结果）"""
+        return (graph_version, from_station_id, to_station_id, algorithm,
+                max_transfers, depart_minute // self.bucket_minutes, services)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        获取缓存的方案
+
+        Returns:
+            缓存值，未命中时返回MISS
+        """
+        with self._lock:
+            value = self._entries.get(key, MISS)
+            if value is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """写入方案，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def get_statistics(self) -> Dict:
+        """获取缓存统计信息"""
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate
+        }
+
+    def __len__(self):
+        return len(self._entries)
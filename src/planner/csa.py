@@ -0,0 +1,117 @@
+"""
+连接扫描算法（Connection Scan Algorithm）路径规划模块
+
+每条线路的时刻表按班次展开为"连接"（某班车从一站开往下一站），
+全部连接按出发时刻排序存放在编译网络的紧凑数组中，最早到达查询只需一次线性扫描。
+"""
+from array import array
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.planner.network import CompiledNetwork, NONE
+from src.planner.raptor import TRANSFER_TIME, Leg
+
+# 班次上车状态：尚未上车；已移除的班次
+UNBOARDED = -1
+REMOVED = -2
+
+
+class ConnectionScanner:
+    """基于按出发时刻排序的连接数组的CSA规划器"""
+
+    def __init__(self, network: CompiledNetwork):
+        """
+        Args:
+            network: 编译网络，连接数组在编译时（或快照中）已按出发时刻排好序
+        """
+        self.network = network
+        self.trip_routes = network.trip_routes  # trip_index -> 线路编号，已移除的班次为NONE
+
+        # 结构数组：第i个连接的出发时刻、到达时刻、出发站、到达站、班次
+        self.departures = network.connection_departures
+        self.arrivals = network.connection_arrivals
+        self.from_stations = network.connection_from_stations
+        self.to_stations = network.connection_to_stations
+        self.trips = network.connection_trips
+
+        # 每次查询的班次上车状态的初始值：已移除的班次（线路更新后仍留在连接数组中）不可上车
+        if network.removed_trips:
+            self._unboarded = array('i', (UNBOARDED if r != NONE else REMOVED for r in self.trip_routes))
+        else:
+            self._unboarded = array('i', [UNBOARDED]) * len(self.trip_routes)
+
+    def __len__(self):
+        return len(self.departures)
+
+    def route(self, from_station_id: str, to_station_id: str, depart: int) -> Optional[Tuple[int, List[Leg]]]:
+        """
+        查询最早到达方案
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart: 出发时刻（当天零点起的分钟数）
+
+        Returns:
+            (到达时刻, 行程段列表)，如果无法到达则返回None
+        """
+        net = self.network
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None or source == target:
+            return None
+
+        inf = float('inf')
+        earliest = [inf] * net.station_count
+        earliest[source] = depart
+
+        # 每个站点的到达方式：(上车连接, 下车连接)
+        journey: List[Optional[Tuple[int, int]]] = [None] * net.station_count
+        # 每个班次的上车连接，UNBOARDED表示尚未上车
+        boarded = array('i', self._unboarded)
+
+        departures = self.departures
+        arrivals = self.arrivals
+        from_stations = self.from_stations
+        to_stations = self.to_stations
+        trips = self.trips
+
+        for c in range(bisect_left(departures, depart), len(departures)):
+            dep = departures[c]
+            if dep >= earliest[target]:
+                break
+
+            trip = trips[c]
+            if boarded[trip] < 0:
+                if boarded[trip] == REMOVED:
+                    continue
+                stop = from_stations[c]
+                ready = earliest[stop]
+                if stop != source:
+                    ready += TRANSFER_TIME
+                if ready > dep:
+                    continue
+                boarded[trip] = c
+
+            stop = to_stations[c]
+            if arrivals[c] < earliest[stop]:
+                earliest[stop] = arrivals[c]
+                journey[stop] = (boarded[trip], c)
+
+        if journey[target] is None:
+            return None
+
+        # 从终点回溯行程段
+        legs = []
+        stop = target
+        while stop != source:
+            board, alight = journey[stop]
+            board_stop = from_stations[board]
+            legs.append((net.route_ids[self.trip_routes[trips[board]]], net.station_ids[board_stop],
+                         net.station_ids[stop], departures[board], arrivals[alight]))
+            stop = board_stop
+        legs.reverse()
+
+        return earliest[target], legs
@@ -0,0 +1,80 @@
+"""
+步行换乘（footpath）生成模块
+
+根据站点坐标在一定距离内的站点之间生成步行边，并只保留有用的步行边：
+- 传递约简：如果 a→b→c 的步行时间不超过 a→c，去掉 a→c（规划器可以连续步行）
+- 数量上限：每个站点只保留步行时间最短的若干条
+"""
+import math
+from typing import Dict, List, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+# 步行速度（米/分钟），约4.8公里/小时
+WALKING_SPEED = 80.0
+
+# 绕行系数：实际步行距离相对直线距离的放大倍数
+DETOUR_FACTOR = 1.3
+
+# 步行边：(目标站点ID, 步行时间（分钟）)
+Footpath = Tuple[str, int]
+
+
+def walking_time(distance: float, walking_speed: float = WALKING_SPEED) -> int:
+    """
+    直线距离 -> 步行时间
+
+    Args:
+        distance: 直线距离（米）
+        walking_speed: 步行速度（米/分钟）
+
+    Returns:
+        步行时间（分钟），至少1分钟
+    """
+    return max(1, math.ceil(distance * DETOUR_FACTOR / walking_speed))
+
+
+def generate_footpaths(graph, max_distance: float = 300.0, max_per_station: int = 5,
+                       walking_speed: float = WALKING_SPEED) -> Dict[str, List[Footpath]]:
+    """
+    生成站点之间的步行边
+
+    Args:
+        graph: TransitGraph对象（使用其空间索引）
+        max_distance: 最大步行直线距离（米）
+        max_per_station: 每个站点最多保留的步行边数
+        walking_speed: 步行速度（米/分钟）
+
+    Returns:
+        {站点ID: [(目标站点ID, 步行时间)]}，按步行时间排序
+    """
+    index = graph.spatial_index
+
+    # 距离范围内的全部候选步行边
+    candidates: Dict[str, Dict[str, int]] = {}
+    for station_id, lat, lon in zip(index.ids, index.latitudes, index.longitudes):
+        nearby = {}
+        for other_id, distance in index.within(lat, lon, max_distance):
+            if other_id != station_id:
+                nearby[other_id] = walking_time(distance, walking_speed)
+        if nearby:
+            candidates[station_id] = nearby
+
+    # 传递约简：a→c可以由更短的a→b→c代替时去掉
+    # （约简依据的两条边都严格短于被去掉的边，因此任意两站间的最短步行时间不变）
+    footpaths: Dict[str, List[Footpath]] = {}
+    for station_id, nearby in candidates.items():
+        kept = []
+        for other_id, minutes in nearby.items():
+            redundant = any(
+                via_minutes + candidates.get(via_id, {}).get(other_id, minutes + 1) <= minutes
+                for via_id, via_minutes in nearby.items()
+                if via_id != other_id and via_minutes < minutes
+            )
+            if not redundant:
+                kept.append((minutes, other_id))
+
+        kept.sort()
+        footpaths[station_id] = [(other_id, minutes) for minutes, other_id in kept[:max_per_station]]
+
+    return footpaths
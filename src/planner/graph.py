@@ -1,12 +1,17 @@
 """
 公交网络图构建模块
 """
-from typing import Dict, List, Set
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 from collections import defaultdict
+from datetime import date
 import sys
 sys.path.append('/home/user/weiruan-bus')
 
-from src.models import Station, BusRoute, Schedule
+from src.models import Station, BusRoute, Schedule, ServiceCalendar, TravelTimeProfile
+from src.planner.network import CompiledNetwork
+from src.planner.name_index import NameIndex, STATION, ROUTE
+from src.planner.spatial import SpatialIndex
+from src.planner.footpaths import generate_footpaths, Footpath, WALKING_SPEED
 
 
 class TransitGraph:
@@ -15,7 +20,11 @@ class TransitGraph:
     def __init__(self):
         self.stations: Dict[str, Station] = {}  # station_id -> Station
         self.routes: Dict[str, BusRoute] = {}   # route_id -> BusRoute
-        self.schedules: Dict[str, Schedule] = {}  # route_id -> Schedule
+        self.schedules: Dict[str, Schedule] = {}  # route_id -> Schedule（每天使用的时刻表）
+
+        # 服务日历与按日历生效的时刻表
+        self.calendars: Dict[str, ServiceCalendar] = {}  # service_id -> ServiceCalendar
+        self.schedule_variants: Dict[str, List[Schedule]] = {}  # route_id -> [Schedule]
 
         # 图结构：站点之间的连接
         # station_id -> [(next_station_id, route_id, travel_time)]
@@ -25,9 +34,32 @@ class TransitGraph:
         # station_id -> [route_id]
         self.station_routes: Dict[str, Set[str]] = defaultdict(set)
 
+        # 步行换乘：station_id -> [(目标站点ID, 步行时间)]
+        self.footpaths: Dict[str, List[Footpath]] = {}
+
+        # 版本号：每次添加站点、添加或移除线路、更新步行边都会递增，派生数据（编译网络、方案缓存）据此失效；
+        # 添加、移除线路时编译网络就地更新并跟随新的版本号，不重新编译
+        self.version = 0
+
+        # 编译后的只读网络及其对应的版本号
+        self._compiled: Optional[CompiledNetwork] = None
+        self._compiled_version = -1
+
+        # 按服务日切换时刻表后的网络：当天生效的服务ID集合 -> 网络（版本号同上）
+        self._service_networks: Dict[FrozenSet[str], CompiledNetwork] = {}
+
+        # 站点与线路名称索引及其对应的版本号
+        self._name_index: Optional[NameIndex] = None
+        self._name_index_version = -1
+
+        # 站点空间索引及其对应的版本号
+        self._spatial_index: Optional[SpatialIndex] = None
+        self._spatial_index_version = -1
+
     def add_station(self, station: Station):
         """添加站点"""
         self.stations[station.station_id] = station
+        self.version += 1
 
     def add_route(self, route: BusRoute, schedule: Schedule = None):
         """
@@ -37,44 +69,309 @@ class TransitGraph:
             route: 公交线路对象
             schedule: 时刻表对象（可选）
         """
+        current = self._route_edit_begin()
         self.routes[route.route_id] = route
+        self.version += 1
 
         if schedule:
-            self.schedules[route.route_id] = schedule
+            self._store_schedule(schedule)
 
-        # 构建图的边
-        stations = route.stations
-        for i in range(len(stations) - 1):
-            from_station = stations[i]
-            to_station = stations[i + 1]
+        # 构建图的边（直接读取线路的站序列）
+        station_ids = route.station_ids
+        offsets = route.offsets
+        for i in range(len(station_ids) - 1):
+            from_id = station_ids[i]
+            to_id = station_ids[i + 1]
 
             # 计算行驶时间
-            travel_time = to_station.arrival_time_offset - from_station.arrival_time_offset
+            travel_time = offsets[i + 1] - offsets[i]
 
             # 添加边
-            self.graph[from_station.station_id].append(
-                (to_station.station_id, route.route_id, travel_time)
-            )
+            self.graph[from_id].append((to_id, route.route_id, travel_time))
 
             # 记录站点到线路的映射
-            self.station_routes[from_station.station_id].add(route.route_id)
-            self.station_routes[to_station.station_id].add(route.route_id)
+            self.station_routes[from_id].add(route.route_id)
+            self.station_routes[to_id].add(route.route_id)
 
             # 更新站点的线路列表
-            if from_station.station_id in self.stations:
-                self.stations[from_station.station_id].add_route(route.route_id)
-            if to_station.station_id in self.stations:
-                self.stations[to_station.station_id].add_route(route.route_id)
+            if from_id in self.stations:
+                self.stations[from_id].add_route(route.route_id)
+            if to_id in self.stations:
+                self.stations[to_id].add_route(route.route_id)
 
         # 如果是环线，连接最后一站到第一站
-        if route.is_loop and len(stations) > 1:
-            last_station = stations[-1]
-            first_station = stations[0]
+        if route.is_loop and len(station_ids) > 1:
             travel_time = route.interval  # 使用发车间隔作为估计
 
-            self.graph[last_station.station_id].append(
-                (first_station.station_id, route.route_id, travel_time)
-            )
+            self.graph[station_ids[-1]].append((station_ids[0], route.route_id, travel_time))
+
+        self._route_edit_end(current, route.route_id, route)
+
+    def remove_route(self, route_id: str) -> Optional[BusRoute]:
+        """
+        移除线路（如临时停运）
+
+        只修改该线路经过的站点的邻接表和线路映射；已编译的网络就地清空该线路的切片
+        （见 CompiledNetwork.patch_route），名称索引移除该线路并更新沿线站点的热度，空间索引保留，
+        方案缓存随版本号变化失效，
+        基于编译网络的换乘模式由PathFinder在下次查询时按原参数重新预计算
+
+        Args:
+            route_id: 线路ID
+
+        Returns:
+            被移除的线路对象，如果线路不存在则返回None
+        """
+        route = self.routes.pop(route_id, None)
+        if route is None:
+            return None
+        current = self._route_edit_begin()
+        self.schedules.pop(route_id, None)
+        self.schedule_variants.pop(route_id, None)
+        self.version += 1
+
+        for station_id in set(route.get_station_ids()):
+            edges = self.graph.get(station_id)
+            if edges is not None:
+                edges[:] = [edge for edge in edges if edge[1] != route_id]
+                if not edges:
+                    del self.graph[station_id]
+
+            routes = self.station_routes.get(station_id)
+            if routes is not None:
+                routes.discard(route_id)
+                if not routes:
+                    del self.station_routes[station_id]
+
+            if station_id in self.stations:
+                self.stations[station_id].remove_route(route_id)
+
+        self._route_edit_end(current, route_id, removed=route)
+        return route
+
+    def _route_edit_begin(self) -> Tuple[bool, bool, bool]:
+        """线路增删前调用：返回 (编译网络、空间索引、名称索引是否为当前版本)"""
+        return (self._compiled is not None and self._compiled_version == self.version,
+                self._spatial_index is not None and self._spatial_index_version == self.version,
+                self._name_index is not None and self._name_index_version == self.version)
+
+    def _route_edit_end(self, current: Tuple[bool, bool, bool], route_id: str, route: BusRoute = None,
+                        removed: BusRoute = None):
+        """
+        线路增删后让编译网络、空间索引和名称索引跟随新的版本号
+
+        编译网络就地更新；按服务日切换时刻表的网络与它共用数组，需要重新生成。
+        站点没有变化，空间索引继续有效；名称索引增删该线路的条目，并更新沿线站点的热度（途经线路数）
+
+        Args:
+            current: _route_edit_begin() 的返回值
+            route_id: 线路ID
+            route: 添加的线路对象，None表示移除
+            removed: 被移除的线路对象（移除时）
+        """
+        compiled_current, spatial_current, name_current = current
+        if compiled_current:
+            self._compiled.patch_route(route_id, route, self.schedules.get(route_id) if route else None)
+            self._compiled_version = self.version
+            self._service_networks = {}
+        if spatial_current:
+            self._spatial_index_version = self.version
+        if name_current:
+            index = self._name_index
+            index.remove(ROUTE, route_id)
+            if route is not None:
+                index.add(ROUTE, route_id, route.route_name, len(route.station_ids))
+            for station_id in set((route or removed).station_ids):
+                if station_id in self.stations:
+                    index.set_weight(STATION, station_id, len(self.station_routes.get(station_id, ())))
+            self._name_index_version = self.version
+
+    def replace_route(self, route: BusRoute, schedule: Schedule = None) -> Optional[BusRoute]:
+        """
+        替换线路（如绕行调整站序）
+
+        先移除再添加，已编译的网络两次都就地更新，替换后的线路沿用原来的编号
+
+        Args:
+            route: 新的线路对象，按route_id替换同名线路（不存在时直接添加）
+            schedule: 新的时刻表（如果为None，沿用原线路的时刻表，包括按日历生效的时刻表）
+
+        Returns:
+            被替换的线路对象，如果原来没有该线路则返回None
+        """
+        variants = []
+        if schedule is None:
+            schedule = self.schedules.get(route.route_id)
+            variants = self.schedule_variants.get(route.route_id, [])
+        old_route = self.remove_route(route.route_id)
+        self.add_route(route, schedule)
+        for variant in variants:
+            self._store_schedule(variant)
+        return old_route
+
+    def set_travel_profile(self, route_id: str, index: int, profile: Optional[TravelTimeProfile]):
+        """
+        设置线路某一路段的行驶时间曲线
+
+        Args:
+            route_id: 线路ID
+            index: 路段起点在站序中的位置，见 BusRoute.set_travel_profile
+            profile: 行驶时间曲线，None表示恢复按时间偏移计算
+        """
+        self.routes[route_id].set_travel_profile(index, profile)
+        self.version += 1
+
+    def add_calendar(self, calendar: ServiceCalendar):
+        """添加服务日历（同一service_id覆盖原日历）"""
+        self.calendars[calendar.service_id] = calendar
+        self.version += 1
+
+    def add_schedule(self, schedule: Schedule):
+        """
+        添加时刻表
+
+        service_id为None的时刻表每天使用，替换线路原有的时刻表；否则作为该线路的
+        一个时刻表版本，只在对应服务日历的运营日生效
+
+        Args:
+            schedule: 时刻表对象
+        """
+        self._store_schedule(schedule)
+        self.version += 1
+
+    def _store_schedule(self, schedule: Schedule):
+        if schedule.service_id is None:
+            self.schedules[schedule.route_id] = schedule
+        else:
+            self.schedule_variants.setdefault(schedule.route_id, []).append(schedule)
+
+    def active_services(self, service_date: date) -> FrozenSet[str]:
+        """
+        获取某天运营的服务ID集合
+
+        Args:
+            service_date: 日期
+
+        Returns:
+            服务ID集合
+        """
+        return frozenset(service_id for service_id, calendar in self.calendars.items()
+                         if calendar.runs_on(service_date))
+
+    def set_footpaths(self, footpaths: Dict[str, List[Footpath]]):
+        """
+        设置步行换乘边
+
+        Args:
+            footpaths: {站点ID: [(目标站点ID, 步行时间（分钟）)]}
+        """
+        self.footpaths = footpaths
+        self.version += 1
+
+    def generate_footpaths(self, max_distance: float = 300.0, max_per_station: int = 5,
+                           walking_speed: float = WALKING_SPEED) -> int:
+        """
+        根据站点坐标生成步行换乘边（传递约简并限制每站数量）
+
+        Args:
+            max_distance: 最大步行直线距离（米）
+            max_per_station: 每个站点最多保留的步行边数
+            walking_speed: 步行速度（米/分钟）
+
+        Returns:
+            生成的步行边数
+        """
+        self.set_footpaths(generate_footpaths(self, max_distance, max_per_station, walking_speed))
+        return sum(len(paths) for paths in self.footpaths.values())
+
+    def get_footpaths(self, station_id: str) -> List[Footpath]:
+        """获取从站点出发的步行边 [(目标站点ID, 步行时间)]"""
+        return self.footpaths.get(station_id, [])
+
+    def compile(self, service_date: date = None) -> CompiledNetwork:
+        """
+        编译为整数编号、数组存储的只读网络
+
+        结果会被缓存，直到图的版本号变化
+
+        Args:
+            service_date: 服务日期（如果为None，使用每天的时刻表）。有按日历生效的时刻表的线路
+                使用当天生效的版本，当天没有生效版本的线路停运；当天运营的服务相同的日期共用同一网络
+
+        Returns:
+            编译后的网络
+        """
+        if self._compiled is None or self._compiled_version != self.version:
+            self._compiled = CompiledNetwork.from_graph(self)
+            self._compiled_version = self.version
+            self._service_networks = {}
+
+        if service_date is None or not self.schedule_variants:
+            return self._compiled
+
+        services = self.active_services(service_date)
+        network = self._service_networks.get(services)
+        if network is None:
+            network = self._compiled
+            schedules = {}
+            for route_id, variants in self.schedule_variants.items():
+                r = network.route_index.get(route_id)
+                if r is not None:
+                    schedules[r] = next((v for v in variants if v.service_id in services), None)
+            network = network.with_schedules(schedules)
+            self._service_networks[services] = network
+        return network
+
+    @property
+    def name_index(self) -> NameIndex:
+        """站点与线路名称索引（首次查询时建立，图的版本号变化后重建）"""
+        if self._name_index is None or self._name_index_version != self.version:
+            self._name_index = NameIndex.from_graph(self)
+            self._name_index_version = self.version
+        return self._name_index
+
+    @property
+    def spatial_index(self) -> SpatialIndex:
+        """站点空间索引（首次查询时建立，图的版本号变化后重建）"""
+        if self._spatial_index is None or self._spatial_index_version != self.version:
+            self._spatial_index = SpatialIndex.from_graph(self)
+            self._spatial_index_version = self.version
+        return self._spatial_index
+
+    def nearby(self, lat: float, lon: float, radius_m: float,
+               limit: int = None) -> List[Tuple[Station, float]]:
+        """
+        查找附近的站点
+
+        Args:
+            lat: 纬度
+            lon: 经度
+            radius_m: 半径（米）
+            limit: 最多返回的站点数（如果为None，返回半径内全部站点）
+
+        Returns:
+            [(站点, 距离（米）)]，按距离从近到远排列
+        """
+        if limit is None:
+            found = self.spatial_index.within(lat, lon, radius_m)
+        else:
+            found = self.spatial_index.nearest(lat, lon, limit, radius_m)
+        return [(self.stations[sid], distance) for sid, distance in found]
+
+    def nearest_stations(self, lat: float, lon: float, k: int = 5) -> List[Tuple[Station, float]]:
+        """
+        查找最近的k个站点
+
+        Args:
+            lat: 纬度
+            lon: 经度
+            k: 站点数
+
+        Returns:
+            [(站点, 距离（米）)]，按距离从近到远排列
+        """
+        return [(self.stations[sid], distance)
+                for sid, distance in self.spatial_index.nearest(lat, lon, k)]
 
     def get_station(self, station_id: str) -> Station:
         """获取站点对象"""
@@ -84,9 +381,25 @@ class TransitGraph:
         """获取线路对象"""
         return self.routes.get(route_id)
 
-    def get_schedule(self, route_id: str) -> Schedule:
-        """获取时刻表对象"""
-        return self.schedules.get(route_id)
+    def get_schedule(self, route_id: str, service_date: date = None) -> Optional[Schedule]:
+        """
+        获取时刻表对象
+
+        Args:
+            route_id: 线路ID
+            service_date: 服务日期（如果为None，返回每天使用的时刻表）
+
+        Returns:
+            时刻表对象；指定日期且线路有按日历生效的时刻表时返回当天生效的版本，当天停运返回None
+        """
+        variants = self.schedule_variants.get(route_id)
+        if service_date is None or not variants:
+            return self.schedules.get(route_id)
+        for variant in variants:
+            calendar = self.calendars.get(variant.service_id)
+            if calendar is not None and calendar.runs_on(service_date):
+                return variant
+        return None
 
     def get_common_routes(self, station1_id: str, station2_id: str) -> Set[str]:
         """
@@ -117,19 +430,29 @@ class TransitGraph:
 
     def find_station_by_name(self, name: str) -> List[Station]:
         """
-        根据名称查找站点（支持模糊匹配）
+        根据名称查找站点（支持模糊匹配和拼音）
 
         Args:
             name: 站点名称
 
         Returns:
-            匹配的站点列表
+            匹配的站点列表，完全匹配、前缀匹配、子串匹配依次排列
+        """
+        if not name.strip():
+            return list(self.stations.values())
+        return [self.stations[sid] for _, sid, _ in self.name_index.search(name, kind=STATION)]
+
+    def find_route_by_name(self, name: str) -> List[BusRoute]:
+        """
+        根据名称查找线路（支持模糊匹配和拼音）
+
+        Args:
+            name: 线路名称
+
+        Returns:
+            匹配的线路列表，完全匹配、前缀匹配、子串匹配依次排列
         """
-        results = []
-        for station in self.stations.values():
-            if name.lower() in station.name.lower():
-                results.append(station)
-        return results
+        return [self.routes[rid] for _, rid, _ in self.name_index.search(name, kind=ROUTE)]
 
     def get_statistics(self) -> Dict:
         """获取网络统计信息"""
@@ -137,6 +460,9 @@ class TransitGraph:
             'total_stations': len(self.stations),
             'total_routes': len(self.routes),
             'total_edges': sum(len(neighbors) for neighbors in self.graph.values()),
+            'total_footpaths': sum(len(paths) for paths in self.footpaths.values()),
+            'total_calendars': len(self.calendars),
+            'total_schedule_variants': sum(len(variants) for variants in self.schedule_variants.values()),
             'cities': len(set(s.city for s in self.stations.values())),
             'districts': len(set(s.district for s in self.stations.values()))
         }
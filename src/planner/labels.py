@@ -0,0 +1,89 @@
+"""
+搜索标签存储模块
+
+搜索过程中的每个状态只记录一条标签（站点、线路、行驶时间、等待时间、前驱标签），
+队列中只保存标签编号，完整路径仅在需要时沿前驱指针回溯一次。
+"""
+from array import array
+from typing import List, Tuple
+
+# 没有前驱的标签（搜索起点）
+NO_PARENT = -1
+
+
+class LabelStore:
+    """预分配数组存储的搜索标签"""
+
+    def __init__(self, capacity: int = 1024):
+        """
+        初始化标签存储
+
+        Args:
+            capacity: 初始容量（不足时自动翻倍）
+        """
+        self.capacity = max(1, capacity)
+        self.size = 0
+        self.stations = array('i', [0]) * self.capacity
+        self.routes = array('i', [0]) * self.capacity
+        self.travel_times = array('i', [0]) * self.capacity
+        self.waiting_times = array('i', [0]) * self.capacity
+        self.parents = array('i', [0]) * self.capacity
+
+    def _grow(self):
+        """容量翻倍"""
+        for name in ('stations', 'routes', 'travel_times', 'waiting_times', 'parents'):
+            column = getattr(self, name)
+            column.extend(array('i', [0]) * self.capacity)
+        self.capacity *= 2
+
+    def add(self, station: int, route: int, travel_time: int = 0,
+            waiting_time: int = 0, parent: int = NO_PARENT) -> int:
+        """
+        添加标签
+
+        Args:
+            station: 站点编号
+            route: 线路编号
+            travel_time: 从前驱标签到此的行驶时间（分钟）
+            waiting_time: 在此上车前的等待时间（分钟）
+            parent: 前驱标签编号
+
+        Returns:
+            新标签编号
+        """
+        if self.size == self.capacity:
+            self._grow()
+
+        label = self.size
+        self.stations[label] = station
+        self.routes[label] = route
+        self.travel_times[label] = travel_time
+        self.waiting_times[label] = waiting_time
+        self.parents[label] = parent
+        self.size += 1
+        return label
+
+    def unwind(self, label: int) -> List[int]:
+        """
+        沿前驱指针回溯
+
+        Args:
+            label: 终点标签编号
+
+        Returns:
+            从起点到该标签的标签编号列表
+        """
+        labels = []
+        while label != NO_PARENT:
+            labels.append(label)
+            label = self.parents[label]
+        labels.reverse()
+        return labels
+
+    def get(self, label: int) -> Tuple[int, int, int, int]:
+        """获取标签内容 (station, route, travel_time, waiting_time)"""
+        return (self.stations[label], self.routes[label],
+                self.travel_times[label], self.waiting_times[label])
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,127 @@
+"""
+多对多出行矩阵模块
+
+每个起点只执行一次一对多RAPTOR搜索，得到到所有终点的总时间、换乘次数和票价；
+起点可以分散到进程池中并行计算。结果按起点逐行以紧凑数组返回。
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.planner.network import CompiledNetwork
+from src.planner.raptor import RaptorRouter
+
+# 不可达时的取值
+UNREACHABLE = -1
+
+# 矩阵的一行：(起点站ID, 总时间, 换乘次数, 票价)
+MatrixRow = Tuple[str, array, array, array]
+
+# 进程池中每个工作进程持有的网络
+_worker_network: Optional[CompiledNetwork] = None
+
+
+def compute_row(network: CompiledNetwork, source: int, targets: List[int],
+                depart: int, max_transfers: int = 3) -> Tuple[array, array, array]:
+    """
+    计算一个起点到所有终点的出行指标
+
+    Args:
+        network: 编译后的公交网络
+        source: 起点站编号
+        targets: 终点站编号列表
+        depart: 出发时刻（当天零点起的分钟数）
+        max_transfers: 最大换乘次数
+
+    Returns:
+        (总时间, 换乘次数, 票价) 三个与targets等长的数组，不可达为UNREACHABLE
+    """
+    arrivals, parents = RaptorRouter(network).scan(source, depart, max_transfers)
+
+    # 每个站点的最早到达轮次（后面的轮次到达更早）
+    best_round = {source: 0}
+    for k in range(1, len(arrivals)):
+        for s in arrivals[k]:
+            best_round[s] = k
+
+    times = array('i')
+    transfers = array('i')
+    fares = array('d')
+    for target in targets:
+        k = best_round.get(target)
+        if k is None:
+            times.append(UNREACHABLE)
+            transfers.append(UNREACHABLE)
+            fares.append(UNREACHABLE)
+            continue
+
+        times.append(arrivals[k][target] - depart)
+        transfers.append(max(k - 1, 0))
+
+        # 沿回溯信息累加各段线路票价
+        fare = 0.0
+        s = target
+        while k > 0:
+            r, board_pos, _, _, _ = parents[k][s]
+            fare += network.route_prices[r]
+            s = network.stop_at(r, board_pos)
+            k -= 1
+        fares.append(fare)
+
+    return times, transfers, fares
+
+
+def _init_worker(network: CompiledNetwork):
+    """工作进程初始化：保存网络，避免每个任务重复传输"""
+    global _worker_network
+    _worker_network = network
+
+
+def _worker_row(args: Tuple[int, List[int], int, int]) -> Tuple[array, array, array]:
+    """工作进程任务：计算一行"""
+    source, targets, depart, max_transfers = args
+    return compute_row(_worker_network, source, targets, depart, max_transfers)
+
+
+def iter_matrix(network: CompiledNetwork, origins: List[str], destinations: List[str],
+                depart: int, max_transfers: int = 3, workers: int = 1) -> Iterator[MatrixRow]:
+    """
+    逐行计算出行矩阵
+
+    Args:
+        network: 编译后的公交网络
+        origins: 起点站ID列表（不存在的站点整行不可达）
+        destinations: 终点站ID列表
+        depart: 出发时刻（当天零点起的分钟数）
+        max_transfers: 最大换乘次数
+        workers: 并行进程数（1表示在当前进程中计算）
+
+    Yields:
+        (起点站ID, 总时间, 换乘次数, 票价)，按origins顺序
+    """
+    # 不存在的终点映射为一个不会被到达的编号
+    targets = [network.station_index.get(sid, network.station_count) for sid in destinations]
+    unreachable_row = (array('i', [UNREACHABLE]) * len(targets),
+                       array('i', [UNREACHABLE]) * len(targets),
+                       array('d', [UNREACHABLE]) * len(targets))
+    tasks = [(network.station_index.get(sid), targets, depart, max_transfers) for sid in origins]
+
+    if workers <= 1:
+        for origin, (source, *_) in zip(origins, tasks):
+            if source is None:
+                yield (origin,) + unreachable_row
+            else:
+                yield (origin,) + compute_row(network, source, targets, depart, max_transfers)
+        return
+
+    valid = [task for task in tasks if task[0] is not None]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(network,)) as executor:
+        results = executor.map(_worker_row, valid, chunksize=max(1, len(valid) // (workers * 4)))
+        for origin, task in zip(origins, tasks):
+            if task[0] is None:
+                yield (origin,) + unreachable_row
+            else:
+                yield (origin,) + next(results)
@@ -0,0 +1,152 @@
+"""
+规划指标模块
+
+记录路线规划各阶段（参数校验、直达检查、搜索、方案构建、序列化）的耗时直方图，
+以及搜索标签的入队/出队次数和方案大小，按Prometheus文本格式输出。
+
+多进程部署时，工作进程用 collect() 取出并清空本进程的增量，交给主进程 merge() 合并。
+"""
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List, Sequence, Tuple
+
+# 阶段耗时直方图的上界（秒）
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 方案大小直方图的上界（行程段数，pareto为方案数）
+RESULT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12)
+
+
+class Histogram:
+    """直方图：每组标签值一行累计计数"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各桶计数..., 总和, 总数]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...]):
+        """记录一次观测（调用方持有锁）"""
+        row = self.series.get(labels)
+        if row is None:
+            row = self.series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, row in sorted(self.series.items()):
+            pairs = [f'{name}="{value}"' for name, value in zip(self.labelnames, labels)]
+            for bound, count in zip(self.buckets + ('+Inf',), row[:len(self.buckets)] + [row[-1]]):
+                bucket_pairs = ','.join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_pairs}}} {count}")
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ''
+            lines.append(f"{self.name}_sum{suffix} {row[-2]:g}")
+            lines.append(f"{self.name}_count{suffix} {row[-1]}")
+        return lines
+
+
+class Counter:
+    """计数器：每组标签值一个累计值"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float, labels: Tuple[str, ...]):
+        """累加（调用方持有锁）"""
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            pairs = ','.join(f'{name}="{v}"' for name, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{pairs}}} {value:g}")
+        return lines
+
+
+class PlannerMetrics:
+    """路线规划指标"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.stage_seconds = Histogram('bus_plan_stage_seconds', '路线规划各阶段耗时（秒）',
+                                       ('stage', 'algorithm'), STAGE_BUCKETS)
+        self.result_size = Histogram('bus_plan_result_size', '方案行程段数（pareto为方案数）',
+                                     ('algorithm',), RESULT_BUCKETS)
+        self.labels_pushed = Counter('bus_plan_labels_pushed_total', '搜索标签入队次数', ('algorithm',))
+        self.labels_popped = Counter('bus_plan_labels_popped_total', '搜索标签出队次数', ('algorithm',))
+        self.requests = Counter('bus_plan_requests_total', '路线规划请求数', ('algorithm', 'status'))
+
+    @property
+    def _metrics(self):
+        return (self.stage_seconds, self.result_size, self.labels_pushed, self.labels_popped, self.requests)
+
+    def observe_stage(self, stage: str, algorithm: str, seconds: float):
+        """记录阶段耗时"""
+        with self._lock:
+            self.stage_seconds.observe(seconds, (stage, algorithm))
+
+    @contextmanager
+    def stage(self, stage: str, algorithm: str):
+        """计时上下文：with metrics.stage('search', 'dijkstra'): ..."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, algorithm, perf_counter() - start)
+
+    def count_labels(self, algorithm: str, pushed: int, popped: int):
+        """记录一次搜索的标签入队/出队次数"""
+        with self._lock:
+            self.labels_pushed.inc(pushed, (algorithm,))
+            self.labels_popped.inc(popped, (algorithm,))
+
+    def observe_result(self, algorithm: str, size: int):
+        """记录方案大小"""
+        with self._lock:
+            self.result_size.observe(size, (algorithm,))
+
+    def count_request(self, algorithm: str, status: int):
+        """记录一次规划请求及其HTTP状态码"""
+        with self._lock:
+            self.requests.inc(1, (algorithm, str(status)))
+
+    def collect(self) -> list:
+        """取出并清空本进程记录的全部数据（供主进程合并）"""
+        with self._lock:
+            state = [metric.series for metric in self._metrics]
+            for metric in self._metrics:
+                metric.series = {}
+        return state
+
+    def merge(self, state: list):
+        """合并collect()取出的数据"""
+        with self._lock:
+            for metric, series in zip(self._metrics, state):
+                for labels, value in series.items():
+                    if isinstance(metric, Counter):
+                        metric.inc(value, labels)
+                        continue
+                    row = metric.series.get(labels)
+                    if row is None:
+                        metric.series[labels] = list(value)
+                    else:
+                        metric.series[labels] = [a + b for a, b in zip(row, value)]
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        with self._lock:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
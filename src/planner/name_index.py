@@ -0,0 +1,384 @@
+"""
+站点与线路名称索引
+
+- n-gram倒排索引：子串查询只需求几个gram倒排表的交集，再校验候选
+- 前缀索引：按键排序的表（展开的前缀树），前缀查询用二分定位区间；
+  命中条目很多的短前缀预先保存排名靠前的结果，供逐字输入的自动补全使用
+- 拼音键：安装pypinyin时，为中文名称额外建立全拼和首字母键（如"kejiyuan"、"kjy"）
+- 建立后可逐个增删条目、修改热度（线路增删时使用），只更新涉及的键、gram和热门前缀
+"""
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # 拼音检索为可选功能
+    lazy_pinyin = None
+
+# 条目类型
+STATION = 'station'
+ROUTE = 'route'
+
+# 键的来源：名称本身 / 拼音（全拼或首字母）
+SOURCE_NAME = 0
+SOURCE_PINYIN = 1
+
+# 匹配方式（排名由高到低）
+MATCH_EXACT = 0
+MATCH_PREFIX = 1
+MATCH_SUBSTRING = 2
+_MATCH_NAMES = ('exact', 'prefix', 'substring')
+
+# 前缀区间内条目超过该数量时，使用预先保存的排名结果
+SCAN_LIMIT = 256
+
+# 每个热门前缀保存的结果数
+TOP_K = 20
+
+# 搜索结果：(条目类型, ID, 匹配方式)
+SearchHit = Tuple[str, str, str]
+
+_MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize(text: str) -> str:
+    """归一化：去掉空白并忽略大小写"""
+    return ''.join(text.split()).casefold()
+
+
+def pinyin_keys(name: str) -> List[str]:
+    """中文名称的全拼和首字母键（未安装pypinyin时为空）"""
+    if lazy_pinyin is None:
+        return []
+    full = normalize(''.join(lazy_pinyin(name)))
+    initials = normalize(''.join(lazy_pinyin(name, style=Style.FIRST_LETTER)))
+    return [key for key in dict.fromkeys((full, initials)) if key and key != normalize(name)]
+
+
+class NameIndex:
+    """站点与线路名称索引"""
+
+    def __init__(self):
+        # 条目表
+        self.kinds: List[str] = []
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.weights = array('i')   # 热度：站点为途经线路数，线路为站点数
+        # 条目的检索键，已移除的条目为None（条目编号不复用）
+        self._entry_keys: List[Optional[List[Tuple[str, int]]]] = []
+        # (条目类型, ID) -> 条目编号
+        self._entry_index: Dict[Tuple[str, str], int] = {}
+        self._removed = 0
+        self._built = False
+
+        # 前缀索引：按键排序
+        self._keys: List[str] = []
+        self._key_entries = array('i')
+        self._key_sources = array('b')
+        self._popular: Dict[str, Dict[Optional[str], List[Tuple[tuple, int]]]] = {}
+
+        # n-gram倒排索引：gram -> 条目编号
+        self._grams: Dict[str, array] = {}
+
+    @classmethod
+    def from_graph(cls, graph) -> 'NameIndex':
+        """
+        为公交网络图中的站点和线路建立索引
+
+        Args:
+            graph: TransitGraph对象
+
+        Returns:
+            名称索引
+        """
+        index = cls()
+        for station in graph.stations.values():
+            index.add(STATION, station.station_id, station.name,
+                      len(graph.station_routes.get(station.station_id, ())))
+        for route in graph.routes.values():
+            index.add(ROUTE, route.route_id, route.route_name, len(route.station_ids))
+        return index.build()
+
+    def add(self, kind: str, item_id: str, name: str, weight: int = 0,
+            keys: List[Tuple[str, int]] = None):
+        """
+        登记一个条目（全部登记后调用build()；build()之后登记的条目直接加入索引）
+
+        Args:
+            kind: 条目类型（STATION/ROUTE）
+            item_id: 站点或线路ID
+            name: 名称
+            weight: 热度
+            keys: 检索键 [(键, 来源)]（如从快照读入的键），如果为None，由名称和拼音生成
+        """
+        entry = len(self.ids)
+        self._entry_index[(kind, item_id)] = entry
+        self.kinds.append(kind)
+        self.ids.append(item_id)
+        self.names.append(name)
+        self.weights.append(weight)
+
+        if keys is None:
+            keys = [(normalize(name), SOURCE_NAME)]
+            keys.extend((key, SOURCE_PINYIN) for key in pinyin_keys(name))
+        self._entry_keys.append(keys)
+
+        grams = set()
+        for key, _ in keys:
+            grams.update(key)
+            grams.update(key[i:i + 2] for i in range(len(key) - 1))
+        for gram in grams:
+            postings = self._grams.get(gram)
+            if postings is None:
+                postings = self._grams[gram] = array('i')
+            postings.append(entry)
+
+        if self._built:
+            for key, source in keys:
+                i = bisect_left(self._keys, key)
+                i = self._key_position(i, key, source, entry)
+                self._keys.insert(i, key)
+                self._key_entries.insert(i, entry)
+                self._key_sources.insert(i, source)
+            self._update_popular(entry)
+
+    def _key_position(self, i: int, key: str, source: int, entry: int) -> int:
+        """前缀索引中 (键, 来源, 条目) 的位置（与build()的排序一致），i为该键的第一个位置"""
+        while (i < len(self._keys) and self._keys[i] == key
+               and (self._key_sources[i], self._key_entries[i]) < (source, entry)):
+            i += 1
+        return i
+
+    def remove(self, kind: str, item_id: str) -> bool:
+        """
+        移除一个条目（build()之后使用）
+
+        Args:
+            kind: 条目类型（STATION/ROUTE）
+            item_id: 站点或线路ID
+
+        Returns:
+            条目是否存在
+        """
+        entry = self._entry_index.pop((kind, item_id), None)
+        if entry is None:
+            return False
+        keys = self._entry_keys[entry]
+        self._entry_keys[entry] = None
+        self._removed += 1
+
+        for key, source in keys:
+            i = self._key_position(bisect_left(self._keys, key), key, source, entry)
+            del self._keys[i]
+            del self._key_entries[i]
+            del self._key_sources[i]
+
+        grams = set()
+        for key, _ in keys:
+            grams.update(key)
+            grams.update(key[i:i + 2] for i in range(len(key) - 1))
+        for gram in grams:
+            postings = self._grams[gram]
+            postings.remove(entry)
+            if not postings:
+                del self._grams[gram]
+
+        self._update_popular(entry, keys)
+        return True
+
+    def set_weight(self, kind: str, item_id: str, weight: int):
+        """修改条目的热度（build()之后使用，如站点途经的线路数变化）"""
+        entry = self._entry_index.get((kind, item_id))
+        if entry is not None and self.weights[entry] != weight:
+            self.weights[entry] = weight
+            self._update_popular(entry)
+
+    def _update_popular(self, entry: int, keys: List[Tuple[str, int]] = None):
+        """
+        条目增删或热度变化后更新其各键的前缀的热门结果
+
+        条目原来就在某个前缀的热门结果中（排名可能变差或已移除）时重新排序该前缀区间，
+        否则只把条目插入热门结果；区间缩小到SCAN_LIMIT以内的前缀不再保存热门结果
+
+        Args:
+            entry: 条目编号
+            keys: 条目的检索键（已移除的条目需要传入移除前的键）
+        """
+        alive = keys is None
+        if alive:
+            keys = self._entry_keys[entry]
+        prefixes = {key[:length] for key, _ in keys for length in range(1, len(key) + 1)}
+        for prefix in prefixes:
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_left(self._keys, prefix + _MAX_CHAR, lo)
+            if hi - lo <= SCAN_LIMIT:
+                self._popular.pop(prefix, None)
+                continue
+
+            popular = self._popular.get(prefix)
+            if popular is None or any(item == entry for ranked in popular.values() for _, item in ranked):
+                self._popular[prefix] = self._top(self._rank_range(lo, hi, prefix))
+            elif alive:
+                rank = min((MATCH_EXACT if key == prefix else MATCH_PREFIX, source) + self._rank(entry)
+                           for key, source in keys if key.startswith(prefix))
+                for kind in (None, self.kinds[entry]):
+                    insort(popular[kind], (rank, entry))
+                    del popular[kind][TOP_K:]
+
+    def entries(self):
+        """
+        逐个返回登记的条目（用于保存快照，加载时按相同参数调用add()即可重建，不需要重新生成拼音键）
+
+        Yields:
+            (条目类型, ID, 名称, 热度, 检索键 [(键, 来源)])
+        """
+        for entry, keys in enumerate(self._entry_keys):
+            if keys is not None:
+                yield self.kinds[entry], self.ids[entry], self.names[entry], self.weights[entry], keys
+
+    def _rank(self, entry: int) -> tuple:
+        """同一匹配方式内的排序：热度高、名称短的优先"""
+        return (-self.weights[entry], len(self.names[entry]), self.names[entry])
+
+    def build(self) -> 'NameIndex':
+        """建立前缀索引"""
+        rows = sorted((key, source, entry)
+                      for entry, keys in enumerate(self._entry_keys) if keys is not None
+                      for key, source in keys)
+        self._keys = [key for key, _, _ in rows]
+        self._key_entries = array('i', (entry for _, _, entry in rows))
+        self._key_sources = array('b', (source for _, source, _ in rows))
+
+        # 热门前缀：逐层按前缀分组，区间过大的前缀保存排名结果
+        self._popular = {}
+        length = 1
+        groups = [(0, len(rows))]
+        while groups:
+            next_groups = []
+            for lo, hi in groups:
+                i = lo
+                while i < hi:
+                    if len(self._keys[i]) < length:
+                        i += 1
+                        continue
+                    prefix = self._keys[i][:length]
+                    j = bisect_left(self._keys, prefix + _MAX_CHAR, i, hi)
+                    if j - i > SCAN_LIMIT:
+                        self._popular[prefix] = self._top(self._rank_range(i, j, prefix))
+                        next_groups.append((i, j))
+                    i = j
+            groups = next_groups
+            length += 1
+        self._built = True
+        return self
+
+    def _rank_range(self, lo: int, hi: int, prefix: str) -> List[Tuple[tuple, int]]:
+        """对前缀区间内的条目排序"""
+        best: Dict[int, tuple] = {}
+        for i in range(lo, hi):
+            entry = self._key_entries[i]
+            match = MATCH_EXACT if self._keys[i] == prefix else MATCH_PREFIX
+            rank = (match, self._key_sources[i]) + self._rank(entry)
+            if entry not in best or rank < best[entry]:
+                best[entry] = rank
+        return sorted((rank, entry) for entry, rank in best.items())
+
+    def _top(self, ranked: List[Tuple[tuple, int]]) -> Dict[Optional[str], List[Tuple[tuple, int]]]:
+        """按条目类型分别保存排名靠前的结果"""
+        top = {None: ranked[:TOP_K]}
+        for kind in (STATION, ROUTE):
+            top[kind] = [item for item in ranked if self.kinds[item[1]] == kind][:TOP_K]
+        return top
+
+    def _filter(self, ranked: List[Tuple[tuple, int]], kind: Optional[str],
+                limit: Optional[int]) -> List[SearchHit]:
+        hits = []
+        for rank, entry in ranked:
+            if kind is not None and self.kinds[entry] != kind:
+                continue
+            match = _MATCH_NAMES[rank[0]] if rank[1] == SOURCE_NAME else 'pinyin'
+            hits.append((self.kinds[entry], self.ids[entry], match))
+            if limit is not None and len(hits) >= limit:
+                break
+        return hits
+
+    def autocomplete(self, prefix: str, kind: str = None, limit: Optional[int] = 10) -> List[SearchHit]:
+        """
+        前缀补全
+
+        Args:
+            prefix: 输入的前缀（名称、全拼或拼音首字母）
+            kind: 只返回某类条目（STATION/ROUTE），None表示全部
+            limit: 最多返回的条目数（如果为None，返回全部）
+
+        Returns:
+            [(条目类型, ID, 匹配方式)]，按匹配方式、热度排序
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        popular = self._popular.get(prefix)
+        if popular is not None and limit is not None and limit <= TOP_K:
+            return self._filter(popular.get(kind, []), kind, limit)
+
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + _MAX_CHAR, lo)
+        return self._filter(self._rank_range(lo, hi, prefix), kind, limit)
+
+    def search(self, query: str, kind: str = None, limit: int = None) -> List[SearchHit]:
+        """
+        子串搜索
+
+        Args:
+            query: 关键字（名称、全拼或拼音首字母的任意片段）
+            kind: 只返回某类条目（STATION/ROUTE），None表示全部
+            limit: 最多返回的条目数（如果为None，返回全部）
+
+        Returns:
+            [(条目类型, ID, 匹配方式)]，完全匹配、前缀匹配、子串匹配依次排列
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        grams = [query] if len(query) == 1 else {query[i:i + 2] for i in range(len(query) - 1)}
+        postings = []
+        for gram in grams:
+            entries = self._grams.get(gram)
+            if entries is None:
+                return []
+            postings.append(entries)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for entries in postings[1:]:
+            candidates.intersection_update(entries)
+            if not candidates:
+                return []
+
+        ranked = []
+        for entry in candidates:
+            best = None
+            for key, source in self._entry_keys[entry]:
+                position = key.find(query)
+                if position < 0:
+                    continue
+                if key == query:
+                    match = MATCH_EXACT
+                elif position == 0:
+                    match = MATCH_PREFIX
+                else:
+                    match = MATCH_SUBSTRING
+                rank = (match, source) + self._rank(entry)
+                if best is None or rank < best:
+                    best = rank
+            if best is not None:
+                ranked.append((best, entry))
+        ranked.sort()
+        return self._filter(ranked, kind, limit)
+
+    def __len__(self):
+        return len(self.ids) - self._removed
@@ -0,0 +1,882 @@
+"""
+编译后的公交网络模块
+
+将TransitGraph中以字符串ID为键的对象图编译为整数编号、数组存储的只读网络，
+供各路径规划算法在热路径上使用。
+
+行驶时间随时段变化的路段引用去重后的行驶时间曲线（相同曲线只存一份），按实际到站时刻求值；
+这类线路如有时刻表，另按班次预先推算各站的到站时刻，供上车时二分查找。
+
+编译时还将时刻表按班次展开为按出发时刻排序的"连接"数组（CSA使用），随网络写入快照；
+线路更新和按服务日切换时刻表时只插入受影响线路的新连接，旧班次标记为已移除。
+"""
+import copy
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from operator import and_, itemgetter, lshift, or_
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.models import Schedule, TravelTimeProfile, time_to_minutes
+from src.models.profile import interpolate
+
+# 数组中表示"无"的取值（如线路没有时刻表）
+NONE = -1
+
+# 步行：搜索状态和标签中代替线路编号
+WALK = -2
+
+# 线路当天停运时的发车间隔（有时刻表，但没有班次）
+NO_SERVICE = 0
+
+
+class CompiledNetwork:
+    """整数编号、数组存储的只读公交网络"""
+
+    def __init__(self, station_ids: List[str], route_ids: List[str],
+                 route_stop_start: array, route_stops: array, route_offsets: array,
+                 station_route_start: array, station_route_routes: array,
+                 station_route_positions: array, route_first: array,
+                 route_last: array, route_interval: array, route_prices: array,
+                 footpath_start: array = None, footpath_targets: array = None,
+                 footpath_times: array = None, departure_start: array = None,
+                 departures: array = None, segment_profiles: array = None,
+                 profile_start: array = None, profile_times: array = None,
+                 profile_durations: array = None, trip_time_start: array = None,
+                 trip_times: array = None, connection_departures: array = None,
+                 connection_arrivals: array = None, connection_from_stations: array = None,
+                 connection_to_stations: array = None, connection_trips: array = None,
+                 trip_routes: array = None, route_first_trip: array = None,
+                 route_trip_count: array = None):
+        """
+        初始化编译网络（一般通过TransitGraph.compile()构建）
+
+        Args:
+            station_ids: 站点编号 -> 站点ID
+            route_ids: 线路编号 -> 线路ID
+            route_stop_start: 线路r的站序位于route_stops[route_stop_start[r]:route_stop_start[r+1]]
+                （紧凑存储；就地更新后切片的终点见route_stop_end等*_end数组）
+            route_stops: 所有线路的站序（站点编号）
+            route_offsets: 与route_stops对应的到站时间偏移（分钟）
+            station_route_start: 站点s的经停记录位于station_route_*[station_route_start[s]:station_route_start[s+1]]
+            station_route_routes: 经停记录的线路编号
+            station_route_positions: 经停记录在线路站序中的位置
+            route_first: 线路首班车时刻（分钟），无时刻表为NONE
+            route_last: 线路末班车时刻（分钟），无时刻表为NONE
+            route_interval: 线路发车间隔（分钟），无时刻表为NONE，当天停运为NO_SERVICE
+            route_prices: 线路票价（元）
+            footpath_start: 站点s的步行边位于footpath_*[footpath_start[s]:footpath_start[s+1]]（可选）
+            footpath_targets: 步行边的目标站点编号
+            footpath_times: 步行边的步行时间（分钟）
+            departure_start: 线路r的发车时刻表位于departures[departure_start[r]:departure_start[r+1]]（可选，
+                缺省时按首末班车和发车间隔生成）
+            departures: 所有线路在首站的发车时刻（分钟，每条线路内递增）
+            segment_profiles: 与route_stops对应，从该站到下一站的行驶时间曲线编号，NONE表示按时间偏移之差（可选）
+            profile_start: 曲线p的拐点位于profile_*[profile_start[p]:profile_start[p+1]]
+            profile_times: 拐点的出发时刻（分钟）
+            profile_durations: 拐点的行驶时间（分钟）
+            trip_time_start: 线路r各班次在各站的时刻位于trip_times[trip_time_start[r]:trip_time_start[r+1]]，
+                按站存储（第pos站第j班为trip_times[trip_time_start[r] + pos * 班次数 + j]），
+                只有使用行驶时间曲线且有时刻表的线路才有（可选，缺省时按发车时刻表推算）
+            trip_times: 所有这类线路各班次的到站时刻（分钟）
+            connection_departures: 第i个连接（某班车从一站开往下一站）的出发时刻，按出发、到达时刻排序（可选，
+                缺省时按时刻表展开）
+            connection_arrivals: 连接的到达时刻
+            connection_from_stations: 连接的出发站点编号
+            connection_to_stations: 连接的到达站点编号
+            connection_trips: 连接所属的班次编号
+            trip_routes: 班次编号 -> 线路编号，已移除的班次为NONE
+            route_first_trip: 线路r的班次编号为route_first_trip[r]起的route_trip_count[r]个
+            route_trip_count: 线路的班次数
+        """
+        self.station_ids = tuple(station_ids)
+        self.route_ids = tuple(route_ids)
+        self.station_index: Dict[str, int] = {sid: i for i, sid in enumerate(self.station_ids)}
+        self.route_index: Dict[str, int] = {rid: i for i, rid in enumerate(self.route_ids)}
+
+        self.route_stop_start = route_stop_start
+        self.route_stops = route_stops
+        self.route_offsets = route_offsets
+        self.station_route_start = station_route_start
+        self.station_route_routes = station_route_routes
+        self.station_route_positions = station_route_positions
+        # 各切片的终点（紧凑存储时即下一切片的起点）：就地更新（patch_route）时新切片不长于原切片则原位写入，
+        # 否则追加到数组末尾，原位置留下空隙，空隙过多时再压缩（见 _write_slice）
+        self.route_stop_end = route_stop_start[1:]
+        self.station_route_end = station_route_start[1:]
+        self.route_first = route_first
+        self.route_last = route_last
+        self.route_interval = route_interval
+        self.route_prices = route_prices
+
+        if footpath_start is None:
+            footpath_start = array('i', [0]) * (len(self.station_ids) + 1)
+            footpath_targets = array('i')
+            footpath_times = array('i')
+        self.footpath_start = footpath_start
+        self.footpath_targets = footpath_targets
+        self.footpath_times = footpath_times
+
+        if departure_start is None:
+            departure_start = array('i', [0])
+            departures = array('i')
+            for r in range(len(self.route_ids)):
+                if route_interval[r] > 0:
+                    departures.extend(range(route_first[r], route_last[r] + 1, route_interval[r]))
+                departure_start.append(len(departures))
+        self.departure_start = departure_start
+        self.departure_end = departure_start[1:]
+        self.departures = departures
+
+        if segment_profiles is None:
+            segment_profiles = array('i', [NONE]) * len(route_stops)
+            profile_start = array('i', [0])
+            profile_times = array('i')
+            profile_durations = array('i')
+        self.segment_profiles = segment_profiles
+        self.profile_start = profile_start
+        self.profile_times = profile_times
+        self.profile_durations = profile_durations
+
+        # 使用行驶时间曲线的线路编号
+        self.profiled_routes: FrozenSet[int] = frozenset()
+        if len(profile_start) > 1:
+            self.profiled_routes = frozenset(
+                r for r in range(len(self.route_ids))
+                if any(p != NONE for p in segment_profiles[route_stop_start[r]:route_stop_start[r + 1]])
+            )
+
+        if trip_time_start is None:
+            trip_time_start, trip_times = self._build_trip_times()
+        self.trip_time_start = trip_time_start
+        self.trip_time_end = trip_time_start[1:]
+        self.trip_times = trip_times
+
+        if connection_departures is None:
+            (connection_departures, connection_arrivals, connection_from_stations, connection_to_stations,
+             connection_trips, trip_routes, route_first_trip, route_trip_count) = self._build_connections()
+        self.connection_departures = connection_departures
+        self.connection_arrivals = connection_arrivals
+        self.connection_from_stations = connection_from_stations
+        self.connection_to_stations = connection_to_stations
+        self.connection_trips = connection_trips
+        self.trip_routes = trip_routes
+        self.route_first_trip = route_first_trip
+        self.route_trip_count = route_trip_count
+        # 已移除（仍留在连接数组中）的班次数，超过有效班次数时压缩连接数组
+        self.removed_trips = 0
+
+        # 反向步行边CSR（双向搜索的后向扩展使用，首次使用时构建）
+        self._reverse_footpaths: Optional[Tuple[array, array, array]] = None
+
+        # 就地更新（patch_route）的次数，基于本网络预先计算的数据（规划器、换乘模式）据此判断是否过期
+        self.revision = 0
+        # 各组切片（route_stop、station_route、departure、trip_time）中空隙的总长度
+        self._unused: Dict[str, int] = {}
+        # 行驶时间曲线 -> 曲线编号（就地更新时首次使用才构建，新线路的曲线与已有曲线去重）
+        self._profile_index: Optional[Dict[TravelTimeProfile, int]] = None
+
+    @classmethod
+    def from_graph(cls, graph) -> 'CompiledNetwork':
+        """
+        从公交网络图编译
+
+        Args:
+            graph: TransitGraph对象
+
+        Returns:
+            编译后的网络
+        """
+        station_ids = list(graph.stations.keys())
+        station_index = {sid: i for i, sid in enumerate(station_ids)}
+
+        def index_station(station_id: str) -> int:
+            # 线路上引用但未登记的站点也需要编号
+            if station_id not in station_index:
+                station_index[station_id] = len(station_ids)
+                station_ids.append(station_id)
+            return station_index[station_id]
+
+        route_ids = []
+        route_stop_start = array('i', [0])
+        route_stops = array('i')
+        route_offsets = array('i')
+        route_first = array('i')
+        route_last = array('i')
+        route_interval = array('i')
+        route_prices = array('d')
+        departure_start = array('i', [0])
+        departures = array('i')
+        segment_profiles = array('i')
+        profile_start = array('i', [0])
+        profile_times = array('i')
+        profile_durations = array('i')
+        profile_index: Dict[TravelTimeProfile, int] = {}  # 相同的曲线只存一份
+        entries: List[List[Tuple[int, int]]] = []  # station -> [(route, position)]
+
+        def index_profile(profile: TravelTimeProfile) -> int:
+            if profile not in profile_index:
+                profile_index[profile] = len(profile_index)
+                profile_times.extend(profile.times)
+                profile_durations.extend(profile.durations)
+                profile_start.append(len(profile_times))
+            return profile_index[profile]
+
+        for route in graph.routes.values():
+            r = len(route_ids)
+            route_ids.append(route.route_id)
+
+            stops, offsets, segments, first, last, interval, route_departures = cls._compile_route(
+                route, graph.get_schedule(route.route_id), index_station, index_profile)
+
+            while len(entries) < len(station_ids):
+                entries.append([])
+            for pos, s in enumerate(stops):
+                entries[s].append((r, pos))
+
+            route_stops.extend(stops)
+            route_offsets.extend(offsets)
+            segment_profiles.extend(segments)
+            route_stop_start.append(len(route_stops))
+            route_prices.append(route.price)
+            route_first.append(first)
+            route_last.append(last)
+            route_interval.append(interval)
+            departures.extend(route_departures)
+            departure_start.append(len(departures))
+
+        while len(entries) < len(station_ids):
+            entries.append([])
+
+        # CSR：站点 -> (线路, 位置)
+        station_route_start = array('i', [0])
+        station_route_routes = array('i')
+        station_route_positions = array('i')
+        for station_entries in entries:
+            for r, pos in station_entries:
+                station_route_routes.append(r)
+                station_route_positions.append(pos)
+            station_route_start.append(len(station_route_routes))
+
+        # CSR：站点 -> 步行边（步行边只连接已登记的站点）
+        footpaths = getattr(graph, 'footpaths', {})
+        footpath_start = array('i', [0])
+        footpath_targets = array('i')
+        footpath_times = array('i')
+        for station_id in station_ids:
+            for other_id, minutes in footpaths.get(station_id, ()):
+                if other_id in station_index:
+                    footpath_targets.append(station_index[other_id])
+                    footpath_times.append(minutes)
+            footpath_start.append(len(footpath_targets))
+
+        return cls(station_ids, route_ids, route_stop_start, route_stops, route_offsets,
+                   station_route_start, station_route_routes, station_route_positions,
+                   route_first, route_last, route_interval, route_prices,
+                   footpath_start, footpath_targets, footpath_times,
+                   departure_start, departures, segment_profiles,
+                   profile_start, profile_times, profile_durations)
+
+    @staticmethod
+    def _compile_route(route, schedule: Optional[Schedule], index_station, index_profile) -> Tuple:
+        """
+        编译单条线路
+
+        Args:
+            route: BusRoute对象
+            schedule: 该线路每天使用的时刻表（可选）
+            index_station: 站点ID -> 站点编号（未编号的站点分配新编号）
+            index_profile: 行驶时间曲线 -> 曲线编号（新曲线追加到曲线表）
+
+        Returns:
+            (站序, 时间偏移, 各路段曲线编号, 首班车, 末班车, 发车间隔, 首站发车时刻)，无时刻表时后四项为NONE和空表
+        """
+        stops = [index_station(station_id) for station_id in route.station_ids]
+        offsets = list(route.offsets)
+
+        # 环线：与TransitGraph一致，末站之后回到首站
+        if route.is_loop and len(stops) > 1:
+            stops.append(stops[0])
+            offsets.append(offsets[-1] + route.interval)
+
+        # 行驶时间曲线：末站之后没有路段（环线的末站路段回到首站）
+        segments = [NONE] * len(stops)
+        for index, profile in (route.profiles or {}).items():
+            if 0 <= index < len(stops) - 1:
+                segments[index] = index_profile(profile)
+
+        if schedule is None:
+            return stops, offsets, segments, NONE, NONE, NONE, []
+        return (stops, offsets, segments, time_to_minutes(schedule.first_bus),
+                time_to_minutes(schedule.last_bus), schedule.interval, schedule.get_departures())
+
+    def patch_route(self, route_id: str, route=None, schedule: Schedule = None):
+        """
+        就地更新一条线路（TransitGraph移除、替换线路时使用，不重新编译整个网络）
+
+        只改写该线路的站序、时刻表切片和沿线站点的经停记录切片（见 _write_slice），其他切片不动，
+        耗时与线路长度和沿线站点的经停记录数成正比；
+        被移除的线路保留编号，站序和班次为空、当天停运，再次添加同名线路时复用该编号。
+        新线路引用的未编号站点追加在末尾，曲线表中没有的行驶时间曲线追加到曲线表。
+        完成后revision递增
+
+        Args:
+            route_id: 线路ID
+            route: 新的线路对象，None表示移除
+            schedule: 新线路每天使用的时刻表（可选）
+        """
+        r = self.route_index.get(route_id)
+        if r is None and route is None:
+            return
+        self._detach()
+
+        new_stations = []
+
+        def index_station(station_id: str) -> int:
+            if station_id not in self.station_index:
+                self.station_index[station_id] = len(self.station_ids) + len(new_stations)
+                new_stations.append(station_id)
+            return self.station_index[station_id]
+
+        if self._profile_index is None:
+            self._profile_index = {self.profile(p): p for p in range(len(self.profile_start) - 1)}
+        profile_index = self._profile_index
+
+        def index_profile(profile: TravelTimeProfile) -> int:
+            if profile not in profile_index:
+                profile_index[profile] = len(self.profile_start) - 1
+                self.profile_times.extend(profile.times)
+                self.profile_durations.extend(profile.durations)
+                self.profile_start.append(len(self.profile_times))
+            return profile_index[profile]
+
+        if route is None:
+            stops, offsets, segments, first, last, interval, departures = [], [], [], NONE, NONE, NO_SERVICE, []
+            price = 0.0
+        else:
+            stops, offsets, segments, first, last, interval, departures = self._compile_route(
+                route, schedule, index_station, index_profile)
+            price = route.price
+
+        if new_stations:
+            self.station_ids += tuple(new_stations)
+            # 新站点的空切片位于数组末尾（起点数组的最后一项始终为数组长度）
+            self.station_route_end.extend([self.station_route_start[-1]] * len(new_stations))
+            self.station_route_start.extend([self.station_route_start[-1]] * len(new_stations))
+            self.footpath_start.extend([self.footpath_start[-1]] * len(new_stations))
+            self._reverse_footpaths = None
+
+        if r is None:
+            # 新线路：追加空的切片
+            r = len(self.route_ids)
+            self.route_ids += (route_id,)
+            self.route_index[route_id] = r
+            for name in ('route_stop', 'departure', 'trip_time'):
+                start = getattr(self, name + '_start')
+                getattr(self, name + '_end').append(start[-1])
+                start.append(start[-1])
+            self.route_first_trip.append(len(self.trip_routes))
+            self.route_trip_count.append(0)
+            self.route_first.append(NONE)
+            self.route_last.append(NONE)
+            self.route_interval.append(NONE)
+            self.route_prices.append(0.0)
+
+        lo, hi = self.route_stop_start[r], self.route_stop_end[r]
+        old_stops = set(self.route_stops[lo:hi])
+        self._write_slice('route_stop', r, (self.route_stops, self.route_offsets, self.segment_profiles),
+                          (stops, offsets, segments))
+        self._write_slice('departure', r, (self.departures,), (departures,))
+        self.route_first[r] = first
+        self.route_last[r] = last
+        self.route_interval[r] = interval
+        self.route_prices[r] = price
+
+        profiled = r in self.profiled_routes
+        if any(p != NONE for p in segments):
+            self.profiled_routes = self.profiled_routes | {r}
+        elif profiled:
+            self.profiled_routes = self.profiled_routes - {r}
+        if profiled or r in self.profiled_routes:
+            self._write_slice('trip_time', r, (self.trip_times,), (self._route_trip_times(r),))
+        self._replace_connections((r,))
+
+        self._patch_station_routes(r, old_stops, stops)
+        self.revision += 1
+
+    def _detach(self):
+        """以mmap上的memoryview为底层存储的数组复制为可修改的数组（就地更新前调用）"""
+        for name, value in list(self.__dict__.items()):
+            if isinstance(value, memoryview):
+                detached = array(value.format)
+                detached.frombytes(value.cast('B'))
+                setattr(self, name, detached)
+
+    def _write_slice(self, name: str, k: int, columns: Tuple[array, ...], values: Tuple[List, ...]):
+        """
+        把共用起止数组（name_start、name_end）的各数组的第k段替换为values中对应的内容
+
+        新内容不长于原切片时原位写入，否则追加到数组末尾，其他切片都不移动；
+        起点数组的最后一项始终为数组长度。空隙的总长度超过有效内容时整体压缩一次
+
+        Args:
+            name: 切片组名（route_stop、station_route、departure、trip_time）
+            k: 切片编号（线路或站点编号）
+            columns: 共用起止数组的各数组
+            values: 各数组第k段的新内容
+        """
+        start = getattr(self, name + '_start')
+        end = getattr(self, name + '_end')
+        lo, hi = start[k], end[k]
+        length = len(values[0])
+        unused = self._unused.get(name, 0) + hi - lo
+        if length > hi - lo:
+            lo = start[k] = len(columns[0])
+            start[-1] = lo + length
+        else:
+            unused -= length
+        for column, value in zip(columns, values):
+            column[lo:lo + length] = array(column.typecode, value)
+        end[k] = lo + length
+        self._unused[name] = unused
+        if unused > start[-1] - unused:
+            self._compact(name, columns)
+
+    def _compact(self, name: str, columns: Tuple[array, ...]):
+        """按编号顺序重新紧凑存储一组切片，去掉空隙"""
+        start = getattr(self, name + '_start')
+        end = getattr(self, name + '_end')
+        compacted = [array(column.typecode) for column in columns]
+        compact_start = array('i', [0])
+        for k in range(len(end)):
+            for column, result in zip(columns, compacted):
+                result.extend(column[start[k]:end[k]])
+            compact_start.append(len(compacted[0]))
+        for column, result in zip(columns, compacted):
+            column[:] = result
+        start[:] = compact_start
+        end[:] = compact_start[1:]
+        self._unused[name] = 0
+
+    def _patch_station_routes(self, r: int, old_stops, stops: List[int]):
+        """更新线路r沿线（新旧站序）各站点的经停记录切片"""
+        positions: Dict[int, List[int]] = {}
+        for pos, s in enumerate(stops):
+            positions.setdefault(s, []).append(pos)
+
+        columns = (self.station_route_routes, self.station_route_positions)
+        for s in old_stops | positions.keys():
+            lo, hi = self.station_route_start[s], self.station_route_end[s]
+            entries = [(route, pos) for route, pos in zip(self.station_route_routes[lo:hi],
+                                                          self.station_route_positions[lo:hi]) if route != r]
+            entries.extend((r, pos) for pos in positions.get(s, ()))
+            entries.sort()
+            self._write_slice('station_route', s, columns,
+                              ([route for route, _ in entries], [pos for _, pos in entries]))
+
+    def with_schedules(self, schedules: Dict[int, Optional[Schedule]]) -> 'CompiledNetwork':
+        """
+        替换部分线路的时刻表，生成新的网络（用于按服务日切换时刻表）
+
+        站序、换乘、步行边等数组与本网络共用，只重建时刻表相关的数组
+
+        Args:
+            schedules: {线路编号: 时刻表}，None表示该线路停运
+
+        Returns:
+            新的编译网络
+        """
+        route_first = array('i', self.route_first)
+        route_last = array('i', self.route_last)
+        route_interval = array('i', self.route_interval)
+        departure_start = array('i', [0])
+        departures = array('i')
+
+        for r in range(self.route_count):
+            if r not in schedules:
+                departures.extend(self.departures[self.departure_start[r]:self.departure_end[r]])
+            elif schedules[r] is None:
+                route_first[r] = route_last[r] = NONE
+                route_interval[r] = NO_SERVICE
+            else:
+                schedule = schedules[r]
+                route_first[r] = time_to_minutes(schedule.first_bus)
+                route_last[r] = time_to_minutes(schedule.last_bus)
+                route_interval[r] = schedule.interval
+                departures.extend(schedule.get_departures())
+            departure_start.append(len(departures))
+
+        network = copy.copy(self)
+        network.route_first = route_first
+        network.route_last = route_last
+        network.route_interval = route_interval
+        network.departure_start = departure_start
+        network.departure_end = departure_start[1:]
+        network.departures = departures
+        network._unused = dict(self._unused, departure=0)
+        if self.profiled_routes:
+            network.trip_time_start, network.trip_times = network._build_trip_times()
+            network.trip_time_end = network.trip_time_start[1:]
+            network._unused['trip_time'] = 0
+        network._replace_connections(schedules)
+        return network
+
+    def _build_trip_times(self) -> Tuple[array, array]:
+        """按发车时刻表和行驶时间曲线逐站推算各班次的到站时刻（按站存储）"""
+        trip_time_start = array('i', [0])
+        trip_times = array('i')
+        for r in range(len(self.route_ids)):
+            if r in self.profiled_routes:
+                trip_times.extend(self._route_trip_times(r))
+            trip_time_start.append(len(trip_times))
+        return trip_time_start, trip_times
+
+    def _route_trip_times(self, r: int) -> List[int]:
+        """推算线路r各班次在各站的到站时刻（按站存储），没有班次时为空表"""
+        column = list(self.departures[self.departure_start[r]:self.departure_end[r]])
+        if not column:
+            return []
+        trip_times = list(column)
+        for pos in range(self.route_length(r) - 1):
+            column = [t + self.travel_time(r, pos, t) for t in column]
+            trip_times.extend(column)
+        return trip_times
+
+    def _route_connections(self, r: int, first_trip: int) -> Tuple[int, Tuple[List[int], ...]]:
+        """
+        将线路r的时刻表按班次展开为连接
+
+        Args:
+            r: 线路编号
+            first_trip: 第一个班次的编号，之后的班次依次编号
+
+        Returns:
+            (班次数, (出发时刻, 到达时刻, 出发站, 到达站, 班次)五列)，按站序位置、班次排列；
+            没有时刻表或站序不足两站时班次数为0、各列为空
+        """
+        columns = ([], [], [], [], [])
+        length = self.route_length(r)
+        if not self.has_schedule(r) or length < 2:
+            # 没有时刻表的线路无法展开班次
+            return 0, columns
+
+        base = self.route_stop_start[r]
+        stops = self.route_stops[base:base + length]
+        first_departures = self.departures[self.departure_start[r]:self.departure_end[r]]
+        trips = len(first_departures)
+        if r in self.profiled_routes:
+            # 使用行驶时间曲线的线路：各班次在各站的时刻已按站推算（按站存储）
+            lo = self.trip_time_start[r]
+            stop_times = [self.trip_times[lo + pos * trips:lo + (pos + 1) * trips] for pos in range(length)]
+        else:
+            stop_times = [[first + offset for first in first_departures]
+                          for offset in self.route_offsets[base:base + length]]
+
+        departures, arrivals, from_stations, to_stations, trip_ids = columns
+        for pos in range(length - 1):
+            departures.extend(stop_times[pos])
+            arrivals.extend(stop_times[pos + 1])
+            from_stations.extend([stops[pos]] * trips)
+            to_stations.extend([stops[pos + 1]] * trips)
+            trip_ids.extend(range(first_trip, first_trip + trips))
+        return trips, columns
+
+    def _build_connections(self) -> Tuple[array, ...]:
+        """展开全部线路的连接并按出发、到达时刻排序（见构造函数的connection_*等参数）"""
+        trip_routes = array('i')
+        route_first_trip = array('i')
+        route_trip_count = array('i')
+        columns = tuple(array('i') for _ in range(5))
+        for r in range(len(self.route_ids)):
+            trips, route_columns = self._route_connections(r, len(trip_routes))
+            route_first_trip.append(len(trip_routes))
+            route_trip_count.append(trips)
+            trip_routes.extend(array('i', [r]) * trips)
+            for column, values in zip(columns, route_columns):
+                column.extend(values)
+        return self._sort_connections(columns) + (trip_routes, route_first_trip, route_trip_count)
+
+    @staticmethod
+    def _sort_connections(columns: Tuple[array, ...]) -> Tuple[array, ...]:
+        """
+        按 (出发时刻, 到达时刻, 原顺序) 排序连接的各列
+
+        排序键打包为一个整数（比按元组排序快得多），原顺序保证同一班次中行驶时间为0的相邻连接不颠倒
+        """
+        departures, arrivals = columns[0], columns[1]
+        count = len(departures)
+        if count < 2:
+            return columns
+        # 逐元素运算都用map和operator完成，不经过Python层的循环
+        index_bits = count.bit_length()
+        arrival_bits = max(arrivals).bit_length()
+        keys = list(map(or_, map(lshift, map(or_, map(lshift, departures, repeat(arrival_bits)), arrivals),
+                                 repeat(index_bits)), range(count)))
+        keys.sort()
+        gather = itemgetter(*map(and_, keys, repeat((1 << index_bits) - 1)))
+        del keys
+        return tuple(array('i', gather(column)) for column in columns)
+
+    def _replace_connections(self, routes):
+        """
+        重新展开部分线路的连接（线路更新或切换时刻表后调用）
+
+        旧班次标记为已移除（留在连接数组中，扫描时跳过），新班次追加编号，新连接按出发、到达时刻
+        二分定位后与原数组一次归并，原数组其余部分按切片整体复制；已移除的班次多于有效班次时压缩。
+        结果写入新数组，不修改与其他网络共用的数组
+
+        Args:
+            routes: 线路编号
+        """
+        trip_routes = array('i', self.trip_routes)
+        route_first_trip = array('i', self.route_first_trip)
+        route_trip_count = array('i', self.route_trip_count)
+        removed = self.removed_trips
+        added = []
+        for r in routes:
+            first = route_first_trip[r]
+            for trip in range(first, first + route_trip_count[r]):
+                trip_routes[trip] = NONE
+            removed += route_trip_count[r]
+            trips, columns = self._route_connections(r, len(trip_routes))
+            route_first_trip[r] = len(trip_routes)
+            route_trip_count[r] = trips
+            trip_routes.extend(array('i', [r]) * trips)
+            added.extend(zip(*columns))
+        added.sort(key=lambda connection: connection[:2])
+
+        columns = (self.connection_departures, self.connection_arrivals, self.connection_from_stations,
+                   self.connection_to_stations, self.connection_trips)
+        if removed > len(trip_routes) - removed:
+            # 压缩：去掉已移除班次的连接
+            keep = [i for i, trip in enumerate(self.connection_trips) if trip_routes[trip] != NONE]
+            columns = tuple(array('i', [column[i] for i in keep]) for column in columns)
+            removed = 0
+
+        departures, arrivals = columns[0], columns[1]
+        positions = []
+        for departure, arrival, _, _, _ in added:
+            lo = bisect_left(departures, departure)
+            hi = bisect_right(departures, departure, lo)
+            positions.append(bisect_right(arrivals, arrival, lo, hi))
+
+        merged = []
+        for k, column in enumerate(columns):
+            # 原数组的各段按内存整体复制（也适用于mmap上的memoryview）
+            view = memoryview(column).cast('B')
+            size = column.itemsize
+            result = array('i')
+            previous = 0
+            for position, connection in zip(positions, added):
+                if position > previous:
+                    result.frombytes(view[previous * size:position * size])
+                    previous = position
+                result.append(connection[k])
+            result.frombytes(view[previous * size:])
+            view.release()
+            merged.append(result)
+
+        (self.connection_departures, self.connection_arrivals, self.connection_from_stations,
+         self.connection_to_stations, self.connection_trips) = merged
+        self.trip_routes = trip_routes
+        self.route_first_trip = route_first_trip
+        self.route_trip_count = route_trip_count
+        self.removed_trips = removed
+
+    @property
+    def station_count(self) -> int:
+        return len(self.station_ids)
+
+    @property
+    def route_count(self) -> int:
+        return len(self.route_ids)
+
+    def route_length(self, r: int) -> int:
+        """线路站序长度"""
+        return self.route_stop_end[r] - self.route_stop_start[r]
+
+    def stop_at(self, r: int, pos: int) -> int:
+        """线路r第pos个站点的编号"""
+        return self.route_stops[self.route_stop_start[r] + pos]
+
+    def offset_at(self, r: int, pos: int) -> int:
+        """线路r第pos个站点的到站时间偏移"""
+        return self.route_offsets[self.route_stop_start[r] + pos]
+
+    def travel_time(self, r: int, pos: int, t: int) -> int:
+        """
+        线路r从第pos站到下一站的行驶时间
+
+        没有行驶时间曲线的路段为时间偏移之差；有曲线的路段在曲线拐点上二分查找后线性插值，
+        耗时O(log 拐点数)
+
+        Args:
+            r: 线路编号
+            pos: 站序位置
+            t: 从第pos站出发的时刻（分钟）
+
+        Returns:
+            行驶时间（分钟）
+        """
+        i = self.route_stop_start[r] + pos
+        p = self.segment_profiles[i]
+        if p == NONE:
+            return self.route_offsets[i + 1] - self.route_offsets[i]
+
+        lo = self.profile_start[p]
+        hi = self.profile_start[p + 1]
+        times = self.profile_times
+        durations = self.profile_durations
+        j = bisect_right(times, t, lo, hi)
+        if j == lo:
+            return durations[lo]
+        if j == hi:
+            return durations[hi - 1]
+        return interpolate(times[j - 1], durations[j - 1], times[j], durations[j], t)
+
+    def arrival_time(self, r: int, board_pos: int, departure: int, alight_pos: int) -> int:
+        """
+        在第board_pos站departure时刻上车，到达第alight_pos站的时刻
+
+        Args:
+            r: 线路编号
+            board_pos: 上车站序位置
+            departure: 上车时刻（分钟）
+            alight_pos: 下车站序位置
+
+        Returns:
+            到达时刻（分钟）
+        """
+        if r not in self.profiled_routes:
+            return departure + self.offset_at(r, alight_pos) - self.offset_at(r, board_pos)
+        t = departure
+        for pos in range(board_pos, alight_pos):
+            t += self.travel_time(r, pos, t)
+        return t
+
+    def min_travel_time(self, r: int, pos: int) -> int:
+        """线路r从第pos站到下一站的最短行驶时间（有曲线的路段取曲线上的最小值），作为搜索的下界"""
+        i = self.route_stop_start[r] + pos
+        p = self.segment_profiles[i]
+        if p == NONE:
+            return self.route_offsets[i + 1] - self.route_offsets[i]
+        return min(self.profile_durations[self.profile_start[p]:self.profile_start[p + 1]])
+
+    def profile(self, p: int) -> TravelTimeProfile:
+        """第p条行驶时间曲线"""
+        lo = self.profile_start[p]
+        hi = self.profile_start[p + 1]
+        return TravelTimeProfile(zip(self.profile_times[lo:hi], self.profile_durations[lo:hi]))
+
+    def routes_at(self, s: int) -> Iterator[Tuple[int, int]]:
+        """经过站点s的所有(线路编号, 位置)"""
+        for i in range(self.station_route_start[s], self.station_route_end[s]):
+            yield self.station_route_routes[i], self.station_route_positions[i]
+
+    def footpaths_at(self, s: int) -> Iterator[Tuple[int, int]]:
+        """从站点s出发的所有步行边 (目标站点编号, 步行时间)"""
+        for i in range(self.footpath_start[s], self.footpath_start[s + 1]):
+            yield self.footpath_targets[i], self.footpath_times[i]
+
+    def footpaths_to(self, s: int) -> Iterator[Tuple[int, int]]:
+        """到达站点s的所有步行边 (出发站点编号, 步行时间)"""
+        if self._reverse_footpaths is None:
+            self._reverse_footpaths = self._build_reverse_footpaths()
+        start, sources, times = self._reverse_footpaths
+        for i in range(start[s], start[s + 1]):
+            yield sources[i], times[i]
+
+    def _build_reverse_footpaths(self) -> Tuple[array, array, array]:
+        """按目标站点重排步行边，得到反向CSR"""
+        counts = [0] * (self.station_count + 1)
+        for target in self.footpath_targets:
+            counts[target + 1] += 1
+        start = array('i', [0]) * (self.station_count + 1)
+        for s in range(self.station_count):
+            start[s + 1] = start[s] + counts[s + 1]
+        sources = array('i', [0]) * len(self.footpath_targets)
+        times = array('i', [0]) * len(self.footpath_targets)
+        fill = array('i', start)
+        for s in range(self.station_count):
+            for i in range(self.footpath_start[s], self.footpath_start[s + 1]):
+                target = self.footpath_targets[i]
+                sources[fill[target]] = s
+                times[fill[target]] = self.footpath_times[i]
+                fill[target] += 1
+        return start, sources, times
+
+    def position(self, r: int, s: int) -> Optional[int]:
+        """站点s在线路r站序中的首个位置"""
+        for i in range(self.station_route_start[s], self.station_route_end[s]):
+            if self.station_route_routes[i] == r:
+                return self.station_route_positions[i]
+        return None
+
+    def has_schedule(self, r: int) -> bool:
+        """线路是否有时刻表"""
+        return self.route_interval[r] != NONE
+
+    def in_service(self, r: int) -> bool:
+        """线路当天是否运营"""
+        return self.route_interval[r] != NO_SERVICE
+
+    def next_departure(self, r: int, pos: int, ready: int) -> Optional[int]:
+        """
+        获取线路r在第pos站不早于ready的下一班车时刻
+
+        各站的发车时刻为首站发车时刻加上该站的时间偏移，在线路的发车时刻表上二分查找；
+        使用行驶时间曲线的线路在预先推算的该站各班次时刻上二分查找
+
+        Args:
+            r: 线路编号
+            pos: 站序位置
+            ready: 可上车时刻（当天零点起的分钟数）
+
+        Returns:
+            下一班车在该站的时刻，没有时刻表的线路视为随到随走，没有班次则返回None
+        """
+        if self.route_interval[r] == NONE:
+            return ready
+
+        if r in self.profiled_routes:
+            # 各班次在该站的时刻按站连续存储，FIFO保证同一站各班次的时刻递增
+            trips = self.departure_end[r] - self.departure_start[r]
+            lo = self.trip_time_start[r] + pos * trips
+            i = bisect_left(self.trip_times, ready, lo, lo + trips)
+            if i == lo + trips:
+                return None
+            return self.trip_times[i]
+
+        offset = self.offset_at(r, pos)
+        hi = self.departure_end[r]
+        i = bisect_left(self.departures, ready - offset, self.departure_start[r], hi)
+        if i == hi:
+            return None
+        return self.departures[i] + offset
+
+    def departures_at(self, r: int, pos: int) -> List[int]:
+        """线路r在第pos站的全部发车时刻（分钟）"""
+        if r in self.profiled_routes:
+            trips = self.departure_end[r] - self.departure_start[r]
+            lo = self.trip_time_start[r] + pos * trips
+            return list(self.trip_times[lo:lo + trips])
+        offset = self.offset_at(r, pos)
+        return [departure + offset for departure in
+                self.departures[self.departure_start[r]:self.departure_end[r]]]
+
+    def __getstate__(self):
+        # 从快照加载的网络以mmap上的memoryview为底层存储，传给子进程时复制为数组
+        state = {}
+        for name, value in self.__dict__.items():
+            if isinstance(value, memoryview):
+                value = array(value.format, value)
+            elif name == 'snapshot':
+                continue
+            state[name] = value
+        return state
+
+    def __str__(self):
+        return (f"CompiledNetwork(stations={self.station_count}, routes={self.route_count}, "
+                f"stops={len(self.route_stops) - self._unused.get('route_stop', 0)})")
@@ -0,0 +1,145 @@
+"""
+多目标Pareto路径规划模块（McRAPTOR）
+
+在RAPTOR的按轮次扫描基础上，每个站点维护一个标签"包"（bag），
+同时比较到达时间、换乘次数（轮次）和票价，一次搜索得到全部Pareto最优方案。
+"""
+from typing import List, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.planner.network import CompiledNetwork
+from src.planner.raptor import TRANSFER_TIME, Leg
+
+# 标签：(到达时刻, 票价, 轮次, 站点, 线路, 上车标签, 上车时刻)
+Label = Tuple[int, float, int, int, int, int, int]
+
+
+def _dominated(arrival: int, fare: float, bag: List[Tuple[int, float]]) -> bool:
+    """(arrival, fare) 是否被包中某个标签支配（两项都不差）"""
+    for other_arrival, other_fare in bag:
+        if other_arrival <= arrival and other_fare <= fare:
+            return True
+    return False
+
+
+def _merge(arrival: int, fare: float, bag: List[Tuple[int, float]]):
+    """将(arrival, fare)并入包，并移除被它支配的标签"""
+    bag[:] = [(a, f) for a, f in bag if not (arrival <= a and fare <= f)]
+    bag.append((arrival, fare))
+
+
+class McRaptorRouter:
+    """按到达时间、换乘次数和票价的多目标RAPTOR规划器"""
+
+    def __init__(self, network: CompiledNetwork):
+        self.network = network
+
+    def route(self, from_station_id: str, to_station_id: str, depart: int,
+              max_transfers: int = 3) -> List[Tuple[int, int, float, List[Leg]]]:
+        """
+        执行多目标搜索
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart: 出发时刻（当天零点起的分钟数）
+            max_transfers: 最大换乘次数
+
+        Returns:
+            [(到达时刻, 换乘次数, 票价, 行程段列表)]，按到达时刻排序的Pareto最优集合
+        """
+        net = self.network
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None or source == target:
+            return []
+
+        labels: List[Label] = [(depart, 0.0, 0, source, -1, -1, depart)]
+
+        # 每个站点跨轮次的(到达时刻, 票价)包，用于支配剪枝
+        best_bags: List[List[Tuple[int, float]]] = [[] for _ in range(net.station_count)]
+        best_bags[source].append((depart, 0.0))
+
+        # 上一轮新增的标签：站点 -> [标签编号]
+        prev_round = {source: [0]}
+        target_labels = []
+
+        for k in range(1, max_transfers + 2):
+            # 收集本轮需要扫描的线路及最早的上车位置
+            queue = {}
+            for s in prev_round:
+                for r, pos in net.routes_at(s):
+                    if r not in queue or pos < queue[r]:
+                        queue[r] = pos
+
+            round_labels = {}
+
+            for r, start_pos in queue.items():
+                length = net.route_length(r)
+                price = net.route_prices[r]
+                # 线路包：[(班次在本站的时刻, 票价, 上车标签, 上车时刻)]
+                route_bag = []
+
+                for pos in range(start_pos, length):
+                    s = net.stop_at(r, pos)
+
+                    # 沿线路包中的各班次下车
+                    if pos > start_pos:
+                        route_bag = [(trip_time + net.travel_time(r, pos - 1, trip_time), fare, board_label, board_time)
+                                     for trip_time, fare, board_label, board_time in route_bag]
+                    for arrival, fare, board_label, board_time in route_bag:
+                        if _dominated(arrival, fare, best_bags[s]) or _dominated(arrival, fare, best_bags[target]):
+                            continue
+                        _merge(arrival, fare, best_bags[s])
+                        labels.append((arrival, fare, k, s, r, board_label, board_time))
+                        round_labels.setdefault(s, []).append(len(labels) - 1)
+                        if s == target:
+                            target_labels.append(len(labels) - 1)
+
+                    # 用上一轮在此站的标签上车
+                    if pos == length - 1:
+                        continue
+                    for label in prev_round.get(s, []):
+                        arrival, fare = labels[label][0], labels[label][1]
+                        ready = arrival + (TRANSFER_TIME if k > 1 else 0)
+                        departure = net.next_departure(r, pos, ready)
+                        if departure is None:
+                            continue
+                        new_fare = fare + price
+                        if any(t <= departure and f <= new_fare for t, f, _, _ in route_bag):
+                            continue
+                        route_bag = [entry for entry in route_bag
+                                     if not (departure <= entry[0] and new_fare <= entry[1])]
+                        route_bag.append((departure, new_fare, label, departure))
+
+            if not round_labels:
+                break
+            prev_round = round_labels
+
+        # 终点标签的最终Pareto过滤（到达时刻、换乘次数、票价）
+        candidates = [labels[i] + (i,) for i in target_labels]
+        journeys = []
+        for arrival, fare, k, _, _, _, _, index in candidates:
+            if any(a <= arrival and kk <= k and f <= fare and (a, kk, f) != (arrival, k, fare)
+                   for a, f, kk, _, _, _, _, _ in candidates):
+                continue
+            if any((arrival, k - 1, fare) == (a, t, f) for a, t, f, _ in journeys):
+                continue
+            journeys.append((arrival, k - 1, fare, self._reconstruct(labels, index)))
+
+        journeys.sort(key=lambda j: (j[0], j[1], j[2]))
+        return journeys
+
+    def _reconstruct(self, labels: List[Label], index: int) -> List[Leg]:
+        """沿上车标签回溯行程段"""
+        net = self.network
+        legs = []
+        arrival, _, k, s, r, board_label, board_time = labels[index]
+        while k > 0:
+            board_station = labels[board_label][3]
+            legs.append((net.route_ids[r], net.station_ids[board_station],
+                         net.station_ids[s], board_time, arrival))
+            arrival, _, k, s, r, board_label, board_time = labels[board_label]
+        legs.reverse()
+        return legs
@@ -1,15 +1,29 @@
 """
 路径规划算法模块
 """
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict, Tuple, Iterator
 from collections import deque
-from datetime import time
+from contextlib import nullcontext
+from array import array
+from datetime import date, time, datetime
+from time import perf_counter
+from threading import Lock, Thread
 import heapq
 import sys
 sys.path.append('/home/user/weiruan-bus')
 
 from src.planner.graph import TransitGraph
-from src.models import Station, BusRoute
+from src.planner.network import CompiledNetwork, WALK
+from src.planner.raptor import RaptorRouter, Leg, TRANSFER_TIME
+from src.planner.csa import ConnectionScanner
+from src.planner.labels import LabelStore, NO_PARENT
+from src.planner.pareto import McRaptorRouter
+from src.planner.transfer_patterns import TransferPatternIndex
+from src.planner.matrix import iter_matrix, MatrixRow
+from src.planner.cache import PlanCache, MISS
+from src.planner.metrics import PlannerMetrics
+from src.planner.budget import SearchBudget
+from src.models import Station, BusRoute, time_to_minutes, minutes_to_time
 
 
 class TransferPlan:
@@ -21,6 +35,8 @@ class TransferPlan:
         self.total_price: float = 0.0   # 总票价（元）
         self.transfer_count: int = 0    # 换乘次数
         self.total_stations: int = 0    # 总站数
+        self.walking_time: int = 0      # 步行时间（分钟）
+        self.budget_exhausted: bool = False  # 搜索预算耗尽时为True（方案不保证最优）
 
     def add_segment(self, route: BusRoute, from_station: Station,
                    to_station: Station, travel_time: int, waiting_time: int = 0):
@@ -48,14 +64,34 @@ class TransferPlan:
             'station_count': station_count
         }
 
+        # 如果之前已经乘过车，则增加换乘次数（步行段不算乘车）
+        if any(seg['route'] is not None for seg in self.segments):
+            self.transfer_count += 1
+
         self.segments.append(segment)
         self.total_time += travel_time + waiting_time
         self.total_price += route.price
         self.total_stations += station_count
 
-        # 如果不是第一段，则增加换乘次数
-        if len(self.segments) > 1:
-            self.transfer_count += 1
+    def add_walk(self, from_station: Station, to_station: Station, walking_time: int):
+        """
+        添加步行段
+
+        Args:
+            from_station: 起始站点
+            to_station: 终点站点
+            walking_time: 步行时间（分钟）
+        """
+        self.segments.append({
+            'route': None,
+            'from_station': from_station,
+            'to_station': to_station,
+            'travel_time': walking_time,
+            'waiting_time': 0,
+            'station_count': 0
+        })
+        self.total_time += walking_time
+        self.walking_time += walking_time
 
     def get_summary(self) -> str:
         """获取方案摘要"""
@@ -66,6 +102,8 @@ class TransferPlan:
         lines.append("=" * 60)
         lines.append("换乘方案：")
         lines.append(f"总时间：{self.total_time}分钟 | 总票价：{self.total_price:.1f}元 | 换乘次数：{self.transfer_count}次 | 总站数：{self.total_stations}站")
+        if self.walking_time > 0:
+            lines.append(f"步行时间：{self.walking_time}分钟")
         lines.append("=" * 60)
 
         for i, seg in enumerate(self.segments, 1):
@@ -77,6 +115,9 @@ class TransferPlan:
             station_count = seg['station_count']
 
             lines.append(f"\n第{i}段：")
+            if route is None:
+                lines.append(f"  步行：{from_st.name} → {to_st.name}，约{travel_time}分钟")
+                continue
             lines.append(f"  线路：{route.route_name}")
             lines.append(f"  上车站：{from_st.name}")
             lines.append(f"  下车站：{to_st.name}")
@@ -95,62 +136,214 @@ class TransferPlan:
 class PathFinder:
     """路径规划器"""
 
-    def __init__(self, graph: TransitGraph):
+    # plan() 支持的算法
+    ALGORITHMS = ('bfs', 'dijkstra', 'bidirectional', 'raptor', 'csa', 'patterns', 'pareto')
+
+    def __init__(self, graph: TransitGraph, cache: PlanCache = None, metrics: PlannerMetrics = None):
+        """
+        初始化路径规划器
+
+        Args:
+            graph: 公交网络图
+            cache: 方案缓存（可选），plan() 查询会先查缓存
+            metrics: 规划指标（可选），记录直达检查、搜索、方案构建各阶段耗时和标签入队/出队次数
+        """
         self.graph = graph
+        self.cache = cache
+        self.metrics = metrics
+        # 规划器类 -> {编译网络: (网络的就地更新次数, 规划器)}，按服务日切换的网络各自对应一个规划器
+        self._routers: Dict[type, Dict[CompiledNetwork, Tuple[int, object]]] = {}
+        self.transfer_patterns: Optional[TransferPatternIndex] = None
+        # 网络更新后在后台重新预计算换乘模式的线程
+        self._patterns_lock = Lock()
+        self._patterns_worker: Optional[Thread] = None
+
+    # 每类规划器最多保留的网络数
+    MAX_ROUTERS = 8
+
+    def _router(self, router_class, network: CompiledNetwork):
+        """获取基于指定网络的规划器（首次使用时构建，网络就地更新后重建）"""
+        routers = self._routers.setdefault(router_class, {})
+        entry = routers.get(network)
+        if entry is not None and entry[0] == network.revision:
+            return entry[1]
+        if entry is None and len(routers) >= self.MAX_ROUTERS:
+            del routers[next(iter(routers))]
+        router = router_class(network)
+        routers[network] = (network.revision, router)
+        return router
+
+    def _stage(self, stage: str, algorithm: str):
+        """阶段计时上下文（未启用指标时不计时）"""
+        return self.metrics.stage(stage, algorithm) if self.metrics is not None else nullcontext()
+
+    def _record_search(self, algorithm: str, start: float, pushed: int = None, popped: int = None):
+        """记录搜索阶段耗时和标签入队/出队次数（未启用指标时忽略）"""
+        if self.metrics is None:
+            return
+        self.metrics.observe_stage('search', algorithm, perf_counter() - start)
+        if pushed is not None:
+            self.metrics.count_labels(algorithm, pushed, popped)
+
+    def _network(self, service_date: Optional[date]) -> CompiledNetwork:
+        """本次查询使用的编译网络（按服务日期选用当天生效的时刻表，如果为None，使用当天日期）"""
+        return self.graph.compile(service_date if service_date is not None else date.today())
+
+    @property
+    def raptor(self) -> RaptorRouter:
+        """RAPTOR规划器（基于当前编译网络）"""
+        return self._router(RaptorRouter, self.graph.compile())
+
+    @property
+    def csa(self) -> ConnectionScanner:
+        """CSA规划器（基于当前编译网络展开时刻表）"""
+        return self._router(ConnectionScanner, self.graph.compile())
+
+    @property
+    def mc_raptor(self) -> McRaptorRouter:
+        """多目标RAPTOR规划器（基于当前编译网络）"""
+        return self._router(McRaptorRouter, self.graph.compile())
+
+    def plan(self, from_station_id: str, to_station_id: str, algorithm: str = 'bfs',
+             max_transfers: int = 3, depart_at: time = None, service_date: date = None,
+             budget: SearchBudget = None):
+        """
+        按指定算法规划路线（启用缓存时先查缓存）
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            algorithm: 算法名称，见 ALGORITHMS（未知名称按bfs处理）
+            max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+            budget: 搜索预算（可选，仅bfs、dijkstra和bidirectional使用），耗尽时返回目前找到的最好方案且不写入缓存
+
+        Returns:
+            换乘方案（pareto返回方案列表），如果无法到达则返回None（pareto返回空列表）
+        """
+        if algorithm not in self.ALGORITHMS:
+            algorithm = 'bfs'
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        if service_date is None:
+            service_date = date.today()
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.graph.version, from_station_id, to_station_id,
+                                      algorithm, max_transfers, time_to_minutes(depart_at),
+                                      self.graph.active_services(service_date))
+            cached = self.cache.get(key)
+            if cached is not MISS:
+                return cached
+
+        if algorithm == 'dijkstra':
+            result = self.find_path_dijkstra(from_station_id, to_station_id, max_transfers, depart_at, service_date,
+                                             budget)
+        elif algorithm == 'bidirectional':
+            result = self.find_path_bidirectional(from_station_id, to_station_id, max_transfers, depart_at,
+                                                  service_date, budget)
+        elif algorithm == 'raptor':
+            result = self.find_path_raptor(from_station_id, to_station_id, max_transfers, depart_at, service_date)
+        elif algorithm == 'csa':
+            result = self.find_path_csa(from_station_id, to_station_id, depart_at, service_date)
+        elif algorithm == 'patterns':
+            result = self.find_path_patterns(from_station_id, to_station_id, depart_at, service_date)
+        elif algorithm == 'pareto':
+            result = self.find_paths_pareto(from_station_id, to_station_id, max_transfers, depart_at, service_date)
+        else:
+            result = self.find_path_bfs(from_station_id, to_station_id, max_transfers, depart_at, service_date, budget)
+
+        if self.metrics is not None:
+            size = len(result) if algorithm == 'pareto' else (len(result.segments) if result else 0)
+            self.metrics.observe_result(algorithm, size)
+
+        if key is not None and (budget is None or budget.exhausted is None):
+            self.cache.put(key, result)
+        return result
+
+    @staticmethod
+    def _depart_minutes(depart_at: Optional[time]) -> int:
+        """出发时间 -> 当天零点起的分钟数（如果为None，使用系统时间）"""
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        return time_to_minutes(depart_at)
+
+    @staticmethod
+    def _boarding_time(net: CompiledNetwork, r: int, pos: int, ready: int) -> Optional[int]:
+        """
+        在线路r第pos站的上车时刻
+
+        按该站的发车时刻表取不早于ready的下一班车，没有时刻表的线路随到随走；
+        当天停运或末班车已过时返回None，调用方跳过该线路
+        """
+        if not net.in_service(r):
+            return None
+        return net.next_departure(r, pos, ready)
 
-    def find_direct_route(self, from_station_id: str, to_station_id: str) -> Optional[TransferPlan]:
+    def find_direct_route(self, from_station_id: str, to_station_id: str,
+                          depart_at: time = None,
+                          service_date: date = None) -> Optional[TransferPlan]:
         """
         查找直达线路（无需换乘）
 
         Args:
             from_station_id: 起点站ID
             to_station_id: 终点站ID
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
 
         Returns:
             换乘方案，如果没有直达则返回None
         """
-        common_routes = self.graph.get_common_routes(from_station_id, to_station_id)
-
-        if not common_routes:
+        net = self._network(service_date)
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None:
             return None
+        depart = self._depart_minutes(depart_at)
+
+        # 起点站所在线路及位置
+        source_positions = {}
+        for r, pos in net.routes_at(source):
+            source_positions.setdefault(r, pos)
 
         # 找到最快的直达线路
         best_plan = None
         min_time = float('inf')
 
-        for route_id in common_routes:
-            route = self.graph.get_route(route_id)
-            from_seq = route.get_station_sequence(from_station_id)
-            to_seq = route.get_station_sequence(to_station_id)
-
-            if from_seq is not None and to_seq is not None and from_seq < to_seq:
-                travel_time = route.get_travel_time(from_seq, to_seq)
-
-                # 获取等待时间
-                waiting_time = 0
-                schedule = self.graph.get_schedule(route_id)
-                if schedule:
-                    wt = schedule.get_waiting_time()
-                    waiting_time = wt if wt is not None else 0
-
-                total_time = travel_time + waiting_time
-
-                if total_time < min_time:
-                    min_time = total_time
-                    plan = TransferPlan()
-                    plan.add_segment(
-                        route,
-                        self.graph.get_station(from_station_id),
-                        self.graph.get_station(to_station_id),
-                        travel_time,
-                        waiting_time
-                    )
-                    best_plan = plan
+        for r, to_pos in net.routes_at(target):
+            from_pos = source_positions.get(r)
+            if from_pos is None or from_pos >= to_pos:
+                continue
+
+            boarding = self._boarding_time(net, r, from_pos, depart)
+            if boarding is None:
+                continue
+
+            route_id = net.route_ids[r]
+            travel_time = net.arrival_time(r, from_pos, boarding, to_pos) - boarding
+            waiting_time = boarding - depart
+            total_time = travel_time + waiting_time
+
+            if total_time < min_time:
+                min_time = total_time
+                plan = TransferPlan()
+                plan.add_segment(
+                    self.graph.get_route(route_id),
+                    self.graph.get_station(from_station_id),
+                    self.graph.get_station(to_station_id),
+                    travel_time,
+                    waiting_time
+                )
+                best_plan = plan
 
         return best_plan
 
     def find_path_bfs(self, from_station_id: str, to_station_id: str,
-                     max_transfers: int = 3) -> Optional[TransferPlan]:
+                     max_transfers: int = 3, depart_at: time = None,
+                     service_date: date = None, budget: SearchBudget = None) -> Optional[TransferPlan]:
         """
         使用BFS查找最少换乘方案
 
@@ -158,253 +351,767 @@ class PathFinder:
             from_station_id: 起点站ID
             to_station_id: 终点站ID
             max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间），各段等待时间按实际上车站的发车时刻计算
+            service_date: 服务日期（如果为None，使用当天日期）
+            budget: 搜索预算（可选），耗尽时返回队列中最先到达终点的标签对应的方案，并设置budget_exhausted
 
         Returns:
-            换乘方案，如果无法到达则返回None
+            换乘方案，如果无法到达（或预算耗尽前未到达）则返回None
         """
+        depart = self._depart_minutes(depart_at)
+
         # 首先尝试直达
-        direct_plan = self.find_direct_route(from_station_id, to_station_id)
+        with self._stage('direct', 'bfs'):
+            direct_plan = self.find_direct_route(from_station_id, to_station_id, minutes_to_time(depart),
+                                                 service_date)
         if direct_plan:
             return direct_plan
 
+        net = self._network(service_date)
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None:
+            return None
+        search_start = perf_counter()
+
         # BFS搜索
-        # 状态：(current_station_id, current_route_id, path)
-        # path: [(station_id, route_id, travel_time)]
+        # 状态：(route, position, transfers, label, 到达时刻)
+        # 路径记录在标签存储中，队列只保存标签编号
+        labels = LabelStore()
         queue = deque()
 
         # 初始化：从起点站所有可乘坐的线路开始
-        for next_station_id, route_id, travel_time in self.graph.get_neighbors(from_station_id):
-            queue.append((next_station_id, route_id, [(from_station_id, route_id, 0), (next_station_id, route_id, travel_time)]))
-
-        visited = set()  # (station_id, route_id)
+        for r, pos in net.routes_at(source):
+            if pos < net.route_length(r) - 1:
+                boarding = self._boarding_time(net, r, pos, depart)
+                if boarding is None:
+                    continue
+                travel_time = net.travel_time(r, pos, boarding)
+                board = labels.add(source, r, 0, boarding - depart)
+                label = labels.add(net.stop_at(r, pos + 1), r, travel_time, 0, board)
+                queue.append((r, pos + 1, 0, label, boarding + travel_time))
+
+        # 也可以先从起点步行到附近站点（换乘次数记为-1，表示尚未乘车）
+        origin = labels.add(source, WALK)
+        for other, walking_time in net.footpaths_at(source):
+            label = labels.add(other, WALK, walking_time, 0, origin)
+            queue.append((WALK, other, -1, label, depart + walking_time))
+
+        visited = set()  # (route, position)，步行状态为(WALK, 站点编号)
+        popped = 0
+        found = None
 
         while queue:
-            current_station, current_route, path = queue.popleft()
+            if budget is not None and budget.check(popped, len(queue)):
+                # 队列先进先出，队列中第一个到达终点的标签就是继续搜索时会得到的结果
+                found = next((entry[3] for entry in queue
+                              if (entry[1] if entry[0] == WALK else net.stop_at(entry[0], entry[1])) == target),
+                             None)
+                break
+            current_route, current_pos, transfers, label, now = queue.popleft()
+            popped += 1
+            walking = current_route == WALK
+            current_station = current_pos if walking else net.stop_at(current_route, current_pos)
 
             # 到达目标
-            if current_station == to_station_id:
-                return self._build_plan_from_path(path)
+            if current_station == target:
+                found = label
+                break
 
             # 检查换乘次数
-            transfers = self._count_transfers(path)
             if transfers > max_transfers:
                 continue
 
             # 状态标记
-            state = (current_station, current_route)
+            state = (current_route, current_pos)
             if state in visited:
                 continue
             visited.add(state)
 
             # 尝试继续乘坐当前线路
-            route = self.graph.get_route(current_route)
-            current_seq = route.get_station_sequence(current_station)
+            if not walking and current_pos < net.route_length(current_route) - 1:
+                travel_time = net.travel_time(current_route, current_pos, now)
+
+                next_label = labels.add(net.stop_at(current_route, current_pos + 1), current_route, travel_time, 0, label)
+                queue.append((current_route, current_pos + 1, transfers, next_label, now + travel_time))
+
+            # 尝试换乘到其他线路（在当前站点换乘，或步行到此后上车）
+            for other_route, other_pos in net.routes_at(current_station):
+                # 换乘到不同线路，并确保可以继续前进
+                if other_route != current_route and other_pos < net.route_length(other_route) - 1:
+                    # 站内换乘需要换乘时间；步行到此上车时步行时间已包含换乘
+                    ready = now if walking else now + TRANSFER_TIME
+                    boarding = self._boarding_time(net, other_route, other_pos, ready)
+                    if boarding is None:
+                        continue
+                    travel_time = net.travel_time(other_route, other_pos, boarding)
+
+                    # 记录换乘点和下一站（等待时间含换乘时间）
+                    board = labels.add(current_station, other_route, 0, boarding - now, label)
+                    next_label = labels.add(net.stop_at(other_route, other_pos + 1), other_route, travel_time, 0, board)
+                    queue.append((other_route, other_pos + 1, transfers + 1, next_label, boarding + travel_time))
+
+            # 尝试步行到附近站点
+            for other, walking_time in net.footpaths_at(current_station):
+                next_label = labels.add(other, WALK, walking_time, 0, label)
+                queue.append((WALK, other, transfers, next_label, now + walking_time))
+
+        # 入队的标签要么已出队，要么还留在队列中
+        self._record_search('bfs', search_start, popped + len(queue), popped)
+        if found is None:
+            return None
+        with self._stage('build', 'bfs'):
+            plan = self._build_plan_from_labels(labels, found)
+        plan.budget_exhausted = budget is not None and budget.exhausted is not None
+        return plan
+
+    def find_path_dijkstra(self, from_station_id: str, to_station_id: str,
+                          max_transfers: int = 3, depart_at: time = None,
+                          service_date: date = None, budget: SearchBudget = None) -> Optional[TransferPlan]:
+        """
+        使用Dijkstra算法查找最短时间方案
+
+        代价为从出发时刻起的用时：上车时按该站的发车时刻表等下一班车，站内换乘另加换乘时间。
+        代价非负，终点第一次出队时即为最短用时，搜索随即结束
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+            budget: 搜索预算（可选），耗尽时返回堆中已到达终点、用时最短的方案（不保证最优），并设置budget_exhausted
 
-            if current_seq is not None and current_seq < len(route.stations) - 1:
-                next_route_station = route.stations[current_seq + 1]
-                next_station_id = next_route_station.station_id
-                travel_time = next_route_station.arrival_time_offset - route.stations[current_seq].arrival_time_offset
+        Returns:
+            换乘方案，如果无法到达（或预算耗尽前未到达）则返回None
+        """
+        depart = self._depart_minutes(depart_at)
 
-                new_path = path + [(next_station_id, current_route, travel_time)]
-                queue.append((next_station_id, current_route, new_path))
+        # 首先尝试直达
+        with self._stage('direct', 'dijkstra'):
+            direct_plan = self.find_direct_route(from_station_id, to_station_id, minutes_to_time(depart),
+                                                 service_date)
+        if direct_plan:
+            return direct_plan
 
-            # 尝试换乘到其他线路（在当前站点换乘）
-            if current_station in self.graph.station_routes:
-                for other_route_id in self.graph.station_routes[current_station]:
-                    if other_route_id != current_route:  # 换乘到不同线路
-                        other_route = self.graph.get_route(other_route_id)
-                        other_seq = other_route.get_station_sequence(current_station)
+        net = self._network(service_date)
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None:
+            return None
+        search_start = perf_counter()
 
-                        # 确保可以继续前进
-                        if other_seq is not None and other_seq < len(other_route.stations) - 1:
-                            next_route_station = other_route.stations[other_seq + 1]
-                            next_station_id = next_route_station.station_id
-                            travel_time = next_route_station.arrival_time_offset - other_route.stations[other_seq].arrival_time_offset
+        # 优先队列：(total_time, route, position, transfers, label)
+        # 路径记录在标签存储中，队列只保存标签编号
+        labels = LabelStore()
+        heap = []
+        self._push_origin(net, heap, labels, source, depart)
 
-                            # 在路径中添加换乘点和下一站
-                            new_path = path + [(current_station, other_route_id, 0), (next_station_id, other_route_id, travel_time)]
-                            queue.append((next_station_id, other_route_id, new_path))
+        visited = {}  # (route, position) -> min_time，步行状态为(WALK, 站点编号)
+        best_label = None
+        popped = 0
 
-        return None
+        while heap:
+            if budget is not None and budget.check(popped, len(heap)):
+                entry = self._best_reached(net, heap, target)
+                best_label = entry[4] if entry is not None else None
+                break
+            total_time, current_route, current_pos, transfers, label = heapq.heappop(heap)
+            popped += 1
+            current_station = current_pos if current_route == WALK else net.stop_at(current_route, current_pos)
+
+            # 到达目标（代价非负，第一次出队即为最短用时）
+            if current_station == target:
+                best_label = label
+                break
 
-    def find_path_dijkstra(self, from_station_id: str, to_station_id: str,
-                          max_transfers: int = 3) -> Optional[TransferPlan]:
+            # 检查换乘次数
+            if transfers > max_transfers:
+                continue
+
+            # 状态检查
+            state = (current_route, current_pos)
+            if state in visited and visited[state] <= total_time:
+                continue
+            visited[state] = total_time
+
+            self._push_successors(net, heap, labels, depart, total_time, current_route, current_pos,
+                                  transfers, label, current_station)
+
+        self._record_search('dijkstra', search_start, popped + len(heap), popped)
+        if best_label is None:
+            return None
+        with self._stage('build', 'dijkstra'):
+            plan = self._build_plan_from_labels(labels, best_label)
+        plan.budget_exhausted = budget is not None and budget.exhausted is not None
+        return plan
+
+    def _push_origin(self, net: CompiledNetwork, heap: list, labels: LabelStore, source: int, depart: int):
+        """起点的初始状态入堆：乘坐经过起点的各条线路，或先步行到附近站点（换乘次数记为-1，表示尚未乘车）"""
+        for r, pos in net.routes_at(source):
+            if pos < net.route_length(r) - 1:
+                boarding = self._boarding_time(net, r, pos, depart)
+                if boarding is None:
+                    continue
+                travel_time = net.travel_time(r, pos, boarding)
+                waiting_time = boarding - depart
+
+                board = labels.add(source, r, 0, waiting_time)
+                label = labels.add(net.stop_at(r, pos + 1), r, travel_time, 0, board)
+                heapq.heappush(heap, (travel_time + waiting_time, r, pos + 1, 0, label))
+
+        origin = labels.add(source, WALK)
+        for other, walking_time in net.footpaths_at(source):
+            label = labels.add(other, WALK, walking_time, 0, origin)
+            heapq.heappush(heap, (walking_time, WALK, other, -1, label))
+
+    def _push_successors(self, net: CompiledNetwork, heap: list, labels: LabelStore, depart: int,
+                         total_time: int, current_route: int, current_pos: int, transfers: int,
+                         label: int, current_station: int):
+        """扩展一个出队的状态：继续乘坐当前线路、在当前站换乘其他线路、步行到附近站点"""
+        walking = current_route == WALK
+
+        # 继续乘坐当前线路
+        if not walking and current_pos < net.route_length(current_route) - 1:
+            travel_time = net.travel_time(current_route, current_pos, depart + total_time)
+
+            new_total_time = total_time + travel_time
+            next_label = labels.add(net.stop_at(current_route, current_pos + 1), current_route, travel_time, 0, label)
+            heapq.heappush(heap, (new_total_time, current_route, current_pos + 1, transfers, next_label))
+
+        # 换乘到其他线路（在当前站点换乘，或步行到此后上车）
+        now = depart + total_time
+        for other_route, other_pos in net.routes_at(current_station):
+            # 换乘到不同线路，并确保可以继续前进
+            if other_route != current_route and other_pos < net.route_length(other_route) - 1:
+                # 站内换乘加换乘时间；步行到此上车时步行时间已包含换乘
+                ready = now if walking else now + TRANSFER_TIME
+                boarding = self._boarding_time(net, other_route, other_pos, ready)
+                if boarding is None:
+                    continue
+                travel_time = net.travel_time(other_route, other_pos, boarding)
+                waiting_time = boarding - now
+
+                new_total_time = total_time + waiting_time + travel_time
+                # 记录换乘点和下一站（等待时间含换乘时间）
+                board = labels.add(current_station, other_route, 0, waiting_time, label)
+                next_label = labels.add(net.stop_at(other_route, other_pos + 1), other_route, travel_time, 0, board)
+                heapq.heappush(heap, (new_total_time, other_route, other_pos + 1, transfers + 1, next_label))
+
+        # 步行到附近站点
+        for other, walking_time in net.footpaths_at(current_station):
+            next_label = labels.add(other, WALK, walking_time, 0, label)
+            heapq.heappush(heap, (total_time + walking_time, WALK, other, transfers, next_label))
+
+    @staticmethod
+    def _best_reached(net: CompiledNetwork, heap: list, target: int) -> Optional[Tuple]:
+        """预算耗尽时，已入堆但尚未出队的终点状态中用时最短的一个（没有则返回None）"""
+        reached = [entry for entry in heap
+                   if (entry[2] if entry[1] == WALK else net.stop_at(entry[1], entry[2])) == target]
+        return min(reached) if reached else None
+
+    def find_path_bidirectional(self, from_station_id: str, to_station_id: str,
+                                max_transfers: int = 3, depart_at: time = None,
+                                service_date: date = None, budget: SearchBudget = None) -> Optional[TransferPlan]:
         """
-        使用Dijkstra算法查找最短时间方案
+        使用双向搜索查找最短时间方案
+
+        前向搜索与find_path_dijkstra相同，在编译网络上按发车时刻表计算精确用时；后向搜索从终点沿反向CSR
+        （经停记录中的前一站、反向步行边）扩展，代价为不计等车和换乘的最短行驶时间，即各站到终点用时的下界。
+        两侧交替扩展队列较小的一侧：
+        - 前向标签的用时加上所在站的下界超过已知上界时剪枝，后向尚未定型的站点以后向队首代价作为下界；
+        - 两侧在某站相遇时，沿后向路径按时刻表正向推算到终点，得到一个可行方案，其用时作为上界；
+        - 后向队首代价不小于上界后只扩展前向。
+        前向第一次取出终点时即为最短用时（与Dijkstra一致）；前向队首用时超过上界时采用相遇得到的方案。
 
         Args:
             from_station_id: 起点站ID
             to_station_id: 终点站ID
             max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+            budget: 搜索预算（可选），耗尽时返回已找到的用时最短的方案（不保证最优），并设置budget_exhausted
 
         Returns:
-            换乘方案，如果无法到达则返回None
+            换乘方案，如果无法到达（或预算耗尽前未找到）则返回None
         """
+        depart = self._depart_minutes(depart_at)
+
         # 首先尝试直达
-        direct_plan = self.find_direct_route(from_station_id, to_station_id)
+        with self._stage('direct', 'bidirectional'):
+            direct_plan = self.find_direct_route(from_station_id, to_station_id, minutes_to_time(depart),
+                                                 service_date)
         if direct_plan:
             return direct_plan
 
-        # 优先队列：(total_time, current_station, current_route, path, transfers)
-        heap = []
-
-        # 初始化
-        for next_station_id, route_id, travel_time in self.graph.get_neighbors(from_station_id):
-            schedule = self.graph.get_schedule(route_id)
-            waiting_time = 0
-            if schedule:
-                wt = schedule.get_waiting_time()
-                waiting_time = wt if wt is not None else 0
-
-            total_time = travel_time + waiting_time
-            path = [(from_station_id, route_id, 0, 0), (next_station_id, route_id, travel_time, waiting_time)]
-            heapq.heappush(heap, (total_time, next_station_id, route_id, path, 0))
+        net = self._network(service_date)
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None or source == target:
+            return None
+        search_start = perf_counter()
+        infinity = float('inf')
 
-        visited = {}  # (station, route) -> min_time
-        best_plan = None
-        min_time = float('inf')
+        # 前向：与Dijkstra相同的状态和标签
+        labels = LabelStore()
+        heap = []
+        self._push_origin(net, heap, labels, source, depart)
+        visited = {}
+        reached = {}  # 站点 -> 前向第一次在该站出队的状态 (用时, 线路, 位置, 换乘次数, 标签)
+
+        # 后向：站点 -> 到终点的用时下界；successors记录下界路径上的下一步 (下一站, 线路编号或WALK, 上车位置或步行时间)
+        bounds = {}
+        back_costs = {target: 0}
+        successors = {}
+        back_heap = [(0, target)]
+        frontier = 0  # 后向队首代价：尚未定型的站点到终点的用时下界
+
+        upper = infinity  # 已知可行方案的用时
+        meeting = None    # 得到上界的相遇状态
+        best_label = None
+        popped = 0
+
+        def meet(state):
+            # 沿后向路径推算到终点，更新上界
+            nonlocal upper, meeting
+            arrival = self._follow_successors(net, successors, target, state, depart, max_transfers)
+            if arrival is not None and arrival - depart < upper:
+                upper = arrival - depart
+                meeting = state
 
         while heap:
-            total_time, current_station, current_route, path, transfers = heapq.heappop(heap)
-
-            # 到达目标
-            if current_station == to_station_id:
-                if total_time < min_time:
-                    min_time = total_time
-                    best_plan = self._build_plan_from_path_with_waiting(path)
+            if budget is not None and budget.check(popped, len(heap) + len(back_heap)):
+                # 堆中的终点标签和相遇得到的方案取用时短的
+                entry = self._best_reached(net, heap, target)
+                if entry is not None and entry[0] <= upper:
+                    best_label = entry[4]
+                break
+
+            # 扩展后向（队首代价不小于上界后停止）
+            if back_heap and frontier < upper and len(back_heap) <= len(heap):
+                cost, s = heapq.heappop(back_heap)
+                popped += 1
+                if s not in bounds:
+                    bounds[s] = cost
+                    for r, pos in net.routes_at(s):
+                        if pos > 0 and net.in_service(r):
+                            self._relax_bound(back_heap, back_costs, successors, bounds, net.stop_at(r, pos - 1),
+                                              cost + net.min_travel_time(r, pos - 1), (s, r, pos - 1))
+                    for other, walking_time in net.footpaths_to(s):
+                        self._relax_bound(back_heap, back_costs, successors, bounds, other,
+                                          cost + walking_time, (s, WALK, walking_time))
+                    if s in reached:
+                        meet(reached[s])
+                frontier = back_heap[0][0] if back_heap else infinity
                 continue
 
-            # 检查换乘次数
+            total_time, current_route, current_pos, transfers, label = heapq.heappop(heap)
+            popped += 1
+            if total_time > upper:
+                # 之后出队的标签都不会比相遇得到的方案更快
+                break
+            current_station = current_pos if current_route == WALK else net.stop_at(current_route, current_pos)
+
+            # 到达目标（代价非负，第一次出队即为最短用时）
+            if current_station == target:
+                best_label = label
+                break
+
             if transfers > max_transfers:
                 continue
 
-            # 状态检查
-            state = (current_station, current_route)
+            state = (current_route, current_pos)
             if state in visited and visited[state] <= total_time:
                 continue
             visited[state] = total_time
 
-            # 继续乘坐当前线路
-            route = self.graph.get_route(current_route)
-            current_seq = route.get_station_sequence(current_station)
-
-            if current_seq is not None and current_seq < len(route.stations) - 1:
-                next_route_station = route.stations[current_seq + 1]
-                next_station_id = next_route_station.station_id
-                travel_time = next_route_station.arrival_time_offset - route.stations[current_seq].arrival_time_offset
-
-                new_total_time = total_time + travel_time
-                new_path = path + [(next_station_id, current_route, travel_time, 0)]
-                heapq.heappush(heap, (new_total_time, next_station_id, current_route, new_path, transfers))
-
-            # 换乘到其他线路（在当前站点换乘）
-            if current_station in self.graph.station_routes:
-                for other_route_id in self.graph.station_routes[current_station]:
-                    if other_route_id != current_route:  # 换乘到不同线路
-                        other_route = self.graph.get_route(other_route_id)
-                        other_seq = other_route.get_station_sequence(current_station)
-
-                        # 确保可以继续前进
-                        if other_seq is not None and other_seq < len(other_route.stations) - 1:
-                            next_route_station = other_route.stations[other_seq + 1]
-                            next_station_id = next_route_station.station_id
-                            travel_time = next_route_station.arrival_time_offset - other_route.stations[other_seq].arrival_time_offset
-
-                            schedule = self.graph.get_schedule(other_route_id)
-                            waiting_time = 0
-                            if schedule:
-                                wt = schedule.get_waiting_time()
-                                waiting_time = wt if wt is not None else 0
-
-                            new_total_time = total_time + travel_time + waiting_time + 2  # 加2分钟换乘时间
-                            # 在路径中添加换乘点和下一站
-                            new_path = path + [(current_station, other_route_id, 0, waiting_time), (next_station_id, other_route_id, travel_time, 0)]
-                            heapq.heappush(heap, (new_total_time, next_station_id, other_route_id, new_path, transfers + 1))
+            # 剪枝：用时加上到终点的下界超过上界，或后向搜索已结束仍未到达该站（无法到达终点）
+            bound = bounds.get(current_station, frontier)
+            if total_time + bound > upper or bound == infinity:
+                continue
 
-        return best_plan
+            if current_station not in reached:
+                reached[current_station] = (total_time, current_route, current_pos, transfers, label)
+                if current_station in bounds:
+                    meet(reached[current_station])
 
-    def _count_transfers(self, path: List[Tuple]) -> int:
-        """计算路径中的换乘次数"""
-        if len(path) <= 1:
-            return 0
+            self._push_successors(net, heap, labels, depart, total_time, current_route, current_pos,
+                                  transfers, label, current_station)
 
-        transfers = 0
-        prev_route = path[0][1]
+        self._record_search('bidirectional', search_start, popped + len(heap) + len(back_heap), popped)
+        if best_label is None and meeting is not None:
+            # 相遇得到的方案沿后向路径补全标签
+            best_label = self._follow_successors(net, successors, target, meeting, depart, max_transfers, labels)
+        if best_label is None:
+            return None
+        with self._stage('build', 'bidirectional'):
+            plan = self._build_plan_from_labels(labels, best_label)
+        plan.budget_exhausted = budget is not None and budget.exhausted is not None
+        return plan
 
-        for _, route_id, _ in path[1:]:
-            if route_id != prev_route:
-                transfers += 1
-                prev_route = route_id
+    @staticmethod
+    def _relax_bound(heap: list, costs: Dict[int, int], successors: Dict[int, Tuple], bounds: Dict[int, int],
+                     station: int, cost: int, successor: Tuple):
+        """后向下界搜索的松弛"""
+        if station not in bounds and cost < costs.get(station, float('inf')):
+            costs[station] = cost
+            successors[station] = successor
+            heapq.heappush(heap, (cost, station))
+
+    def _follow_successors(self, net: CompiledNetwork, successors: Dict[int, Tuple], target: int,
+                           state: Tuple, depart: int, max_transfers: int, labels: LabelStore = None):
+        """
+        从前向状态出发沿后向下界路径走到终点，按发车时刻表正向推算
 
-        return transfers
+        Args:
+            net: 编译网络
+            successors: 后向搜索记录的下一步
+            target: 终点站点编号
+            state: 前向状态 (用时, 线路, 位置, 换乘次数, 标签)
+            depart: 出发时刻（分钟）
+            max_transfers: 最大换乘次数
+            labels: 标签存储（可选），指定时沿途添加标签
 
-    def _build_plan_from_path(self, path: List[Tuple]) -> TransferPlan:
-        """从路径构建换乘方案"""
-        plan = TransferPlan()
+        Returns:
+            未指定labels时返回到达终点的时刻，指定时返回终点标签；赶不上末班车或超过换乘次数时返回None
+        """
+        total_time, route, pos, transfers, label = state
+        station = pos if route == WALK else net.stop_at(route, pos)
+        now = depart + total_time
+        while station != target:
+            next_station, r, value = successors[station]
+            if r == WALK:
+                now += value
+                route = WALK
+                if labels is not None:
+                    label = labels.add(next_station, WALK, value, 0, label)
+            else:
+                board = label
+                if r != route or value != pos:
+                    # 换乘（或步行后上车）到下界路径上的线路
+                    ready = now if route == WALK else now + TRANSFER_TIME
+                    boarding = self._boarding_time(net, r, value, ready)
+                    if boarding is None:
+                        return None
+                    transfers += 1
+                    if labels is not None:
+                        board = labels.add(station, r, 0, boarding - now, label)
+                    now = boarding
+                travel_time = net.travel_time(r, value, now)
+                now += travel_time
+                route, pos = r, value + 1
+                if labels is not None:
+                    label = labels.add(next_station, r, travel_time, 0, board)
+            station = next_station
+        if transfers > max_transfers:
+            return None
+        return now if labels is None else label
 
-        if not path:
-            return plan
+    def find_paths_raptor(self, from_station_id: str, to_station_id: str,
+                          max_transfers: int = 3, depart_at: time = None,
+                          service_date: date = None) -> List[TransferPlan]:
+        """
+        使用RAPTOR算法查找各换乘次数下的最快方案
 
-        # 按线路分段
-        segments = []
-        current_segment = [path[0]]
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
 
-        for i in range(1, len(path)):
-            station_id, route_id, travel_time = path[i]
-            prev_route_id = path[i-1][1]
+        Returns:
+            换乘方案列表，按换乘次数递增，换乘越多到达越早
+        """
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
+
+        router = self._router(RaptorRouter, self._network(service_date))
+        with self._stage('search', 'raptor'):
+            journeys = router.route(from_station_id, to_station_id, depart, max_transfers)
+        with self._stage('build', 'raptor'):
+            return [self._build_plan_from_legs(legs, depart) for _, legs in journeys]
+
+    def find_path_raptor(self, from_station_id: str, to_station_id: str,
+                         max_transfers: int = 3, depart_at: time = None,
+                         service_date: date = None) -> Optional[TransferPlan]:
+        """
+        使用RAPTOR算法查找最早到达方案
 
-            if route_id == prev_route_id:
-                current_segment.append(path[i])
-            else:
-                segments.append(current_segment)
-                current_segment = [path[i]]
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
 
-        segments.append(current_segment)
+        Returns:
+            换乘方案，如果无法到达则返回None
+        """
+        plans = self.find_paths_raptor(from_station_id, to_station_id, max_transfers, depart_at,
+                                       service_date)
+        return plans[-1] if plans else None
 
-        # 构建方案
-        for segment in segments:
-            if len(segment) < 2:
-                continue
+    def find_paths_pareto(self, from_station_id: str, to_station_id: str,
+                          max_transfers: int = 3, depart_at: time = None,
+                          service_date: date = None) -> List[TransferPlan]:
+        """
+        查找总时间、换乘次数和票价三项指标下的全部Pareto最优方案
 
-            route_id = segment[0][1]
-            route = self.graph.get_route(route_id)
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            max_transfers: 最大换乘次数
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+
+        Returns:
+            换乘方案列表，按总时间排序，任一方案都不被其他方案在三项指标上同时超越
+        """
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
+
+        router = self._router(McRaptorRouter, self._network(service_date))
+        with self._stage('search', 'pareto'):
+            journeys = router.route(from_station_id, to_station_id, depart, max_transfers)
+        with self._stage('build', 'pareto'):
+            return [self._build_plan_from_legs(legs, depart) for _, _, _, legs in journeys]
+
+    def reachable_within(self, station_id: str, minutes: int, depart_at: time = None,
+                         max_transfers: int = 3, service_date: date = None) -> Dict[str, Dict]:
+        """
+        一对多可达范围查询（等时圈）
 
-            from_station_id = segment[0][0]
-            to_station_id = segment[-1][0]
+        只执行一次在时间预算处截止的RAPTOR搜索
 
-            from_station = self.graph.get_station(from_station_id)
-            to_station = self.graph.get_station(to_station_id)
+        Args:
+            station_id: 起点站ID
+            minutes: 时间预算（分钟）
+            depart_at: 出发时间（如果为None，使用系统时间）
+            max_transfers: 最大换乘次数
+            service_date: 服务日期（如果为None，使用当天日期）
 
-            # 计算总行驶时间
-            travel_time = sum(item[2] for item in segment[1:])
+        Returns:
+            {station_id: {'arrival_time': 到达时间, 'travel_time': 用时（分钟）,
+            'transfer_count': 换乘次数}}，包含起点站本身
+        """
+        net = self._network(service_date)
+        source = net.station_index.get(station_id)
+        if source is None:
+            return {}
+
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
+
+        arrivals, _ = self._router(RaptorRouter, net).scan(source, depart, max_transfers, max_arrival=depart + minutes)
+
+        # 后面轮次的到达总是更早，按轮次覆盖即得每站最早到达
+        reachable = {}
+        for k, round_arrivals in enumerate(arrivals):
+            for s, arrival in round_arrivals.items():
+                reachable[net.station_ids[s]] = {
+                    'arrival_time': minutes_to_time(arrival),
+                    'travel_time': arrival - depart,
+                    'transfer_count': max(k - 1, 0)
+                }
+        return reachable
+
+    def iter_matrix(self, origins: List[str], destinations: List[str], depart_at: time = None,
+                    max_transfers: int = 3, workers: int = 1,
+                    service_date: date = None) -> Iterator[MatrixRow]:
+        """
+        逐行计算多对多出行矩阵（适合流式输出）
 
-            # 获取等待时间
-            waiting_time = 0
-            schedule = self.graph.get_schedule(route_id)
-            if schedule and len(plan.segments) == 0:  # 只有第一段需要等待
-                wt = schedule.get_waiting_time()
-                waiting_time = wt if wt is not None else 0
+        Args:
+            origins: 起点站ID列表
+            destinations: 终点站ID列表
+            depart_at: 出发时间（如果为None，使用系统时间）
+            max_transfers: 最大换乘次数
+            workers: 并行进程数
+            service_date: 服务日期（如果为None，使用当天日期）
 
-            plan.add_segment(route, from_station, to_station, travel_time, waiting_time)
+        Yields:
+            (起点站ID, 总时间数组, 换乘次数数组, 票价数组)，不可达为-1
+        """
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
 
-        return plan
+        return iter_matrix(self._network(service_date), origins, destinations, depart, max_transfers, workers)
 
-    def _build_plan_from_path_with_waiting(self, path: List[Tuple]) -> TransferPlan:
-        """从带等待时间的路径构建换乘方案"""
-        plan = TransferPlan()
+    def matrix(self, origins: List[str], destinations: List[str], depart_at: time = None,
+               max_transfers: int = 3, workers: int = 1, service_date: date = None) -> Dict:
+        """
+        计算多对多出行矩阵
 
-        if not path:
-            return plan
+        每个起点只执行一次一对多搜索，起点可分散到进程池中并行计算
+
+        Args:
+            origins: 起点站ID列表
+            destinations: 终点站ID列表
+            depart_at: 出发时间（如果为None，使用系统时间）
+            max_transfers: 最大换乘次数
+            workers: 并行进程数
+            service_date: 服务日期（如果为None，使用当天日期）
+
+        Returns:
+            {'origins', 'destinations', 'total_time', 'transfer_count', 'total_price'}，
+            后三项为按行展开的紧凑数组，不可达为-1
+        """
+        result = {
+            'origins': list(origins),
+            'destinations': list(destinations),
+            'total_time': array('i'),
+            'transfer_count': array('i'),
+            'total_price': array('d')
+        }
+        for _, times, transfers, fares in self.iter_matrix(origins, destinations, depart_at,
+                                                           max_transfers, workers, service_date):
+            result['total_time'].extend(times)
+            result['transfer_count'].extend(transfers)
+            result['total_price'].extend(fares)
+        return result
+
+    def precompute_transfer_patterns(self, origins: List[str] = None,
+                                     sample_interval: int = None) -> TransferPatternIndex:
+        """
+        预计算换乘模式（离线执行，耗时与起点数和采样次数成正比）
+
+        Args:
+            origins: 需要预计算的起点站ID列表（如果为None，预计算所有站点）
+            sample_interval: 出发时刻的采样间隔（分钟），为None时使用起点站全部发车时刻
+
+        Returns:
+            换乘模式索引
+        """
+        self.transfer_patterns = TransferPatternIndex(
+            self.graph.compile(), sample_interval
+        ).build(origins)
+        return self.transfer_patterns
+
+    def _patterns_current(self, index: TransferPatternIndex) -> bool:
+        """换乘模式是否按当前网络预计算（之后没有重新编译或就地更新）"""
+        network = self.graph.compile()
+        return index.network is network and index.revision == network.revision
+
+    def _rebuild_transfer_patterns(self, stale: TransferPatternIndex):
+        """后台线程：按原来的起点和采样间隔重新预计算，完成后替换过期的索引"""
+        network = self.graph.compile()
+        revision = network.revision
+        index = TransferPatternIndex(network, stale.sample_interval, stale.max_transfers).build(stale.origins)
+        # 预计算期间网络又被更新或索引已被替换时丢弃结果，由下一次查询重新触发
+        if (self.transfer_patterns is stale and self.graph.compile() is network
+                and network.revision == revision):
+            self.transfer_patterns = index
+
+    def refresh_transfer_patterns(self, wait: bool = True) -> Optional[TransferPatternIndex]:
+        """
+        网络更新后重新预计算换乘模式（沿用原来的起点和采样间隔），未更新时直接返回
+
+        预计算在后台线程中执行，同一时间只有一个预计算线程
+
+        Args:
+            wait: 是否等待预计算完成；为False时只启动后台预计算，索引过期时返回None
+
+        Returns:
+            当前有效的换乘模式索引，如果没有预计算过（或不等待且索引已过期）则返回None
+        """
+        index = self.transfer_patterns
+        if index is None or self._patterns_current(index):
+            return index
+        with self._patterns_lock:
+            worker = self._patterns_worker
+            if worker is None or not worker.is_alive():
+                worker = self._patterns_worker = Thread(target=self._rebuild_transfer_patterns,
+                                                        args=(index,), daemon=True)
+                worker.start()
+        if not wait:
+            return None
+
+        worker.join()
+        index = self.transfer_patterns
+        if not self._patterns_current(index):
+            # 后台预计算期间网络又被更新
+            index = self.precompute_transfer_patterns(index.origins, index.sample_interval)
+        return index
+
+    def find_path_patterns(self, from_station_id: str, to_station_id: str,
+                           depart_at: time = None,
+                           service_date: date = None) -> Optional[TransferPlan]:
+        """
+        使用预计算的换乘模式查找最早到达方案
+
+        网络更新（重新编译或线路就地更新）后换乘模式过期，在后台按原参数重新预计算，
+        完成前与起点未预计算、按服务日期切换了时刻表或所有候选模式当前都不可行时一样，回退到RAPTOR搜索
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+
+        Returns:
+            换乘方案，如果无法到达则返回None
+        """
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
+
+        index = self.refresh_transfer_patterns(wait=False)
+        if (index is not None and index.network is self._network(service_date)
+                and index.has_origin(from_station_id)):
+            with self._stage('search', 'patterns'):
+                result = index.query(from_station_id, to_station_id, depart)
+            if result is not None:
+                with self._stage('build', 'patterns'):
+                    return self._build_plan_from_legs(result[1], depart)
+
+        max_transfers = self.transfer_patterns.max_transfers if self.transfer_patterns is not None else 3
+        return self.find_path_raptor(from_station_id, to_station_id, max_transfers, depart_at,
+                                     service_date)
+
+    def find_path_csa(self, from_station_id: str, to_station_id: str,
+                      depart_at: time = None,
+                      service_date: date = None) -> Optional[TransferPlan]:
+        """
+        使用连接扫描算法（CSA）查找最早到达方案
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart_at: 出发时间（如果为None，使用系统时间）
+            service_date: 服务日期（如果为None，使用当天日期）
+
+        Returns:
+            换乘方案，如果无法到达则返回None
+        """
+        if depart_at is None:
+            depart_at = datetime.now().time()
+        depart = time_to_minutes(depart_at)
+
+        router = self._router(ConnectionScanner, self._network(service_date))
+        with self._stage('search', 'csa'):
+            result = router.route(from_station_id, to_station_id, depart)
+        if result is None:
+            return None
+        with self._stage('build', 'csa'):
+            return self._build_plan_from_legs(result[1], depart)
+
+    def _build_plan_from_labels(self, labels: LabelStore, label: int) -> TransferPlan:
+        """从标签前驱链回溯路径并构建换乘方案"""
+        net = self.graph.compile()
+        plan = TransferPlan()
+        path = labels.unwind(label)
 
         # 按线路分段
         segments = []
         current_segment = [path[0]]
 
         for i in range(1, len(path)):
-            station_id, route_id, travel_time, waiting_time = path[i]
-            prev_route_id = path[i-1][1]
-
-            if route_id == prev_route_id:
+            if labels.routes[path[i]] == labels.routes[path[i - 1]]:
                 current_segment.append(path[i])
             else:
                 segments.append(current_segment)
@@ -414,22 +1121,45 @@ class PathFinder:
 
         # 构建方案
         for segment in segments:
+            if labels.routes[segment[0]] == WALK:
+                # 步行段从前一个标签（下车站或起点）出发
+                parent = labels.parents[segment[0]]
+                start = segment[0] if parent == NO_PARENT else parent
+                walking_time = sum(labels.travel_times[item] for item in segment)
+                if walking_time > 0:
+                    plan.add_walk(self.graph.get_station(net.station_ids[labels.stations[start]]),
+                                  self.graph.get_station(net.station_ids[labels.stations[segment[-1]]]),
+                                  walking_time)
+                continue
+
             if len(segment) < 2:
                 continue
 
-            route_id = segment[0][1]
-            route = self.graph.get_route(route_id)
+            route = self.graph.get_route(net.route_ids[labels.routes[segment[0]]])
+            from_station = self.graph.get_station(net.station_ids[labels.stations[segment[0]]])
+            to_station = self.graph.get_station(net.station_ids[labels.stations[segment[-1]]])
 
-            from_station_id = segment[0][0]
-            to_station_id = segment[-1][0]
+            # 计算总行驶时间，等待时间记录在上车标签上
+            travel_time = sum(labels.travel_times[item] for item in segment[1:])
+            waiting_time = labels.waiting_times[segment[0]]
 
-            from_station = self.graph.get_station(from_station_id)
-            to_station = self.graph.get_station(to_station_id)
+            plan.add_segment(route, from_station, to_station, travel_time, waiting_time)
 
-            # 计算总行驶时间和等待时间
-            travel_time = sum(item[2] for item in segment[1:])
-            waiting_time = segment[0][3] if len(segment[0]) > 3 else 0
+        return plan
 
-            plan.add_segment(route, from_station, to_station, travel_time, waiting_time)
+    def _build_plan_from_legs(self, legs: List[Leg], depart: int) -> TransferPlan:
+        """从时刻表规划器的行程段构建换乘方案"""
+        plan = TransferPlan()
+        current = depart
+
+        for route_id, from_station_id, to_station_id, board_time, arrival in legs:
+            plan.add_segment(
+                self.graph.get_route(route_id),
+                self.graph.get_station(from_station_id),
+                self.graph.get_station(to_station_id),
+                arrival - board_time,
+                board_time - current
+            )
+            current = arrival
 
         return plan
@@ -0,0 +1,170 @@
+"""
+RAPTOR（Round-bAsed Public Transit Optimized Router）路径规划模块
+
+按轮次扫描线路站序（stop pattern），第k轮得到最多乘坐k条线路（k-1次换乘）时
+各站点的最早到达时间，一次搜索即可得到"每种换乘次数下的最快方案"。
+"""
+from typing import Dict, List, Optional, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.planner.network import CompiledNetwork
+
+# 换乘所需的最短时间（分钟），与Dijkstra中的换乘惩罚保持一致
+TRANSFER_TIME = 2
+
+# 行程段：(route_id, 上车站ID, 下车站ID, 上车时刻, 下车时刻)，时刻为当天零点起的分钟数
+Leg = Tuple[str, str, str, int, int]
+
+# 回溯信息：(线路编号, 上车位置, 下车位置, 上车时刻, 到达时刻)
+Parent = Tuple[int, int, int, int, int]
+
+INF = float('inf')
+
+
+class RaptorRouter:
+    """基于线路站序的RAPTOR规划器"""
+
+    def __init__(self, network: CompiledNetwork):
+        self.network = network
+
+    def scan(self, source: int, depart: int, max_transfers: int = 3, target: int = None,
+             max_arrival: float = INF) -> Tuple[List[Dict[int, int]], List[Dict[int, Parent]]]:
+        """
+        按轮次扫描线路
+
+        Args:
+            source: 起点站编号
+            depart: 出发时刻（当天零点起的分钟数）
+            max_transfers: 最大换乘次数
+            target: 终点站编号（指定时以终点的到达时间剪枝，否则计算到所有站点）
+            max_arrival: 最晚到达时刻，晚于此时刻的到达不再扩展
+
+        Returns:
+            (arrivals, parents)：arrivals[k][s]为第k轮改善的到达时刻，
+            parents[k][s]为第k轮到达s的回溯信息
+        """
+        net = self.network
+        best = [INF] * net.station_count
+        best[source] = depart
+        # 未指定终点时用一个永远为INF的哨兵位置代替终点剪枝
+        bound = best if target is not None else [INF]
+        target_slot = target if target is not None else 0
+
+        arrivals: List[Dict[int, int]] = [{source: depart}]
+        parents: List[Dict[int, Parent]] = [{}]
+        marked = {source}
+
+        route_stop_start = net.route_stop_start
+        route_stop_end = net.route_stop_end
+        route_stops = net.route_stops
+        route_offsets = net.route_offsets
+        station_route_start = net.station_route_start
+        station_route_end = net.station_route_end
+        station_route_routes = net.station_route_routes
+        station_route_positions = net.station_route_positions
+        profiled_routes = net.profiled_routes
+
+        for k in range(1, max_transfers + 2):
+            # 收集本轮需要扫描的线路及最早的上车位置
+            queue: Dict[int, int] = {}
+            for s in marked:
+                for i in range(station_route_start[s], station_route_end[s]):
+                    r = station_route_routes[i]
+                    pos = station_route_positions[i]
+                    if r not in queue or pos < queue[r]:
+                        queue[r] = pos
+
+            prev_arrivals = arrivals[k - 1]
+            round_arrivals: Dict[int, int] = {}
+            round_parents: Dict[int, Parent] = {}
+            marked = set()
+
+            for r, start_pos in queue.items():
+                base = route_stop_start[r]
+                length = route_stop_end[r] - base
+                profiled = r in profiled_routes
+                trip_time = None   # 当前所乘班次在本站的时刻
+                board_pos = -1
+                board_time = 0
+
+                for pos in range(start_pos, length):
+                    s = route_stops[base + pos]
+
+                    # 沿当前班次下车，能否改善到达时间
+                    if trip_time is not None:
+                        if profiled:
+                            trip_time += net.travel_time(r, pos - 1, trip_time)
+                        else:
+                            trip_time += route_offsets[base + pos] - route_offsets[base + pos - 1]
+                        arrival = trip_time
+                        if arrival < best[s] and arrival < bound[target_slot] and arrival <= max_arrival:
+                            round_arrivals[s] = arrival
+                            round_parents[s] = (r, board_pos, pos, board_time, arrival)
+                            best[s] = arrival
+                            marked.add(s)
+
+                    # 能否在此站赶上更早的班次
+                    prev = prev_arrivals.get(s)
+                    if prev is None or pos == length - 1:
+                        continue
+                    ready = prev + (TRANSFER_TIME if k > 1 else 0)
+                    if trip_time is not None and ready > trip_time:
+                        continue
+                    departure = net.next_departure(r, pos, ready)
+                    if departure is not None and (trip_time is None or departure < trip_time):
+                        trip_time = departure
+                        board_pos = pos
+                        board_time = departure
+
+            arrivals.append(round_arrivals)
+            parents.append(round_parents)
+
+            if not marked:
+                break
+
+        return arrivals, parents
+
+    def route(self, from_station_id: str, to_station_id: str, depart: int,
+              max_transfers: int = 3) -> List[Tuple[int, List[Leg]]]:
+        """
+        执行RAPTOR搜索
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart: 出发时刻（当天零点起的分钟数）
+            max_transfers: 最大换乘次数
+
+        Returns:
+            [(到达时刻, 行程段列表)]，按换乘次数递增排列，
+            每一项都比换乘更少的方案到达得更早
+        """
+        net = self.network
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None or source == target:
+            return []
+
+        arrivals, parents = self.scan(source, depart, max_transfers, target)
+
+        # 提取每轮到达终点的方案
+        journeys = []
+        for k in range(1, len(arrivals)):
+            if target in arrivals[k]:
+                journeys.append((arrivals[k][target], self._reconstruct(parents, k, target)))
+        return journeys
+
+    def _reconstruct(self, parents: List[Dict], k: int, s: int) -> List[Leg]:
+        """根据每轮的回溯信息还原行程段"""
+        net = self.network
+        legs = []
+        while k > 0:
+            r, board_pos, _, board_time, arrival = parents[k][s]
+            board_station = net.stop_at(r, board_pos)
+            legs.append((net.route_ids[r], net.station_ids[board_station],
+                         net.station_ids[s], board_time, arrival))
+            s = board_station
+            k -= 1
+        legs.reverse()
+        return legs
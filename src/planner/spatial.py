@@ -0,0 +1,211 @@
+"""
+站点空间索引
+
+按固定边长（米）把站点坐标划入均匀网格，半径查询只检查覆盖圆的网格，
+k近邻查询从所在网格向外逐圈扩展，确认不会出现更近的站点后停止。
+"""
+import math
+from array import array
+from typing import Dict, List, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+# 地球平均半径（米）
+EARTH_RADIUS = 6371008.8
+
+# 纬度每度对应的距离（米）
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    计算两点之间的球面距离
+
+    Args:
+        lat1, lon1: 点1的纬度、经度
+        lat2, lon2: 点2的纬度、经度
+
+    Returns:
+        距离（米）
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """均匀网格空间索引"""
+
+    def __init__(self, cell_size: float = 500.0):
+        """
+        初始化空间索引
+
+        Args:
+            cell_size: 网格边长（米）
+        """
+        self.cell_size = cell_size
+        self.ids: List[str] = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+
+        self._cell_lat = cell_size / METERS_PER_DEGREE
+        self._cell_lon = self._cell_lat
+        self._cells: Dict[Tuple[int, int], array] = {}
+        self._bounds = (0, 0, -1, -1)  # 最小行、最小列、最大行、最大列
+
+    @classmethod
+    def from_graph(cls, graph, cell_size: float = 500.0) -> 'SpatialIndex':
+        """
+        为公交网络图中的站点建立索引（坐标为(0, 0)的站点视为缺少坐标，不参与索引）
+
+        Args:
+            graph: TransitGraph对象
+            cell_size: 网格边长（米）
+
+        Returns:
+            空间索引
+        """
+        index = cls(cell_size)
+        points = [(s.station_id, s.latitude, s.longitude) for s in graph.stations.values()
+                  if s.latitude or s.longitude]
+        return index.build(points)
+
+    def build(self, points: List[Tuple[str, float, float]]) -> 'SpatialIndex':
+        """
+        建立网格
+
+        Args:
+            points: [(ID, 纬度, 经度)]
+
+        Returns:
+            self
+        """
+        self.ids = [item_id for item_id, _, _ in points]
+        self.latitudes = array('d', (lat for _, lat, _ in points))
+        self.longitudes = array('d', (lon for _, _, lon in points))
+
+        # 经度方向的网格宽度按站点平均纬度换算，使网格在当地接近正方形
+        if points:
+            mean_lat = sum(self.latitudes) / len(points)
+            self._cell_lon = self._cell_lat / max(math.cos(math.radians(mean_lat)), 0.01)
+
+        cells: Dict[Tuple[int, int], array] = {}
+        for i in range(len(self.ids)):
+            cell = self._cell_of(self.latitudes[i], self.longitudes[i])
+            members = cells.get(cell)
+            if members is None:
+                members = cells[cell] = array('i')
+            members.append(i)
+        self._cells = cells
+
+        if cells:
+            rows = [row for row, _ in cells]
+            cols = [col for _, col in cells]
+            self._bounds = (min(rows), min(cols), max(rows), max(cols))
+        return self
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self._cell_lat), math.floor(lon / self._cell_lon)
+
+    def _distances(self, lat: float, lon: float, cells) -> List[Tuple[float, int]]:
+        """计算若干网格内所有站点到(lat, lon)的距离"""
+        result = []
+        for cell in cells:
+            for i in self._cells.get(cell, ()):
+                result.append((haversine_distance(lat, lon, self.latitudes[i], self.longitudes[i]), i))
+        return result
+
+    def within(self, lat: float, lon: float, radius: float) -> List[Tuple[str, float]]:
+        """
+        半径查询
+
+        Args:
+            lat: 纬度
+            lon: 经度
+            radius: 半径（米）
+
+        Returns:
+            [(ID, 距离)]，按距离从近到远排列
+        """
+        dlat = radius / METERS_PER_DEGREE
+        # 取查询范围内离赤道最远处的纬度换算经度跨度，保证覆盖整个圆
+        far_lat = min(abs(lat) + dlat, 89.9)
+        dlon = dlat / max(math.cos(math.radians(far_lat)), 1e-6)
+
+        row_lo, col_lo = self._cell_of(lat - dlat, lon - dlon)
+        row_hi, col_hi = self._cell_of(lat + dlat, lon + dlon)
+        min_row, min_col, max_row, max_col = self._bounds
+        cells = ((row, col)
+                 for row in range(max(row_lo, min_row), min(row_hi, max_row) + 1)
+                 for col in range(max(col_lo, min_col), min(col_hi, max_col) + 1))
+
+        found = [(d, i) for d, i in self._distances(lat, lon, cells) if d <= radius]
+        found.sort()
+        return [(self.ids[i], d) for d, i in found]
+
+    def _ring(self, row0: int, col0: int, ring: int):
+        """以(row0, col0)为中心、切比雪夫距离为ring的一圈网格（限制在网格范围内）"""
+        if ring == 0:
+            yield row0, col0
+            return
+        min_row, min_col, max_row, max_col = self._bounds
+        cols = range(max(col0 - ring, min_col), min(col0 + ring, max_col) + 1)
+        for row in (row0 - ring, row0 + ring):
+            if min_row <= row <= max_row:
+                for col in cols:
+                    yield row, col
+        for row in range(max(row0 - ring + 1, min_row), min(row0 + ring - 1, max_row) + 1):
+            for col in (col0 - ring, col0 + ring):
+                if min_col <= col <= max_col:
+                    yield row, col
+
+    def nearest(self, lat: float, lon: float, k: int = 5,
+                max_distance: float = None) -> List[Tuple[str, float]]:
+        """
+        k近邻查询
+
+        Args:
+            lat: 纬度
+            lon: 经度
+            k: 返回的站点数
+            max_distance: 最大距离（米），如果为None则不限
+
+        Returns:
+            [(ID, 距离)]，按距离从近到远排列
+        """
+        if not self._cells or k <= 0:
+            return []
+
+        row0, col0 = self._cell_of(lat, lon)
+        min_row, min_col, max_row, max_col = self._bounds
+        max_ring = max(abs(row0 - min_row), abs(row0 - max_row),
+                       abs(col0 - min_col), abs(col0 - max_col))
+
+        # 第ring圈之外的站点距离至少为 ring × 网格在当地的最小边长
+        cell_meters = min(self.cell_size,
+                          self._cell_lon * METERS_PER_DEGREE * math.cos(math.radians(lat)))
+
+        # 查询点在网格范围之外时，从第一圈与网格范围相交的位置开始
+        first_ring = max(0, min_row - row0, row0 - max_row, min_col - col0, col0 - max_col)
+
+        found: List[Tuple[float, int]] = []
+        for ring in range(first_ring, max_ring + 1):
+            found.extend(self._distances(lat, lon, self._ring(row0, col0, ring)))
+
+            bound = ring * cell_meters
+            if max_distance is not None and bound > max_distance:
+                break
+            if len(found) >= k:
+                found.sort()
+                del found[k:]
+                if found[-1][0] <= bound:
+                    break
+
+        found.sort()
+        return [(self.ids[i], d) for d, i in found[:k]
+                if max_distance is None or d <= max_distance]
+
+    def __len__(self):
+        return len(self.ids)
@@ -0,0 +1,292 @@
+"""
+换乘模式（Transfer Patterns）预计算模块
+
+离线阶段对每个起点站在一天内多个出发时刻执行RAPTOR，记录到达各终点时曾经最优的
+线路序列及换乘站（换乘模式）。所有模式以前缀共享的方式存放在同一张节点表中，
+构成一个紧凑的有向无环图；查询时只需按当前时刻表评估少量候选模式。
+"""
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+import sys
+sys.path.append('/home/user/weiruan-bus')
+
+from src.planner.network import CompiledNetwork
+from src.planner.raptor import RaptorRouter, TRANSFER_TIME, Leg
+
+# 根节点（空模式）
+ROOT = -1
+
+
+class TransferPatternIndex:
+    """换乘模式索引"""
+
+    def __init__(self, network: CompiledNetwork, sample_interval: int = None,
+                 max_transfers: int = 3):
+        """
+        初始化换乘模式索引
+
+        Args:
+            network: 编译后的公交网络
+            sample_interval: 预计算时出发时刻的采样间隔（分钟）；如果为None，
+                使用起点站的全部发车时刻，结果对任意出发时刻都精确
+            max_transfers: 最大换乘次数
+        """
+        self.network = network
+        # 预计算时网络的就地更新次数，之后网络再被就地更新则索引过期
+        self.revision = network.revision
+        self.sample_interval = sample_interval
+        self.max_transfers = max_transfers
+        # 预计算的起点站ID列表（None表示全部站点），重新预计算时沿用
+        self.origins: Optional[List[str]] = None
+
+        # 模式节点表：每个节点是一段乘车 (线路, 上车位置, 下车位置)，指向前一段所在节点
+        self.node_parents = array('i')
+        self.node_routes = array('i')
+        self.node_boards = array('i')
+        self.node_alights = array('i')
+        self._node_lookup: Dict[Tuple[int, int, int, int], int] = {}
+
+        # 起点站 -> {终点站 -> {模式末节点}}
+        self.patterns: Dict[int, Dict[int, Set[int]]] = {}
+        # 从快照加载的模式表（见 from_arrays），按起点首次查询时展开到patterns
+        self._stored: Optional[Dict[str, array]] = None
+
+    def _intern(self, parent: int, r: int, board: int, alight: int) -> int:
+        """获取（或创建）模式节点"""
+        key = (parent, r, board, alight)
+        node = self._node_lookup.get(key)
+        if node is None:
+            node = len(self.node_routes)
+            self.node_parents.append(parent)
+            self.node_routes.append(r)
+            self.node_boards.append(board)
+            self.node_alights.append(alight)
+            self._node_lookup[key] = node
+        return node
+
+    def _sample_times(self, source: int) -> List[int]:
+        """
+        预计算使用的出发时刻
+
+        任意时刻出发的最优方案都等同于在起点站下一班车发车时出发，
+        因此起点站的全部发车时刻即可覆盖全天
+        """
+        net = self.network
+        times = set()
+        for r, pos in net.routes_at(source):
+            if self.sample_interval is None and net.has_schedule(r):
+                times.update(net.departures_at(r, pos))
+
+        if self.sample_interval is not None or len(times) == 0:
+            # 按固定间隔采样所有线路的运营时段
+            firsts = [t for t in net.route_first if t >= 0]
+            lasts = [t for t in net.route_last if t >= 0]
+            interval = self.sample_interval or 30
+            if firsts:
+                times.update(range(min(firsts), max(lasts) + 1, interval))
+            else:
+                times.add(0)
+        return sorted(times)
+
+    def build(self, origins: List[str] = None) -> 'TransferPatternIndex':
+        """
+        预计算换乘模式
+
+        Args:
+            origins: 需要预计算的起点站ID列表（如果为None，预计算所有站点）
+
+        Returns:
+            self
+        """
+        net = self.network
+        router = RaptorRouter(net)
+        self.origins = origins
+        if origins is None:
+            sources = range(net.station_count)
+        else:
+            sources = [net.station_index[sid] for sid in origins if sid in net.station_index]
+
+        for source in sources:
+            by_target = self.patterns.setdefault(source, {})
+            for depart in self._sample_times(source):
+                arrivals, parents = router.scan(source, depart, self.max_transfers)
+                for k in range(1, len(arrivals)):
+                    for target in arrivals[k]:
+                        by_target.setdefault(target, set()).add(self._add_pattern(parents, k, target))
+
+        return self
+
+    def _add_pattern(self, parents: List[Dict], k: int, s: int) -> int:
+        """将一次RAPTOR结果中到达s的行程登记为模式，返回末节点"""
+        legs = []
+        while k > 0:
+            r, board_pos, alight_pos, _, _ = parents[k][s]
+            legs.append((r, board_pos, alight_pos))
+            s = self.network.stop_at(r, board_pos)
+            k -= 1
+
+        node = ROOT
+        for r, board_pos, alight_pos in reversed(legs):
+            node = self._intern(node, r, board_pos, alight_pos)
+        return node
+
+    def to_arrays(self) -> Dict[str, array]:
+        """
+        导出为紧凑数组（写入快照）
+
+        Returns:
+            {名称: 数组}：节点表，以及按起点、终点排序的两级CSR模式表
+            （origins/origin_start -> targets/target_start -> nodes）
+        """
+        origins = array('i')
+        origin_start = array('i', [0])
+        targets = array('i')
+        target_start = array('i', [0])
+        nodes = array('i')
+        for source in sorted(self._origins()):
+            by_target = self._targets(source)
+            origins.append(source)
+            for target in sorted(by_target):
+                targets.append(target)
+                nodes.extend(sorted(by_target[target]))
+                target_start.append(len(nodes))
+            origin_start.append(len(targets))
+        return {
+            'node_parents': self.node_parents, 'node_routes': self.node_routes,
+            'node_boards': self.node_boards, 'node_alights': self.node_alights,
+            'origins': origins, 'origin_start': origin_start,
+            'targets': targets, 'target_start': target_start, 'nodes': nodes,
+        }
+
+    @classmethod
+    def from_arrays(cls, network: CompiledNetwork, arrays: Dict[str, array],
+                    sample_interval: int = None, max_transfers: int = 3,
+                    origins: List[str] = None) -> 'TransferPatternIndex':
+        """
+        从 to_arrays 导出的数组恢复索引（数组可以是mmap映射的memoryview）
+
+        Args:
+            network: 预计算时使用的编译网络
+            arrays: to_arrays 导出的数组
+            sample_interval: 预计算时的采样间隔
+            max_transfers: 预计算时的最大换乘次数
+            origins: 预计算时的起点站ID列表
+
+        Returns:
+            换乘模式索引
+        """
+        index = cls(network, sample_interval, max_transfers)
+        index.origins = origins
+        index.node_parents = arrays['node_parents']
+        index.node_routes = arrays['node_routes']
+        index.node_boards = arrays['node_boards']
+        index.node_alights = arrays['node_alights']
+        index._stored = arrays
+        return index
+
+    def _origins(self) -> Set[int]:
+        """已预计算的起点站编号"""
+        origins = set(self.patterns)
+        if self._stored is not None:
+            origins.update(self._stored['origins'])
+        return origins
+
+    def _targets(self, source: int) -> Optional[Dict[int, Set[int]]]:
+        """起点站的 {终点站 -> {模式末节点}}，起点未预计算时返回None"""
+        by_target = self.patterns.get(source)
+        stored = self._stored
+        if by_target is None and stored is not None:
+            origins = stored['origins']
+            i = bisect_left(origins, source)
+            if i < len(origins) and origins[i] == source:
+                targets = stored['targets']
+                target_start = stored['target_start']
+                nodes = stored['nodes']
+                by_target = self.patterns[source] = {
+                    targets[j]: set(nodes[target_start[j]:target_start[j + 1]])
+                    for j in range(stored['origin_start'][i], stored['origin_start'][i + 1])
+                }
+        return by_target
+
+    def has_origin(self, station_id: str) -> bool:
+        """起点站是否已预计算"""
+        source = self.network.station_index.get(station_id)
+        return source is not None and self._targets(source) is not None
+
+    def _unwind(self, node: int) -> List[int]:
+        """模式末节点 -> 从第一段开始的节点列表"""
+        nodes = []
+        while node != ROOT:
+            nodes.append(node)
+            node = self.node_parents[node]
+        nodes.reverse()
+        return nodes
+
+    def candidates(self, from_station_id: str, to_station_id: str) -> List[List[Tuple[str, str, str]]]:
+        """
+        获取起终点之间的候选换乘模式
+
+        Returns:
+            [[(route_id, 上车站ID, 下车站ID)]]
+        """
+        net = self.network
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None:
+            return []
+
+        result = []
+        for node in (self._targets(source) or {}).get(target, ()):
+            pattern = []
+            for n in self._unwind(node):
+                r = self.node_routes[n]
+                pattern.append((net.route_ids[r],
+                                net.station_ids[net.stop_at(r, self.node_boards[n])],
+                                net.station_ids[net.stop_at(r, self.node_alights[n])]))
+            result.append(pattern)
+        return result
+
+    def query(self, from_station_id: str, to_station_id: str, depart: int) -> Optional[Tuple[int, List[Leg]]]:
+        """
+        按当前时刻表评估候选模式，返回最早到达方案
+
+        Args:
+            from_station_id: 起点站ID
+            to_station_id: 终点站ID
+            depart: 出发时刻（当天零点起的分钟数）
+
+        Returns:
+            (到达时刻, 行程段列表)，如果起点未预计算或所有模式都不可行则返回None
+        """
+        net = self.network
+        source = net.station_index.get(from_station_id)
+        target = net.station_index.get(to_station_id)
+        if source is None or target is None:
+            return None
+
+        best = None
+        for node in (self._targets(source) or {}).get(target, ()):
+            nodes = self._unwind(node)
+            current = depart
+            legs = []
+            for i, n in enumerate(nodes):
+                r = self.node_routes[n]
+                board_pos = self.node_boards[n]
+                alight_pos = self.node_alights[n]
+
+                ready = current + (TRANSFER_TIME if i > 0 else 0)
+                departure = net.next_departure(r, board_pos, ready)
+                if departure is None:
+                    break
+                current = net.arrival_time(r, board_pos, departure, alight_pos)
+                legs.append((net.route_ids[r], net.station_ids[net.stop_at(r, board_pos)],
+                             net.station_ids[net.stop_at(r, alight_pos)], departure, current))
+            else:
+                if best is None or (current, len(legs)) < (best[0], len(best[1])):
+                    best = (current, legs)
+
+        return best
+
+    def __len__(self):
+        return len(self.node_routes)
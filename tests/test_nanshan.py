@@ -6,8 +6,8 @@ import sys
 sys.path.append('/home/user/weiruan-bus')
 
 from src.data.shenzhen_nanshan import load_nanshan_data, get_test_cases
-from src.planner import PathFinder
-from datetime import datetime
+from src.planner import PathFinder, PlanCache, TransferPlan
+from datetime import datetime, time
 
 
 def test_data_loading():
@@ -143,6 +143,1192 @@ def test_dijkstra_routes(graph):
             print(f"    未找到路线")
 
 
+def test_raptor_routes(graph):
+    """测试RAPTOR按轮次规划"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试7：RAPTOR路线测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    test_cases = [
+        ("科技园", "后海", "SZ_NS_001", "SZ_NS_006", 0),
+        ("科技园", "蛇口", "SZ_NS_001", "SZ_NS_012", 1),
+        ("高新园", "南油", "SZ_NS_019", "SZ_NS_010", 2),
+    ]
+
+    for from_name, to_name, from_id, to_id, expected_transfers in test_cases:
+        print(f"\n测试：{from_name} → {to_name}")
+        plans = pathfinder.find_paths_raptor(from_id, to_id, max_transfers=3, depart_at=time(8, 0))
+        assert plans, f"未找到可行路线：{from_name} → {to_name}"
+
+        # 换乘越多的方案必须到达得越早
+        for fewer, more in zip(plans, plans[1:]):
+            assert more.transfer_count > fewer.transfer_count
+            assert more.total_time < fewer.total_time
+
+        plan = plans[0]
+        assert plan.transfer_count == expected_transfers
+        assert plan.segments[0]['from_station'].station_id == from_id
+        assert plan.segments[-1]['to_station'].station_id == to_id
+        print(f"✓ 最少换乘：{plan.transfer_count}次，总时间：{plan.total_time}分钟，"
+              f"共{len(plans)}个方案")
+
+
+def test_csa_routes(graph):
+    """测试CSA与RAPTOR结果一致"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试8：CSA路线测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    print(f"\n已展开连接数：{len(pathfinder.csa)}")
+
+    for depart_at in [time(5, 0), time(8, 3), time(22, 40)]:
+        for from_name, to_name, from_id, to_id, _ in get_test_cases():
+            plan_csa = pathfinder.find_path_csa(from_id, to_id, depart_at=depart_at)
+            plan_raptor = pathfinder.find_path_raptor(from_id, to_id, depart_at=depart_at)
+
+            if plan_raptor is None:
+                assert plan_csa is None, f"CSA与RAPTOR结果不一致：{from_name} → {to_name}"
+                continue
+            assert plan_csa is not None, f"CSA未找到路线：{from_name} → {to_name}"
+            assert plan_csa.total_time == plan_raptor.total_time
+
+    print("✓ CSA最早到达时间与RAPTOR一致")
+
+
+def test_pareto_routes(graph):
+    """测试多目标Pareto方案"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试9：Pareto方案测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    test_cases = [
+        ("高新园", "后海", "SZ_NS_019", "SZ_NS_006"),
+        ("科技园", "海上世界", "SZ_NS_001", "SZ_NS_018"),
+    ]
+
+    for from_name, to_name, from_id, to_id in test_cases:
+        print(f"\n测试：{from_name} → {to_name}")
+        plans = pathfinder.find_paths_pareto(from_id, to_id, max_transfers=3, depart_at=time(8, 3))
+        assert len(plans) > 1, f"应返回多个Pareto方案：{from_name} → {to_name}"
+
+        # 任一方案都不能被其他方案在三项指标上同时支配
+        for plan in plans:
+            for other in plans:
+                if other is plan:
+                    continue
+                assert not (other.total_time <= plan.total_time
+                            and other.transfer_count <= plan.transfer_count
+                            and other.total_price <= plan.total_price)
+
+        # 最快方案与RAPTOR一致
+        fastest = pathfinder.find_path_raptor(from_id, to_id, max_transfers=3, depart_at=time(8, 3))
+        assert plans[0].total_time == fastest.total_time
+
+        for plan in plans:
+            print(f"  - 总时间：{plan.total_time}分钟 | 换乘：{plan.transfer_count}次 | 票价：{plan.total_price}元")
+
+
+def test_transfer_patterns(graph):
+    """测试换乘模式预计算"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试10：换乘模式测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    index = pathfinder.precompute_transfer_patterns()
+    print(f"\n模式节点数：{len(index)}")
+
+    # 预计算后的查询结果应与在线RAPTOR搜索一致
+    for depart_at in [time(6, 7), time(8, 3), time(17, 41), time(22, 40)]:
+        for from_name, to_name, from_id, to_id, _ in get_test_cases():
+            plan_patterns = pathfinder.find_path_patterns(from_id, to_id, depart_at=depart_at)
+            plan_raptor = pathfinder.find_path_raptor(from_id, to_id, depart_at=depart_at)
+            if plan_raptor is None:
+                assert plan_patterns is None
+            else:
+                assert plan_patterns.total_time == plan_raptor.total_time, \
+                    f"换乘模式结果与RAPTOR不一致：{from_name} → {to_name}"
+
+    candidates = index.candidates("SZ_NS_019", "SZ_NS_010")
+    print(f"✓ 高新园 → 南油 候选模式：{len(candidates)}个")
+    for pattern in candidates:
+        print("  - " + " → ".join(f"{route_id}({board}-{alight})" for route_id, board, alight in pattern))
+
+
+def test_isochrone(graph):
+    """测试等时圈（一对多可达范围）"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试11：等时圈测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    depart_at = time(8, 0)
+    reachable = pathfinder.reachable_within("SZ_NS_001", 30, depart_at)
+    print(f"\n科技园出发30分钟内可到达：{len(reachable)}个站点")
+
+    # 与逐个点对点规划的结果一致
+    for station_id in graph.stations:
+        if station_id == "SZ_NS_001":
+            continue
+        plan = pathfinder.find_path_raptor("SZ_NS_001", station_id, depart_at=depart_at)
+        if plan is not None and plan.total_time <= 30:
+            assert station_id in reachable
+            assert reachable[station_id]['travel_time'] == plan.total_time
+        else:
+            assert station_id not in reachable
+
+    for station_id, info in sorted(reachable.items(), key=lambda item: item[1]['travel_time']):
+        print(f"  - {graph.get_station(station_id).name}: {info['travel_time']}分钟，换乘{info['transfer_count']}次")
+
+
+def test_matrix(graph):
+    """测试多对多出行矩阵"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试12：出行矩阵测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    depart_at = time(8, 0)
+    origins = ["SZ_NS_001", "SZ_NS_019", "SZ_NS_021"]
+    destinations = ["SZ_NS_006", "SZ_NS_010", "SZ_NS_018"]
+
+    result = pathfinder.matrix(origins, destinations, depart_at)
+    assert len(result['total_time']) == len(origins) * len(destinations)
+
+    # 每个单元格与点对点规划的最快方案一致
+    for i, origin in enumerate(origins):
+        for j, destination in enumerate(destinations):
+            index = i * len(destinations) + j
+            plan = pathfinder.find_path_raptor(origin, destination, depart_at=depart_at)
+            if plan is None:
+                assert result['total_time'][index] == -1
+                continue
+            assert result['total_time'][index] == plan.total_time
+            assert result['transfer_count'][index] == plan.transfer_count
+            assert result['total_price'][index] == plan.total_price
+
+    # 多进程计算结果与单进程一致
+    parallel = pathfinder.matrix(origins, destinations, depart_at, workers=2)
+    assert parallel['total_time'] == result['total_time']
+
+    print(f"\n✓ {len(origins)}×{len(destinations)} 矩阵计算正确")
+    for i, origin in enumerate(origins):
+        row = result['total_time'][i * len(destinations):(i + 1) * len(destinations)]
+        print(f"  - {graph.get_station(origin).name}: {row.tolist()}")
+
+
+def test_plan_cache():
+    """测试方案缓存及图版本失效"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试13：方案缓存测试")
+    print("=" * 70)
+
+    graph = load_nanshan_data()
+    cache = PlanCache(max_size=2, bucket_minutes=5)
+    pathfinder = PathFinder(graph, cache)
+
+    first = pathfinder.plan("SZ_NS_001", "SZ_NS_012", "raptor", depart_at=time(8, 0))
+    second = pathfinder.plan("SZ_NS_001", "SZ_NS_012", "raptor", depart_at=time(8, 3))
+    assert second is first, "同一时间分桶内应命中缓存"
+    assert cache.hits == 1 and cache.misses == 1
+
+    # 不同分桶重新计算
+    pathfinder.plan("SZ_NS_001", "SZ_NS_012", "raptor", depart_at=time(8, 7))
+    assert cache.misses == 2
+
+    # 超出容量时淘汰最久未使用的条目
+    pathfinder.plan("SZ_NS_007", "SZ_NS_012", "bfs", depart_at=time(8, 0))
+    assert len(cache) == 2 and cache.evictions == 1
+
+    # 修改图后旧方案失效
+    version = graph.version
+    graph.add_station(graph.get_station("SZ_NS_001"))
+    assert graph.version == version + 1
+    pathfinder.plan("SZ_NS_007", "SZ_NS_012", "bfs", depart_at=time(8, 0))
+    assert cache.misses == 4
+
+    print(f"\n✓ 缓存统计：{cache.get_statistics()}")
+
+
+def test_bidirectional_routes(graph):
+    """测试双向搜索"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试14：双向搜索测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+
+    for from_name, to_name, from_id, to_id, _ in get_test_cases():
+        print(f"\n测试：{from_name} → {to_name}")
+        plan = pathfinder.find_path_bidirectional(from_id, to_id, max_transfers=3)
+        assert plan and plan.segments, f"未找到可行路线：{from_name} → {to_name}"
+        assert plan.segments[0]['from_station'].station_id == from_id
+        assert plan.segments[-1]['to_station'].station_id == to_id
+        assert plan.transfer_count <= 3
+
+        # 相邻两段首尾相接
+        for prev, seg in zip(plan.segments, plan.segments[1:]):
+            assert prev['to_station'].station_id == seg['from_station'].station_id
+
+        print(f"✓ 换乘次数：{plan.transfer_count}次，总时间：{plan.total_time}分钟")
+
+    # 与Dijkstra的最短用时一致（包括末班车前后和步行换乘）
+    walking = load_nanshan_data()
+    walking.generate_footpaths(600)
+    for network in (graph, walking):
+        finder = PathFinder(network)
+        station_ids = list(network.stations)
+        for depart_at in (time(7, 45), time(17, 41), time(22, 40)):
+            for from_id in station_ids[::3]:
+                for to_id in station_ids:
+                    if from_id == to_id:
+                        continue
+                    expected = finder.find_path_dijkstra(from_id, to_id, depart_at=depart_at)
+                    plan = finder.find_path_bidirectional(from_id, to_id, depart_at=depart_at)
+                    assert (plan and plan.total_time) == (expected and expected.total_time), \
+                        (from_id, to_id, depart_at)
+
+    # 预算耗尽时采用两侧相遇得到的可行方案
+    from src.planner import SearchBudget
+    budget = SearchBudget(max_settled=9)
+    plan = pathfinder.find_path_bidirectional("SZ_NS_001", "SZ_NS_018", depart_at=time(8, 0), budget=budget)
+    best = pathfinder.find_path_bidirectional("SZ_NS_001", "SZ_NS_018", depart_at=time(8, 0))
+    assert plan.budget_exhausted and plan.total_time >= best.total_time
+    assert plan.segments[0]['from_station'].station_id == "SZ_NS_001"
+    assert plan.segments[-1]['to_station'].station_id == "SZ_NS_018"
+    for prev, seg in zip(plan.segments, plan.segments[1:]):
+        assert prev['to_station'].station_id == seg['from_station'].station_id
+    print("\n✓ 双向搜索与Dijkstra的最短用时一致")
+
+
+def test_gtfs_import():
+    """测试GTFS流式导入"""
+    import os
+    import tempfile
+    from src.data import GTFSLoader
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试15：GTFS导入测试")
+    print("=" * 70)
+
+    files = {
+        'stops.txt': "stop_id,stop_name,stop_lat,stop_lon\n"
+                     "A,科技园,22.5428,113.9493\nB,深大北门,22.5456,113.9456\n"
+                     "C,桂庙路口,22.5389,113.9389\nD,大冲,22.5367,113.9367\n",
+        'routes.txt': "route_id,route_short_name,route_type\nR1,M492路,3\nR2,M475路,3\nR3,B737路,3\n",
+        'trips.txt': "route_id,service_id,trip_id\nR1,WK,T1\nR1,WK,T2\nR1,WK,T3\nR2,WK,F1\n"
+                     "R3,WK,P1\nR3,WK,P2\n",
+        'stop_times.txt': "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+                          "T1,06:30:00,06:30:00,A,1\nT1,,,B,2\nT1,06:36:00,06:36:00,C,3\n"
+                          "T2,06:40:00,06:40:00,A,1\nT2,,,B,2\nT2,06:46:00,06:46:00,C,3\n"
+                          "T3,06:58:00,06:58:00,A,1\nT3,,,B,2\nT3,07:04:00,07:04:00,C,3\n"
+                          "F1,00:00:00,00:00:00,C,1\nF1,00:05:00,00:05:00,D,2\n"
+                          "P1,08:00:00,08:00:00,C,1\nP1,08:06:00,08:06:00,A,2\n"
+                          "P2,09:00:00,09:00:00,C,1\nP2,09:15:00,09:15:00,A,2\n",
+        'frequencies.txt': "trip_id,start_time,end_time,headway_secs\nF1,07:00:00,09:00:00,600\n",
+    }
+
+    with tempfile.TemporaryDirectory() as feed:
+        for name, content in files.items():
+            with open(os.path.join(feed, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+
+        loader = GTFSLoader(feed, city="深圳市", district="南山区")
+        gtfs_graph = loader.load()
+
+    assert len(gtfs_graph.stations) == 4
+    assert len(gtfs_graph.routes) == 4, "站点序列和行驶时间都相同的班次应合并为一条线路"
+
+    route = gtfs_graph.get_route("R1")
+    assert route.get_station_ids() == ["A", "B", "C"]
+    assert [rs.arrival_time_offset for rs in route.stations] == [0, 3, 6]
+    schedule = gtfs_graph.get_schedule("R1")
+    assert (schedule.first_bus, schedule.last_bus) == (time(6, 30), time(6, 58))
+    # 保留GTFS中的实际班次，而不是按平均间隔合成
+    assert schedule.get_departures() == [6 * 60 + 30, 6 * 60 + 40, 6 * 60 + 58]
+    assert schedule.get_next_departure(6 * 60 + 45) == 6 * 60 + 58
+    assert schedule.get_next_departure(6 * 60 + 59) is None
+
+    frequency_schedule = gtfs_graph.get_schedule("R2")
+    assert (frequency_schedule.first_bus, frequency_schedule.interval) == (time(7, 0), 10)
+
+    # 同一站点序列但行驶时间不同的班次拆为两个站序，各自保留实际的到站时刻
+    assert sorted(list(gtfs_graph.get_route(route_id).offsets) for route_id in ("R3_0", "R3_1")) == [[0, 6], [0, 15]]
+    for algorithm in ('raptor', 'csa', 'dijkstra'):
+        # 8:50出发等9:00的班次，9:15到达（而不是按第一个班次的6分钟算作9:06）
+        assert PathFinder(gtfs_graph).plan("C", "A", algorithm, depart_at=time(8, 50)).total_time == 25
+
+    plan = PathFinder(gtfs_graph).find_path_raptor("A", "D", depart_at=time(6, 45))
+    assert plan is not None and plan.transfer_count == 1
+    # 6:45出发要等6:58的实际班次，7:04到桂庙路口，再等7:10的频率班次
+    assert plan.total_time == 30
+    for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'csa'):
+        assert PathFinder(gtfs_graph).plan("A", "D", algorithm, depart_at=time(6, 45)).total_time == 30
+
+    # 实际班次经快照往返后不变
+    from src.data import save_snapshot, load_snapshot
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gtfs.snap")
+        save_snapshot(gtfs_graph, path)
+        loaded = load_snapshot(path)
+        assert loaded.get_schedule("R1").get_departures() == schedule.get_departures()
+        assert PathFinder(loaded).find_path_raptor("A", "D", depart_at=time(6, 45)).total_time == 30
+        del loaded
+
+    stats = loader.get_statistics()
+    print(f"\n✓ 导入{stats['total_rows']}行，{stats['rows_per_second']:.0f}行/秒")
+
+
+def test_snapshot(graph):
+    """测试二进制快照保存与加载"""
+    import os
+    import tempfile
+    from src.data import save_snapshot, load_snapshot, load_transfer_patterns
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试16：网络快照测试")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "nanshan.snap")
+        save_snapshot(graph, path)
+        loaded = load_snapshot(path)
+
+        # 站点、线路对象在首次访问时才构建，名称索引直接按快照中的条目重建
+        assert loaded.stations.materialized == 0 and loaded.routes.materialized == 0
+        for keyword in ["科技", "海", "m4"]:
+            assert loaded.name_index.search(keyword) == graph.name_index.search(keyword)
+            assert loaded.name_index.autocomplete(keyword) == graph.name_index.autocomplete(keyword)
+        assert loaded.stations.materialized == 0 and loaded.routes.materialized == 0
+
+        assert list(loaded.stations) == list(graph.stations)
+        assert set(loaded.routes) == set(graph.routes)
+        for station_id, station in graph.stations.items():
+            copy = loaded.get_station(station_id)
+            assert (copy.name, copy.latitude, copy.longitude, copy.routes) == \
+                (station.name, station.latitude, station.longitude, station.routes)
+            assert sorted(loaded.get_neighbors(station_id)) == sorted(graph.get_neighbors(station_id))
+        for route_id, route in graph.routes.items():
+            copy = loaded.get_route(route_id)
+            assert (copy.route_name, copy.price, copy.get_station_ids(), list(copy.offsets)) == \
+                (route.route_name, route.price, route.get_station_ids(), list(route.offsets))
+            assert loaded.get_schedule(route_id).get_departures() == graph.get_schedule(route_id).get_departures()
+        assert loaded.get_statistics() == graph.get_statistics()
+
+        original = graph.compile()
+        network = loaded.compile()
+        assert network.station_ids == original.station_ids
+        assert list(network.route_offsets) == list(original.route_offsets)
+        # CSA的连接数组直接映射快照中的区段，不在加载后重新展开排序
+        assert isinstance(network.connection_departures, memoryview)
+        assert list(network.connection_departures) == list(original.connection_departures)
+
+        finder = PathFinder(loaded)
+        expected = PathFinder(graph).find_path_raptor("SZ_NS_001", "SZ_NS_010", depart_at=time(8, 0))
+        plan = finder.find_path_raptor("SZ_NS_001", "SZ_NS_010", depart_at=time(8, 0))
+        assert (plan is None) == (expected is None)
+        if plan:
+            assert plan.total_time == expected.total_time
+            print(f"\n✓ 快照 {os.path.getsize(path)} 字节，RAPTOR结果一致：{plan.total_time}分钟")
+
+        # 离线预计算的换乘模式写入快照，加载后查询结果一致
+        source = PathFinder(graph)
+        patterns = source.precompute_transfer_patterns(["SZ_NS_001", "SZ_NS_010"])
+        save_snapshot(graph, path + ".patterns", patterns)
+        with_patterns = load_snapshot(path + ".patterns")
+        stored = load_transfer_patterns(with_patterns)
+        assert load_transfer_patterns(loaded) is None
+        assert stored is not None and len(stored) == len(patterns) and stored.origins == patterns.origins
+        assert stored.has_origin("SZ_NS_001") and not stored.has_origin("SZ_NS_002")
+        for to_id in graph.stations:
+            assert sorted(stored.candidates("SZ_NS_001", to_id)) == sorted(patterns.candidates("SZ_NS_001", to_id))
+            assert stored.query("SZ_NS_010", to_id, 480) == patterns.query("SZ_NS_010", to_id, 480)
+        pattern_finder = PathFinder(with_patterns)
+        pattern_finder.transfer_patterns = stored
+        expected = source.find_path_patterns("SZ_NS_001", "SZ_NS_010", depart_at=time(8, 0))
+        plan = pattern_finder.find_path_patterns("SZ_NS_001", "SZ_NS_010", depart_at=time(8, 0))
+        assert (plan is None) == (expected is None)
+        if plan:
+            assert plan.total_time == expected.total_time
+        print(f"✓ 快照中的换乘模式：{len(stored)}个模式节点，查询结果一致")
+
+        # 释放对mmap的引用后再删除临时目录
+        del finder, network, loaded, pattern_finder, stored, with_patterns
+
+
+def test_route_update():
+    """测试线路移除与替换"""
+    from src.models import BusRoute
+    from src.planner import NameIndex
+    from src.planner.network import CompiledNetwork
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试17：线路更新测试")
+    print("=" * 70)
+
+    # 使用独立的图，避免影响其他测试
+    graph = load_nanshan_data()
+    pathfinder = PathFinder(graph, PlanCache())
+    route = graph.get_route("M492")
+    from_id, to_id = route.stations[0].station_id, route.stations[-1].station_id
+
+    plan = pathfinder.plan(from_id, to_id)
+    assert plan is not None and plan.segments[0]['route'].route_id == "M492"
+
+    network = graph.compile()
+    spatial_index = graph.spatial_index
+    name_index = graph.name_index
+    patterns = pathfinder.precompute_transfer_patterns()
+
+    def assert_same_network():
+        """就地更新后的网络与重新编译的网络按ID比较一致"""
+        fresh = CompiledNetwork.from_graph(graph)
+        assert graph.compile() is network
+        for route_id in graph.routes:
+            r, q = network.route_index[route_id], fresh.route_index[route_id]
+            assert [network.station_ids[s] for s in network.route_stops[
+                network.route_stop_start[r]:network.route_stop_end[r]]] == \
+                [fresh.station_ids[s] for s in fresh.route_stops[fresh.route_stop_start[q]:fresh.route_stop_start[q + 1]]]
+            assert network.departures_at(r, 0) == fresh.departures_at(q, 0)
+        for station_id, q in fresh.station_index.items():
+            s = network.station_index[station_id]
+            assert sorted((network.route_ids[r], pos) for r, pos in network.routes_at(s)) == \
+                sorted((fresh.route_ids[r], pos) for r, pos in fresh.routes_at(q))
+
+    schedule = graph.get_schedule("M492")
+    slot = network.route_index["M492"]
+    version = graph.version
+    removed = graph.remove_route("M492")
+    assert removed is route and graph.version > version
+    # 编译网络就地更新（不重新编译），空间索引保留；M492的班次在连接数组中标记为已移除
+    assert network.revision == 1 and graph.spatial_index is spatial_index
+    assert network.removed_trips > 0 and network.route_trip_count[slot] == 0
+    # 名称索引就地移除该线路并更新沿线站点的热度，与重新建立的索引一致
+    assert graph.name_index is name_index and not name_index.search("M492", kind='route')
+    fresh_index = NameIndex.from_graph(graph)
+    assert sorted(name_index.entries()) == sorted(fresh_index.entries())
+    assert_same_network()
+    assert "M492" not in graph.routes and graph.get_schedule("M492") is None
+    for station_id in route.get_station_ids():
+        assert "M492" not in graph.station_routes.get(station_id, set())
+        assert "M492" not in graph.get_station(station_id).routes
+        assert all(edge[1] != "M492" for edge in graph.get_neighbors(station_id))
+
+    # 版本号变化后缓存的旧方案不再命中
+    plan = pathfinder.plan(from_id, to_id)
+    assert plan is None or all(seg['route'].route_id != "M492" for seg in plan.segments)
+    if plan:
+        print(f"\n✓ 移除M492后改为换乘{plan.transfer_count}次，{plan.total_time}分钟")
+    else:
+        print("\n✓ 移除M492后无可行方案")
+
+    # 网络更新后换乘模式过期：查询回退到RAPTOR，不在请求中重新预计算，而是在后台预计算
+    plan = pathfinder.find_path_patterns(from_id, to_id, depart_at=time(8, 0))
+    assert plan is None or all(seg['route'].route_id != "M492" for seg in plan.segments)
+    refreshed = pathfinder.refresh_transfer_patterns()
+    assert refreshed is not patterns and refreshed.revision == network.revision
+    assert pathfinder.transfer_patterns is refreshed
+    plan = pathfinder.find_path_patterns(from_id, to_id, depart_at=time(8, 0))
+    assert plan is None or all(seg['route'].route_id != "M492" for seg in plan.segments)
+
+    assert graph.replace_route(route, schedule) is None
+    assert graph.get_route("M492") is route and graph.get_schedule("M492") is schedule
+    assert graph.name_index is name_index and name_index.autocomplete("M49") == \
+        NameIndex.from_graph(graph).autocomplete("M49")
+    # 重新添加的线路沿用原来的编号
+    assert network.route_index["M492"] == slot and network.route_count == len(graph.routes)
+    assert_same_network()
+    plan = pathfinder.plan(from_id, to_id)
+    assert plan is not None and plan.segments[0]['route'].route_id == "M492"
+    plan = pathfinder.find_path_patterns(from_id, to_id, depart_at=time(8, 0))
+    assert plan is not None and plan.segments[0]['route'].route_id == "M492"
+
+    # 替换为截短的线路（绕行）：沿用原编号，各算法结果与重新编译的网络一致
+    detour = BusRoute.from_stops(route.route_id, route.route_name, route.station_ids[:-2], route.offsets[:-2],
+                                 price=route.price)
+    assert graph.replace_route(detour) is route
+    assert_same_network()
+    reference = load_nanshan_data()
+    reference.replace_route(detour)
+    for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'raptor', 'csa'):
+        for to in ("SZ_NS_006", "SZ_NS_010", to_id):
+            expected = PathFinder(reference).plan(from_id, to, algorithm, depart_at=time(8, 0))
+            actual = PathFinder(graph).plan(from_id, to, algorithm, depart_at=time(8, 0))
+            assert (actual is None) == (expected is None), (algorithm, to)
+            assert actual is None or actual.total_time == expected.total_time, (algorithm, to)
+    print("✓ 恢复M492后直达方案可用")
+
+
+def test_name_index(graph):
+    """测试名称索引"""
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试18：名称索引测试")
+    print("=" * 70)
+
+    # 子串搜索与逐个扫描的结果一致
+    for keyword in ["科技", "南山", "海", "大冲", "口"]:
+        expected = {s.station_id for s in graph.stations.values() if keyword in s.name}
+        assert {s.station_id for s in graph.find_station_by_name(keyword)} == expected
+
+    # 完全匹配排在前面
+    stations = graph.find_station_by_name("南山")
+    assert stations[0].name == "南山"
+
+    routes = graph.find_route_by_name("m492")
+    assert routes and routes[0].route_id == "M492"
+
+    suggestions = graph.name_index.autocomplete("海")
+    assert suggestions and all(graph.get_station(sid).name.startswith("海")
+                               for kind, sid, _ in suggestions if kind == 'station')
+    assert graph.name_index.autocomplete("M", kind='route', limit=2) == \
+        graph.name_index.autocomplete("m", kind='route', limit=2)
+    # limit=None返回全部补全结果
+    every = graph.name_index.autocomplete("m", kind='route', limit=None)
+    assert every[:2] == graph.name_index.autocomplete("m", kind='route', limit=2)
+    assert len(every) == len(graph.name_index.autocomplete("m", kind='route', limit=len(graph.routes)))
+    print(f"\n✓ 补全'海'：{[graph.get_station(sid).name for _, sid, _ in suggestions]}")
+
+
+def test_nearby(graph):
+    """测试附近站点查询"""
+    from src.planner.spatial import haversine_distance
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试19：附近站点测试")
+    print("=" * 70)
+
+    station = graph.get_station("SZ_NS_001")
+    lat, lon = station.latitude, station.longitude
+
+    for radius in [200, 1000, 3000]:
+        expected = {s.station_id for s in graph.stations.values()
+                    if haversine_distance(lat, lon, s.latitude, s.longitude) <= radius}
+        found = graph.nearby(lat, lon, radius)
+        assert {s.station_id for s, _ in found} == expected
+        assert [d for _, d in found] == sorted(d for _, d in found)
+
+    nearest = graph.nearest_stations(lat, lon, k=3)
+    assert nearest[0][0] is station and nearest[0][1] < 1
+    assert len(nearest) == 3
+
+    found = graph.nearby(lat, lon, 2000, limit=2)
+    assert len(found) <= 2 and all(d <= 2000 for _, d in found)
+    print(f"\n✓ {station.name}最近的站点：{[(s.name, round(d)) for s, d in nearest]}")
+
+
+def test_footpaths():
+    """测试步行换乘"""
+    from src.models import Station, BusRoute
+    from src.planner import TransitGraph
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试20：步行换乘测试")
+    print("=" * 70)
+
+    # 两条不相交的线路，B2与C1相距约100米，C1、C2、C3沿经度方向等距排列
+    graph = TransitGraph()
+    for station_id, lat, lon in [("A1", 22.50, 113.90), ("B2", 22.51, 113.92),
+                                 ("C1", 22.5109, 113.92), ("C2", 22.5118, 113.92),
+                                 ("C3", 22.5127, 113.92), ("D4", 22.53, 113.95)]:
+        graph.add_station(Station(station_id, station_id, lat, lon, "深圳市", "南山区"))
+    for route_id, stops in [("R1", ["A1", "B2"]), ("R2", ["C3", "D4"])]:
+        route = BusRoute(route_id, route_id)
+        for i, station_id in enumerate(stops):
+            route.add_station(station_id, i, i * 10)
+        graph.add_route(route)
+
+    pathfinder = PathFinder(graph)
+    assert pathfinder.find_path_bfs("A1", "D4") is None
+
+    graph.generate_footpaths(max_distance=250)
+    # C1→C3可以经C2连续步行，直接的步行边被约简掉
+    assert "C3" not in dict(graph.get_footpaths("C1"))
+    assert "C2" in dict(graph.get_footpaths("C1"))
+
+    for plan in (pathfinder.find_path_bfs("A1", "D4"), pathfinder.find_path_dijkstra("A1", "D4")):
+        assert plan is not None
+        modes = [seg['route'].route_id if seg['route'] else 'walk' for seg in plan.segments]
+        assert modes == ["R1", "walk", "R2"], modes
+        assert plan.segments[1]['from_station'].station_id == "B2"
+        assert plan.segments[1]['to_station'].station_id == "C3"
+        assert plan.transfer_count == 1 and plan.walking_time > 0
+
+    print(f"\n✓ A1→D4 步行{plan.walking_time}分钟换乘，总时间{plan.total_time}分钟")
+
+
+def test_compact_models():
+    """测试紧凑模型"""
+    from src.models import Station, BusRoute, Schedule
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试21：紧凑模型测试")
+    print("=" * 70)
+
+    route = BusRoute.from_stops("R1", "1路", ["A", "B", "D"], [0, 3, 9])
+    route.add_station("C", 1, 5)   # 乱序插入，排在相同顺序号之后
+    assert route.get_station_ids() == ["A", "B", "C", "D"]
+    assert [rs.sequence for rs in route.stations] == [0, 1, 1, 2]
+    assert route.stations[2].arrival_time_offset == 5
+    assert route.get_station_sequence("C") == 1 and route.get_station_sequence("X") is None
+    assert route.get_travel_time(0, 3) == 9
+
+    station = Station("A", "科技园")
+    station.add_route("R1")
+    station.add_route("R1")
+    assert station.routes == ("R1",) and station.has_route("R1")
+    # routes为只读视图，不能绕过add_route直接修改
+    assert not hasattr(station.routes, 'append')
+
+    # 使用__slots__，实例没有属性字典
+    for obj in (route, station, route.stations[0], Schedule("R1", time(6, 0), time(23, 0))):
+        assert not hasattr(obj, '__dict__')
+    print("\n✓ 站序按列存储，模型均使用__slots__")
+
+
+def test_depart_at():
+    """测试按出发时间规划"""
+    from src.models import Station, BusRoute, Schedule
+    from src.planner import TransitGraph
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试22：出发时间测试")
+    print("=" * 70)
+
+    # R1：A→B→C，每20分钟一班；R2：C→D，每15分钟一班
+    graph = TransitGraph()
+    for station_id in "ABCD":
+        graph.add_station(Station(station_id, station_id))
+    graph.add_route(BusRoute.from_stops("R1", "R1", ["A", "B", "C"], [0, 5, 10]),
+                    Schedule("R1", time(6, 0), time(22, 0), 20))
+    graph.add_route(BusRoute.from_stops("R2", "R2", ["C", "D"], [0, 6]),
+                    Schedule("R2", time(6, 0), time(22, 0), 15))
+    pathfinder = PathFinder(graph)
+
+    # 等待时间按上车站（B站偏移5分钟）的发车时刻计算，而不是按首站
+    plan = pathfinder.find_direct_route("B", "C", depart_at=time(6, 7))
+    assert plan.segments[0]['waiting_time'] == 18 and plan.total_time == 23
+
+    # 6:00出发：6:10到C，换乘时间后赶上6:15的R2，6:21到D；晚1分钟出发要等下一班
+    for depart_at, expected in [(time(6, 0), 21), (time(6, 1), 50)]:
+        for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'raptor'):
+            plan = pathfinder.plan("A", "D", algorithm, depart_at=depart_at)
+            assert plan.total_time == expected, (algorithm, depart_at, plan.total_time)
+        print(f"\n✓ {depart_at.strftime('%H:%M')} 出发：各算法总时间均为{expected}分钟")
+
+    # 末班车之后，各算法都不再乘坐已停止发车的线路
+    assert pathfinder.find_direct_route("B", "C", depart_at=time(23, 0)) is None
+    for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'raptor', 'csa'):
+        assert pathfinder.plan("A", "D", algorithm, depart_at=time(23, 0)) is None, algorithm
+
+    # 南山数据：B737末班车22:15已过，22:50出发只能乘72路
+    nanshan = PathFinder(load_nanshan_data())
+    for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'raptor', 'csa'):
+        plan = nanshan.plan("SZ_NS_016", "SZ_NS_017", algorithm, depart_at=time(22, 50))
+        assert [seg['route'].route_id for seg in plan.segments] == ["72"] and plan.total_time == 7, algorithm
+    print("\n✓ 末班车之后不再推荐已停止发车的线路")
+
+
+def test_service_calendars():
+    """测试服务日历"""
+    import os
+    import tempfile
+    from datetime import date
+    from src.models import Station, BusRoute, Schedule, ServiceCalendar, WEEKDAYS, WEEKENDS
+    from src.planner import TransitGraph
+    from src.data import save_snapshot, load_snapshot
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试23：服务日历测试")
+    print("=" * 70)
+
+    monday, saturday, holiday = date(2024, 6, 3), date(2024, 6, 8), date(2024, 6, 10)
+    weekdays = ServiceCalendar("WK", monday, date(2024, 6, 30), WEEKDAYS)
+    weekdays.remove_date(holiday)
+    assert weekdays.runs_on(monday) and not weekdays.runs_on(saturday) and not weekdays.runs_on(holiday)
+    assert len(weekdays) == 19 and weekdays.end_date == date(2024, 6, 28)
+
+    graph = TransitGraph()
+    for station_id in "ABC":
+        graph.add_station(Station(station_id, station_id))
+    graph.add_route(BusRoute.from_stops("R1", "R1", ["A", "B", "C"], [0, 5, 10]))
+    graph.add_calendar(weekdays)
+    graph.add_calendar(ServiceCalendar("WE", monday, date(2024, 6, 30), WEEKENDS))
+    # 工作日早高峰5分钟一班、平峰15分钟一班；周末30分钟一班
+    graph.add_schedule(Schedule.from_periods("R1", [(7 * 60, 9 * 60, 5), (9 * 60, 20 * 60, 15)], "WK"))
+    graph.add_schedule(Schedule("R1", time(8, 0), time(20, 0), 30, "WE"))
+
+    # 运营服务相同的日期共用同一网络
+    assert graph.compile(monday) is graph.compile(date(2024, 6, 4))
+    assert graph.compile(monday) is not graph.compile(saturday)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar.snapshot")
+        save_snapshot(graph, path)
+        loaded = load_snapshot(path)
+        for g in (graph, loaded):
+            pathfinder = PathFinder(g)
+            for service_date, depart_at, expected in [(monday, time(7, 2), 13), (monday, time(9, 2), 23),
+                                                      (saturday, time(9, 2), 38)]:
+                for algorithm in ('dijkstra', 'bidirectional', 'raptor', 'csa'):
+                    plan = pathfinder.plan("A", "C", algorithm, depart_at=depart_at, service_date=service_date)
+                    assert plan.total_time == expected, (algorithm, service_date, plan.total_time)
+            # 节假日停运
+            assert pathfinder.find_path_raptor("A", "C", depart_at=time(9, 2), service_date=holiday) is None
+            assert pathfinder.find_path_dijkstra("A", "C", depart_at=time(9, 2), service_date=holiday) is None
+
+    print(f"\n✓ {weekdays}，工作日高峰/平峰与周末时刻表按日期生效")
+
+
+def test_travel_time_profiles():
+    """测试分时段行驶时间"""
+    import os
+    import tempfile
+    from src.models import Station, BusRoute, Schedule, TravelTimeProfile
+    from src.planner import TransitGraph
+    from src.data import save_snapshot, load_snapshot
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试24：分时段行驶时间测试")
+    print("=" * 70)
+
+    # A→B路段平峰10分钟，8:00-9:00高峰20分钟，前后30分钟线性过渡；R1、R2共用这段路
+    profile = TravelTimeProfile.peak(10, [(8 * 60, 9 * 60, 2.0)])
+    assert [profile.evaluate(t) for t in (420, 465, 510, 600)] == [10, 15, 20, 10]
+
+    # 晚出发早到达的曲线会破坏最早到达搜索，构建时拒绝
+    try:
+        TravelTimeProfile([(0, 20), (5, 10)])
+        assert False, "应拒绝斜率小于-1的曲线"
+    except ValueError:
+        pass
+
+    graph = TransitGraph()
+    for station_id in "ABCD":
+        graph.add_station(Station(station_id, station_id))
+    r1 = BusRoute.from_stops("R1", "R1", ["A", "B", "C"], [0, 10, 15])
+    r2 = BusRoute.from_stops("R2", "R2", ["A", "B", "D"], [0, 10, 18])
+    r1.set_travel_profile(0, profile)
+    r2.set_travel_profile(0, TravelTimeProfile(profile.key))
+    graph.add_route(r1, Schedule("R1", time(6, 0), time(22, 0), 10))
+    graph.add_route(r2, Schedule("R2", time(6, 0), time(22, 0), 15))
+    assert r1.get_travel_time(0, 2, depart=510) == 25 and r1.get_travel_time(0, 2) == 15
+
+    # 相同的曲线在编译网络中只存一份
+    net = graph.compile()
+    assert len(net.profile_start) - 1 == 1 and len(net.profiled_routes) == 2
+
+    # A→C按上车时刻求值；B→D的R2班次在B站的时刻随高峰推迟：
+    # 8:30从A发车的班次8:50到B（而不是8:40），8:40在B等到8:50，8:58到D
+    cases = [("A", "C", time(6, 0), 15), ("A", "C", time(7, 40), 18), ("A", "C", time(8, 30), 25),
+             ("B", "D", time(8, 40), 18)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profile.snapshot")
+        save_snapshot(graph, path)
+        loaded = load_snapshot(path)
+        assert loaded.get_route("R1").get_travel_profile(0) is loaded.get_route("R2").get_travel_profile(0)
+        for g in (graph, loaded):
+            pathfinder = PathFinder(g)
+            for from_id, to_id, depart_at, expected in cases:
+                for algorithm in ('bfs', 'dijkstra', 'bidirectional', 'raptor', 'csa'):
+                    plan = pathfinder.plan(from_id, to_id, algorithm, depart_at=depart_at)
+                    assert plan.total_time == expected, (algorithm, from_id, to_id, depart_at, plan.total_time)
+
+    print(f"\n✓ {profile}，共用曲线的线路在高峰按实际到站时刻计算行驶时间")
+
+
+def test_planner_metrics(graph):
+    """测试规划指标"""
+    from src.planner import PlannerMetrics
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试25：规划指标测试")
+    print("=" * 70)
+
+    metrics = PlannerMetrics()
+    pathfinder = PathFinder(graph, metrics=metrics)
+    for algorithm in ('bfs', 'dijkstra', 'raptor'):
+        pathfinder.plan("SZ_NS_008", "SZ_NS_006", algorithm, depart_at=time(8, 0))
+
+    text = metrics.render()
+    for stage, algorithm in [('direct', 'dijkstra'), ('search', 'dijkstra'), ('build', 'dijkstra'),
+                             ('search', 'raptor'), ('build', 'raptor')]:
+        assert f'bus_plan_stage_seconds_count{{stage="{stage}",algorithm="{algorithm}"}} 1' in text, (stage, algorithm)
+    pushed = metrics.labels_pushed.series[('dijkstra',)]
+    popped = metrics.labels_popped.series[('dijkstra',)]
+    assert pushed >= popped > 0
+    assert 'bus_plan_result_size_bucket{algorithm="raptor",le="+Inf"} 1' in text
+
+    # 工作进程取出增量后清空，主进程合并后与原来一致
+    merged = PlannerMetrics()
+    merged.merge(metrics.collect())
+    assert merged.render() == text and metrics.labels_pushed.series == {}
+
+    print(f"\n✓ Dijkstra标签入队{pushed:g}次、出队{popped:g}次，各阶段耗时已记录")
+
+
+def test_search_budget(graph):
+    """测试搜索预算"""
+    from src.planner import SearchBudget
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试26：搜索预算测试")
+    print("=" * 70)
+
+    pathfinder = PathFinder(graph)
+    for algorithm in ('bfs', 'dijkstra'):
+        full = pathfinder.plan("SZ_NS_008", "SZ_NS_006", algorithm, depart_at=time(8, 0))
+        assert full and not full.budget_exhausted
+
+        # 预算充足时结果不变
+        budget = SearchBudget(timeout_ms=5000, max_settled=10000, max_queue=10000)
+        plan = pathfinder.plan("SZ_NS_008", "SZ_NS_006", algorithm, depart_at=time(8, 0), budget=budget)
+        assert budget.exhausted is None and plan.total_time == full.total_time
+
+        # 预算耗尽前尚未到达终点
+        for budget, reason in [(SearchBudget(max_settled=2), 'settled'), (SearchBudget(max_queue=1), 'queue'),
+                               (SearchBudget(timeout_ms=0), 'deadline')]:
+            assert pathfinder.plan("SZ_NS_008", "SZ_NS_006", algorithm, depart_at=time(8, 0),
+                                   budget=budget) is None
+            assert budget.exhausted == reason, (algorithm, budget)
+
+    # 预算耗尽时返回已入队的到达终点的方案，并且不写入缓存
+    pathfinder = PathFinder(graph, PlanCache())
+    budget = SearchBudget(max_settled=8)
+    partial = pathfinder.plan("SZ_NS_008", "SZ_NS_006", 'dijkstra', depart_at=time(8, 0), budget=budget)
+    assert budget.exhausted == 'settled' and partial.budget_exhausted and partial.total_time == full.total_time
+    assert not pathfinder.plan("SZ_NS_008", "SZ_NS_006", 'dijkstra', depart_at=time(8, 0)).budget_exhausted
+
+    # 缓存中的完整方案直接返回，不受预算限制
+    budget = SearchBudget(max_settled=0)
+    assert not pathfinder.plan("SZ_NS_008", "SZ_NS_006", 'dijkstra', depart_at=time(8, 0),
+                               budget=budget).budget_exhausted
+
+    # 绝对截止时间（如请求到达时算出的）已过时，搜索立即结束
+    from time import monotonic
+    budget = SearchBudget(deadline=monotonic())
+    assert PathFinder(graph).plan("SZ_NS_008", "SZ_NS_006", 'dijkstra', depart_at=time(8, 0),
+                                  budget=budget) is None
+    assert budget.exhausted == 'deadline'
+    deadline = monotonic() + 60
+    assert SearchBudget(timeout_ms=1000, deadline=deadline).deadline < deadline
+    assert SearchBudget(timeout_ms=120000, deadline=deadline).deadline == deadline
+
+    print(f"\n✓ 预算耗尽时提前结束，返回已找到的{partial.total_time}分钟方案")
+
+
+def get_api_server():
+    """导入API服务模块（不预计算换乘模式），用于测试客户端"""
+    import os
+    os.environ.setdefault('API_TRANSFER_PATTERNS', 'false')
+    import api_server
+    return api_server
+
+
+def test_api_budget():
+    """测试API的请求截止时间与搜索预算"""
+    import json
+    from time import monotonic
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试28：API搜索预算测试")
+    print("=" * 70)
+
+    api = get_api_server()
+    client = api.app.test_client()
+    url = '/api/plan?from=SZ_NS_008&to=SZ_NS_006&algorithm=dijkstra&depart=08:00'
+
+    # 截止时间从请求到达时起算，timeout_ms不超过REQUEST_TIMEOUT
+    arrival = monotonic()
+    assert api.request_deadline(arrival, 500) == arrival + 0.5
+    assert api.request_deadline(arrival) == arrival + api.REQUEST_TIMEOUT
+    assert api.request_deadline(arrival, 10 ** 9) == arrival + api.REQUEST_TIMEOUT
+    # 搜索预算比请求截止时间提前结束，为构建和序列化预算耗尽时的方案留出时间
+    assert arrival < api.search_deadline(arrival, 500) < api.request_deadline(arrival, 500)
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.get_json()['budget_exhausted'] is False
+
+    max_settled = api.SEARCH_MAX_SETTLED
+    try:
+        # 预算耗尽前已找到方案：返回方案并标记budget_exhausted
+        api.pathfinder.cache.clear()
+        api.SEARCH_MAX_SETTLED = 8
+        response = client.get(url)
+        assert response.status_code == 200 and response.get_json()['budget_exhausted'] is True
+
+        # 预算耗尽时仍未找到方案：返回504
+        api.pathfinder.cache.clear()
+        api.SEARCH_MAX_SETTLED = 2
+        response = client.get(url)
+        assert response.status_code == 504 and response.get_json()['budget_exhausted'] is True
+    finally:
+        api.SEARCH_MAX_SETTLED = max_settled
+
+    # 截止时间已过（如在进程池中排队过久）的任务不再搜索
+    api.pathfinder.cache.clear()
+    body, status = api.compute_plan("SZ_NS_008", "SZ_NS_006", 'dijkstra', time(8, 0),
+                                    datetime.now().date(), monotonic())
+    assert status == 504 and json.loads(body)['budget_exhausted'] is True
+
+    print(f"\n✓ 预算耗尽时标记budget_exhausted，无方案时返回504")
+
+
+def planner_process_id():
+    """规划任务：返回执行任务的进程ID（用于检查任务是否提交到了规划进程池）"""
+    import os
+    return str(os.getpid()).encode(), 200
+
+
+def planner_sleep(seconds):
+    """规划任务：等待指定秒数（用于检查超时）"""
+    import time as clock
+    clock.sleep(seconds)
+    return b'{}', 200
+
+
+def test_api_matrix():
+    """测试API出行矩阵的进程池调度与截止时间"""
+    import json
+    import multiprocessing
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from time import monotonic
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试29：API出行矩阵测试")
+    print("=" * 70)
+
+    api = get_api_server()
+    client = api.app.test_client()
+    origins = ["SZ_NS_001", "SZ_NS_019", "SZ_NS_021"]
+    destinations = ["SZ_NS_006", "SZ_NS_010", "SZ_NS_018"]
+    url = f"/api/matrix?origins={','.join(origins)}&destinations={','.join(destinations)}&depart=08:00"
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {'origins': origins, 'destinations': destinations}
+    expected = api.pathfinder.matrix(origins, destinations, time(8, 0))
+    assert [line['origin'] for line in lines[1:]] == origins
+    assert sum((line['total_time'] for line in lines[1:]), []) == expected['total_time'].tolist()
+
+    # 同步模式下超过截止时间返回504
+    body, status = api.compute_matrix(origins, destinations, time(8, 0), datetime.now().date(), 1, monotonic(), 0.5)
+    assert status == 504 and json.loads(body)['success'] is False and '0.5秒' in json.loads(body)['error']
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print("\n✓ 同步模式出行矩阵正确（当前平台不支持fork，跳过进程池测试）")
+        return
+
+    planner_pool, request_timeout = api.planner_pool, api.REQUEST_TIMEOUT
+    api.planner_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork'))
+    try:
+        # 异步模式下任务在规划进程中执行
+        with api.app.app_context():
+            worker_pid = int(api.run_planner(planner_process_id).get_data())
+        assert worker_pid != os.getpid()
+
+        # 超时提示中是实际生效的时间预算（timeout_ms小于REQUEST_TIMEOUT时）
+        with api.app.app_context():
+            response, status = api.run_planner(planner_sleep, 1, deadline=monotonic() + 0.05, timeout=0.05)
+        assert status == 504 and '0.05秒' in response.get_json()['error']
+
+        response = client.get(url)
+        assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+        assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == lines
+
+        # 超过请求截止时间返回504
+        api.REQUEST_TIMEOUT = 0
+        response = client.get(url)
+        assert response.status_code == 504 and response.get_json()['success'] is False
+    finally:
+        api.planner_pool.shutdown(cancel_futures=True)
+        api.planner_pool, api.REQUEST_TIMEOUT = planner_pool, request_timeout
+
+    print(f"\n✓ 出行矩阵在规划进程{worker_pid}中计算，超时返回504")
+
+
+def test_api_catalogue_cache():
+    """测试目录接口的ETag、条件请求、gzip压缩和网络更新后失效"""
+    import copy
+    import gzip
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试30：API目录缓存测试")
+    print("=" * 70)
+
+    api = get_api_server()
+    client = api.app.test_client()
+    route_id = next(iter(api.graph.routes))
+    urls = ['/api/stations', '/api/routes', f'/api/route/{route_id}']
+
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200 and response.get_json()['success']
+        etag, weak = response.get_etag()
+        assert etag and weak and response.headers['Cache-Control'] == 'no-cache'
+        assert 'Content-Encoding' not in response.headers
+        etags[url] = etag
+
+        # If-None-Match命中时返回空的304
+        cached = client.get(url, headers={'If-None-Match': f'W/"{etag}"'})
+        assert cached.status_code == 304 and cached.get_data() == b''
+        assert client.get(url, headers={'If-None-Match': 'W/"stale"'}).status_code == 200
+
+        # 接受gzip时返回压缩的响应体，解压后与原始响应体一致，ETag相同
+        compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert compressed.headers['Content-Encoding'] == 'gzip' and compressed.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(compressed.get_data()) == response.get_data()
+        assert compressed.get_etag() == (etag, True)
+
+    # 网络更新（版本号变化）后重新构建响应，旧ETag不再命中
+    original = api.graph.get_route(route_id)
+    version = api.graph.version
+    updated = copy.copy(original)
+    updated.price = original.price + 1
+    api.graph.replace_route(updated)
+    try:
+        assert api.graph.version != version
+        for url in urls:
+            response = client.get(url, headers={'If-None-Match': f'W/"{etags[url]}"'})
+            assert response.status_code == 200 and response.get_etag()[0] != etags[url], url
+        assert client.get(f'/api/route/{route_id}').get_json()['route']['price'] == updated.price
+    finally:
+        api.graph.replace_route(original)
+
+    print(f"\n✓ {len(urls)}个目录接口的ETag、304、gzip正确，网络更新后缓存失效")
+
+
+def test_api_catalogue_pages():
+    """测试目录接口的游标分页、字段投影和NDJSON输出"""
+    import json
+    from api_server import encode_cursor
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试31：API目录分页测试")
+    print("=" * 70)
+
+    api = get_api_server()
+    client = api.app.test_client()
+    station_ids = list(api.graph.stations)
+
+    # 按游标逐页遍历，拼接结果与完整目录一致，最后一页没有下一页游标
+    seen, cursor, pages = [], None, 0
+    while True:
+        url = '/api/stations?limit=5' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        assert page['success'] and page['total'] == len(station_ids) and page['count'] == len(page['stations'])
+        seen.extend(item['id'] for item in page['stations'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+        assert page['count'] == 5
+    assert seen == station_ids and pages == (len(station_ids) + 4) // 5
+
+    # 边界：恰好一页、超过总数、从最后一项之后开始
+    assert client.get(f'/api/stations?limit={len(station_ids)}').get_json()['next_cursor'] is None
+    assert client.get(f'/api/stations?limit={len(station_ids) + 10}').get_json()['count'] == len(station_ids)
+    page = client.get(f'/api/stations?limit=5&cursor={encode_cursor(station_ids[-1])}').get_json()
+    assert page['count'] == 0 and page['next_cursor'] is None
+    page = client.get(f'/api/stations?limit=1&cursor={encode_cursor(station_ids[0])}').get_json()
+    assert [item['id'] for item in page['stations']] == [station_ids[1]]
+
+    # 无效参数返回400
+    for query in ['limit=0', 'limit=-1', 'limit=abc', 'cursor=!!!', f'cursor={encode_cursor("NO_SUCH_STATION")}',
+                  'fields=id,bogus', 'format=xml']:
+        response = client.get(f'/api/stations?{query}')
+        assert response.status_code == 400 and response.get_json()['success'] is False, query
+
+    # 字段投影只返回请求的字段
+    page = client.get('/api/stations?limit=3&fields=id,name').get_json()
+    assert all(set(item) == {'id', 'name'} for item in page['stations'])
+    routes = client.get('/api/routes?fields=id,first_bus').get_json()
+    assert routes['count'] == len(api.graph.routes)
+    assert all(set(item) == {'id', 'first_bus'} for item in routes['routes'])
+
+    # NDJSON每行一个条目，下一页游标在响应头中
+    response = client.get('/api/stations?limit=3&format=ndjson&fields=id')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == [{'id': station_id} for station_id in station_ids[:3]]
+    assert response.headers['X-Next-Cursor'] == encode_cursor(station_ids[2])
+    response = client.get('/api/stations?format=ndjson')
+    assert len(response.get_data(as_text=True).splitlines()) == len(station_ids)
+    assert 'X-Next-Cursor' not in response.headers
+
+    print(f"\n✓ {len(station_ids)}个站点按每页5个分{pages}页遍历，字段投影与NDJSON输出正确")
+
+
+def test_label_store(graph):
+    """测试标签存储"""
+    from src.planner.labels import LabelStore, NO_PARENT
+    from src.planner.network import WALK
+
+    print("\n" + "=" * 70)
+    print(" " * 20 + "测试27：标签存储测试")
+    print("=" * 70)
+
+    def build_plan_from_path(path):
+        """原来按路径列表 [(站点ID, 线路ID, 行驶时间, 等待时间)] 构建方案的方法"""
+        plan = TransferPlan()
+        segments = [[path[0]]]
+        for item in path[1:]:
+            if item[1] == segments[-1][-1][1]:
+                segments[-1].append(item)
+            else:
+                segments.append([item])
+        for segment in segments:
+            if len(segment) < 2:
+                continue
+            plan.add_segment(graph.get_route(segment[0][1]), graph.get_station(segment[0][0]),
+                             graph.get_station(segment[-1][0]), sum(item[2] for item in segment[1:]),
+                             segment[0][3])
+        return plan
+
+    def summary(plan):
+        return [(seg['route'].route_id, seg['from_station'].station_id, seg['to_station'].station_id,
+                 seg['travel_time'], seg['waiting_time']) for seg in plan.segments]
+
+    pathfinder = PathFinder(graph)
+    net = graph.compile()
+    checked = 0
+    for _, _, from_id, to_id, _ in get_test_cases():
+        expected = pathfinder.find_path_raptor(from_id, to_id, depart_at=time(8, 0))
+        if not expected or any(seg['route'] is None for seg in expected.segments):
+            continue
+
+        # 容量为1，逐站添加标签时数组反复扩容；每个标签另加一个兄弟标签，前驱编号不连续
+        labels = LabelStore(capacity=1)
+        path = []
+        label = NO_PARENT
+        for seg in expected.segments:
+            route = seg['route']
+            r = net.route_index[route.route_id]
+            board_pos = route.station_ids.index(seg['from_station'].station_id)
+            alight_pos = route.station_ids.index(seg['to_station'].station_id, board_pos)
+            for pos in range(board_pos, alight_pos + 1):
+                station_id = route.station_ids[pos]
+                travel_time = route.offsets[pos] - route.offsets[pos - 1] if pos > board_pos else 0
+                waiting_time = seg['waiting_time'] if pos == board_pos else 0
+                labels.add(net.station_index[station_id], WALK, 0, 0, label)
+                label = labels.add(net.station_index[station_id], r, travel_time, waiting_time, label)
+                path.append((station_id, route.route_id, travel_time, waiting_time))
+
+        assert labels.capacity > 1 and len(labels) == 2 * len(path)
+        assert [labels.get(item)[2:] for item in labels.unwind(label)] == [item[2:] for item in path]
+        assert summary(pathfinder._build_plan_from_labels(labels, label)) == \
+            summary(build_plan_from_path(path)) == summary(expected)
+        checked += 1
+
+    assert checked >= 5
+    print(f"\n✓ {checked}组起终点的标签回溯结果与原路径构建一致")
+
+
 def test_station_search(graph):
     """测试站点搜索"""
     print("\n" + "=" * 70)
@@ -212,6 +1398,81 @@ def run_all_tests():
         # 测试6：时刻表功能
         test_schedule(graph)
 
+        # 测试7：RAPTOR
+        test_raptor_routes(graph)
+
+        # 测试8：CSA
+        test_csa_routes(graph)
+
+        # 测试9：Pareto
+        test_pareto_routes(graph)
+
+        # 测试10：换乘模式
+        test_transfer_patterns(graph)
+
+        # 测试11：等时圈
+        test_isochrone(graph)
+
+        # 测试12：出行矩阵
+        test_matrix(graph)
+
+        # 测试13：方案缓存
+        test_plan_cache()
+
+        # 测试14：双向搜索
+        test_bidirectional_routes(graph)
+
+        # 测试15：GTFS导入
+        test_gtfs_import()
+
+        # 测试16：网络快照
+        test_snapshot(graph)
+
+        # 测试17：线路更新
+        test_route_update()
+
+        # 测试18：名称索引
+        test_name_index(graph)
+
+        # 测试19：附近站点
+        test_nearby(graph)
+
+        # 测试20：步行换乘
+        test_footpaths()
+
+        # 测试21：紧凑模型
+        test_compact_models()
+
+        # 测试22：出发时间
+        test_depart_at()
+
+        # 测试23：服务日历
+        test_service_calendars()
+
+        # 测试24：分时段行驶时间
+        test_travel_time_profiles()
+
+        # 测试25：规划指标
+        test_planner_metrics(graph)
+
+        # 测试26：搜索预算
+        test_search_budget(graph)
+
+        # 测试27：标签存储
+        test_label_store(graph)
+
+        # 测试28：API搜索预算
+        test_api_budget()
+
+        # 测试29：API出行矩阵
+        test_api_matrix()
+
+        # 测试30：API目录缓存
+        test_api_catalogue_cache()
+
+        # 测试31：API目录分页
+        test_api_catalogue_pages()
+
         # 测试总结
         print("\n" + "=" * 70)
         print(" " * 25 + "测试完成")
@@ -224,6 +1485,31 @@ def run_all_tests():
         print("  4. 最短时间路线（Dijkstra）：通过")
         print("  5. 站点搜索：通过")
         print("  6. 时刻表功能：通过")
+        print("  7. RAPTOR路线：通过")
+        print("  8. CSA路线：通过")
+        print("  9. Pareto方案：通过")
+        print("  10. 换乘模式：通过")
+        print("  11. 等时圈：通过")
+        print("  12. 出行矩阵：通过")
+        print("  13. 方案缓存：通过")
+        print("  14. 双向搜索：通过")
+        print("  15. GTFS导入：通过")
+        print("  16. 网络快照：通过")
+        print("  17. 线路更新：通过")
+        print("  18. 名称索引：通过")
+        print("  19. 附近站点：通过")
+        print("  20. 步行换乘：通过")
+        print("  21. 紧凑模型：通过")
+        print("  22. 出发时间：通过")
+        print("  23. 服务日历：通过")
+        print("  24. 分时段行驶时间：通过")
+        print("  25. 规划指标：通过")
+        print("  26. 搜索预算：通过")
+        print("  27. 标签存储：通过")
+        print("  28. API搜索预算：通过")
+        print("  29. API出行矩阵：通过")
+        print("  30. API目录缓存：通过")
+        print("  31. API目录分页：通过")
         print("=" * 70)
 
         return True